@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Headless publish of the Maya work files of a whole sequence.
+
+Registers batch_publish in a Sequence context, to run from the tank
+command, e.g. overnight:
+
+    tank Sequence SQ010 batch_publish
+
+The work is done by hooks/iksvy_lib/batch_publish.py in a pool of mayapy
+workers, with the same publish hooks as the Publish dialog in Maya.
+"""
+
+import sys
+
+from tank.platform import Application
+
+
+class BatchPublish(Application):
+    """
+    Publish the latest Maya work file of every shot/step of the sequence.
+    """
+
+    def init_app(self):
+        entity = self.context.entity
+        if entity is None or entity["type"] != "Sequence":
+            self.log_debug("Batch publish needs a Sequence context, not registering it")
+            return
+
+        self.engine.register_command("batch_publish", self.batch_publish, {
+            "short_name": "batch_publish",
+            "title": "Batch Publish Sequence",
+            "description": "Publishes the cameras, Alembic caches and renders of the latest "
+                           "Maya work file of every shot and step of the sequence.",
+        })
+
+    def batch_publish(self):
+        """
+        Publish the sequence of the context and log where the report went.
+
+        :returns: Path of the report, None if the publish couldn't start
+        """
+        # the shared iksvy code lives with the hooks of the config
+        hooks_folder = self.sgtk.pipeline_configuration.get_hooks_location()
+        if hooks_folder not in sys.path:
+            sys.path.append(hooks_folder)
+        from iksvy_lib import batch_publish
+
+        try:
+            return batch_publish.batch_publish(
+                self.sgtk, self.context.entity["name"],
+                mayapy=self.get_setting("mayapy") or None,
+                workers=self.get_setting("workers") or None,
+                outputs=self.get_setting("outputs"),
+                comment=self.get_setting("comment"),
+                render=self.get_setting("render"),
+                republish=self.get_setting("republish"),
+                report_folder=self.get_setting("report_folder") or None,
+                log=self.log_info)
+        except ValueError as e:
+            self.log_error("Batch publish of %s failed: %s" % (self.context.entity["name"], e))
+            return None
@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Stand-in that defers importing and initializing an app until it is used.
+
+An app instance whose location points here, with the real location in
+lazy_location, only registers its menu commands as stubs when the engine
+starts. The first time one of them runs, the real app is imported,
+validated and initialized with the rest of the settings of the instance,
+the way the engine would have done at startup, and the command is run.
+
+The commands the app really registers are remembered in ~/.iksvy, so from
+then on the stubs match them even if lazy_commands is out of date.
+
+Loading an app after the engine has started goes through the same core
+functions the engine uses (tk-core v0.17: Engine.__load_apps), including a
+couple of private engine attributes, which is why it all lives here.
+
+No app of the shipped environments is lazy: it is opt in, per app
+instance, by moving its location to lazy_location and pointing location
+here. Because of the private attributes, measure what it saves with
+benchmarks/bench_engine_startup.py before turning it on for an
+environment, and check it again when tk-core is updated.
+"""
+
+import os
+import json
+import time
+
+from tank.platform import Application
+from tank.platform import application
+from tank.platform import framework
+from tank.platform import validation
+from tank.deploy import descriptor as deploy_descriptor
+
+# set to 1 to load every lazy app at engine start, as if they weren't lazy
+EAGER_ENV = "IKSVY_EAGER_APPS"
+
+# settings of this app, the rest are the settings of the app it stands in for
+_LAZY_SETTINGS = ("lazy_location", "lazy_commands")
+
+# register_command properties that can be remembered between sessions
+_JSON_TYPES = (str, unicode, int, float, bool, list, type(None))
+
+
+class LazyApp(Application):
+    """
+    Menu stubs for an app, which is loaded the first time it is used.
+    """
+
+    # the app once loaded
+    _app = None
+
+    # name of the app for the menus, before it is loaded
+    _display_name = None
+
+    def init_app(self):
+        """
+        Register the menu stubs, or load the app right away when it has to
+        run at startup or there is nothing to stub.
+        """
+        self._cache_path = os.path.join(os.path.expanduser("~"), ".iksvy", "lazy_commands.json")
+        cached = self._read_cache().get(self._cache_key(), {})
+        self._display_name = cached.get("display_name") or self.get_setting("lazy_location").get("name")
+
+        commands = cached.get("commands") or self.get_setting("lazy_commands")
+        if (os.environ.get(EAGER_ENV) == "1" or not commands or
+                self._app_settings().get("launch_at_startup")):
+            self.load()
+            return
+
+        for command in commands:
+            self.engine.register_command(
+                command["name"], self._make_stub(command["name"]), dict(command.get("properties") or {}))
+
+    def destroy_app(self):
+        # a loaded app normally replaces this one in the engine, which then
+        # destroys it itself
+        if self._app is not None and self.engine.apps.get(self.instance_name) is not self._app:
+            self._app.destroy_app()
+
+    @property
+    def display_name(self):
+        # the menus group the commands by the name of their app
+        return self._display_name or Application.display_name.fget(self)
+
+    def __getattr__(self, name):
+        # other apps and hooks reaching for the app through engine.apps
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.load(), name)
+
+    def load(self):
+        """
+        Import and initialize the app this instance stands in for, once.
+
+        :returns: The app
+        """
+        if self._app is not None:
+            return self._app
+
+        engine = self.engine
+        env = engine.get_env()
+        location = self.get_setting("lazy_location")
+        settings = self._app_settings()
+        start = time.time()
+
+        descriptor = deploy_descriptor.get_from_location(
+            deploy_descriptor.AppDescriptor.APP, self.sgtk.pipeline_configuration, location)
+        if not descriptor.exists_local():
+            # tank cache_apps doesn't know about the apps behind this one
+            descriptor.download_local()
+
+        # the checks and steps the engine goes through for every app at startup
+        validation.validate_context(descriptor, self.context)
+        validation.validate_platform(descriptor)
+        validation.validate_settings(self.instance_name, self.sgtk, self.context,
+                                     descriptor.get_configuration_schema(), settings)
+        app = application.get_application(
+            engine, descriptor.get_path(), descriptor, settings, self.instance_name, env)
+        framework.setup_frameworks(engine, app, env, descriptor)
+
+        # commands registered while the app initializes belong to it
+        initializing = engine._Engine__currently_initializing_app
+        engine._Engine__currently_initializing_app = app
+        try:
+            app.init_app()
+        finally:
+            engine._Engine__currently_initializing_app = initializing
+        engine._Engine__applications[self.instance_name] = app
+        self._app = app
+
+        self._remember_commands(app)
+        engine.log_debug("Lazy app %s (%s) loaded in %.2fs" % (
+            self.instance_name, location.get("name"), time.time() - start))
+        return app
+
+    def _app_settings(self):
+        return dict((key, value) for key, value in self.settings.items()
+                    if key not in _LAZY_SETTINGS)
+
+    def _make_stub(self, name):
+        def stub(*args, **kwargs):
+            return self._run(name, *args, **kwargs)
+        return stub
+
+    def _run(self, name, *args, **kwargs):
+        """
+        Load the app and run its command, from a menu stub.
+        """
+        app = self.load()
+        command = self.engine.commands.get(name)
+        if command is None or command["properties"].get("app") is not app:
+            # the app calls the command something else: fine if it only has one
+            commands = [c for c in self.engine.commands.values() if c["properties"].get("app") is app]
+            if len(commands) != 1:
+                self.log_warning("%s has no command '%s'" % (self.instance_name, name))
+                return None
+            command = commands[0]
+        return command["callback"](*args, **kwargs)
+
+    def _cache_key(self):
+        location = self.get_setting("lazy_location")
+        return "%s/%s/%s %s" % (self.engine.name, self.instance_name,
+                                location.get("name"), location.get("version"))
+
+    def _read_cache(self):
+        try:
+            with open(self._cache_path) as fh:
+                return json.load(fh)
+        except (IOError, OSError, ValueError):
+            return {}
+
+    def _remember_commands(self, app):
+        commands = []
+        for name, command in sorted(self.engine.commands.items()):
+            if command["properties"].get("app") is not app:
+                continue
+            properties = dict((key, value) for key, value in command["properties"].items()
+                              if key != "app" and isinstance(value, _JSON_TYPES))
+            commands.append({"name": name, "properties": properties})
+
+        cache = self._read_cache()
+        cache[self._cache_key()] = {"display_name": app.display_name, "commands": commands}
+        try:
+            folder = os.path.dirname(self._cache_path)
+            if not os.path.isdir(folder):
+                os.makedirs(folder)
+            # write then rename, several sessions share the file
+            tmp_path = "%s.%d" % (self._cache_path, os.getpid())
+            with open(tmp_path, "w") as fh:
+                json.dump(cache, fh, indent=2, sort_keys=True)
+            os.rename(tmp_path, self._cache_path)
+        except (IOError, OSError) as e:
+            self.log_debug("Could not remember the commands of %s: %s" % (self.instance_name, e))
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Engine startup time per environment, with the lazy apps against every app
+loaded at startup.
+
+For every entity given, starts the engine in a fresh interpreter once with
+IKSVY_EAGER_APPS=1 (every app imported and initialized at startup, as the
+config used to) and once with the lazy apps of apps/tk-multi-lazyapp, and
+writes as JSON the environment picked, the seconds start_engine took and
+how many apps were initialized and how many are waiting to be used.
+
+The shipped environments have no lazy apps, so both runs are the same until
+the app instances to measure are pointed at apps/tk-multi-lazyapp in a copy
+of the configuration.
+
+Unlike the other benchmarks this one needs Toolkit and the DCC: pass the
+pipeline configuration of the project and the interpreter of the DCC
+(mayapy, or a wrapper running nuke -t):
+
+    python benchmarks/bench_engine_startup.py --config /mnt/projects/nau/tank \\
+        --engine tk-maya --python mayapy --entity Task 1234 --entity Asset 56
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+
+def child(args):
+    """
+    Start the engine once and print what it took, in the interpreter of the DCC.
+    """
+    sys.path.insert(0, os.path.join(args.config, "install", "core", "python"))
+    if args.engine == "tk-maya":
+        import maya.standalone
+        maya.standalone.initialize()
+
+    import sgtk
+    tk = sgtk.sgtk_from_path(args.config)
+    entity_type, entity_id = args.entity[0]
+    context = tk.context_from_entity(entity_type, int(entity_id))
+
+    start = time.time()
+    engine = sgtk.platform.start_engine(args.engine, tk, context)
+    seconds = time.time() - start
+
+    waiting = [name for name, app in engine.apps.items()
+               if type(app).__name__ == "LazyApp" and app._app is None]
+    print(json.dumps({
+        "environment": engine.environment["name"],
+        "seconds": seconds,
+        "apps": len(engine.apps) - len(waiting),
+        "lazy_apps_waiting": sorted(waiting),
+        "commands": len(engine.commands),
+    }))
+    engine.destroy()
+
+
+def run(args):
+    results = []
+    for entity_type, entity_id in args.entity:
+        for eager in (True, False):
+            env = dict(os.environ)
+            env["IKSVY_EAGER_APPS"] = "1" if eager else "0"
+            best = None
+            for _ in range(args.repeat):
+                output = subprocess.check_output(
+                    [args.python, os.path.abspath(__file__), "--child", "--config", args.config,
+                     "--engine", args.engine, "--entity", entity_type, entity_id], env=env)
+                stats = json.loads(output.strip().splitlines()[-1])
+                if best is None or stats["seconds"] < best["seconds"]:
+                    best = stats
+            best.update({"entity": "%s %s" % (entity_type, entity_id), "eager": eager})
+            results.append(best)
+
+    for eager, lazy in zip(results[::2], results[1::2]):
+        lazy["speedup"] = eager["seconds"] / lazy["seconds"] if lazy["seconds"] else None
+
+    return {"engine": args.engine, "repeat": args.repeat, "results": results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark engine startup with and without lazy apps.")
+    parser.add_argument("--config", required=True, help="Pipeline configuration of the project")
+    parser.add_argument("--engine", default="tk-maya")
+    parser.add_argument("--python", default=sys.executable,
+                        help="Interpreter of the DCC the engine runs in, e.g. mayapy")
+    parser.add_argument("--entity", nargs=2, action="append", required=True,
+                        metavar=("TYPE", "ID"), help="Entity to build the context from, once per environment")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="Write the JSON report to this file instead of stdout")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args)
+        return
+
+    text = json.dumps(run(args), indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as fh:
+            fh.write(text)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Publish latency against scene size.
+
+Publishes files of growing size from a work to a publish folder with
+copying.publish_file (reflink, hard link or checked copy) and with a plain
+shutil.copy like the default copy file hook, and writes the timings as JSON.
+
+    python benchmarks/bench_publish_copy.py --sizes 16 256 2048 --root /mnt/projects/tmp
+    python benchmarks/bench_publish_copy.py --hardlinks
+
+--root should be on the filesystem the projects live on, otherwise the
+numbers say nothing about the real publish.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCHMARKS_DIR), "hooks"))
+from iksvy_lib import copying
+
+_BLOCK = 1024 * 1024
+
+
+def _write_scene(path, size_mb):
+    block = os.urandom(_BLOCK)
+    with open(path, "wb") as fh:
+        for _ in range(size_mb):
+            fh.write(block)
+        fh.flush()
+        os.fsync(fh.fileno())
+
+
+def _time(func, repeat):
+    timings = []
+    result = None
+    for _ in range(repeat):
+        start = time.time()
+        result = func()
+        timings.append(time.time() - start)
+    return min(timings), result
+
+
+def run(args):
+    root = tempfile.mkdtemp(prefix="iksvy_bench_copy_", dir=args.root)
+    work_folder = os.path.join(root, "work", "maya")
+    publish_folder = os.path.join(root, "publish", "maya")
+    copying.ensure_folder(work_folder)
+    copying.ensure_folder(publish_folder)
+
+    results = []
+    try:
+        for size_mb in args.sizes:
+            source = os.path.join(work_folder, "scene_%dmb.mb" % size_mb)
+            _write_scene(source, size_mb)
+            target = os.path.join(publish_folder, os.path.basename(source))
+
+            def default_copy():
+                if os.path.exists(target):
+                    os.remove(target)
+                shutil.copy(source, target)
+
+            def publish():
+                method = copying.publish_file(source, target, args.hardlinks)
+                # a hard link leaves the work file read only, undo it for the next run
+                os.chmod(source, 0o644)
+                return method
+
+            copy_time, _ = _time(default_copy, args.repeat)
+            publish_time, method = _time(publish, args.repeat)
+            results.append({
+                "size_mb": size_mb,
+                "default_copy_s": copy_time,
+                "publish_s": publish_time,
+                "publish_method": method,
+                "speedup": copy_time / publish_time if publish_time else None,
+            })
+            os.chmod(target, 0o644)
+            os.remove(target)
+            os.remove(source)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    return {"root": args.root or tempfile.gettempdir(), "repeat": args.repeat, "results": results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark publish latency against scene size.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 16, 128, 512],
+                        help="Scene sizes in MB")
+    parser.add_argument("--root", help="Folder to run in, on the projects filesystem")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--hardlinks", action="store_true",
+                        help="Hard link when the file can't be cloned, like allow_hardlinks = True in the hook")
+    parser.add_argument("--output", help="Write the JSON report to this file instead of stdout")
+    args = parser.parse_args()
+
+    text = json.dumps(run(args), indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as fh:
+            fh.write(text)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Quickdaily generation speed, serial against pipelined.
+
+Writes a synthetic frame sequence and makes a review movie of it with
+review.make_review_movie, once with the serial path (--readers 0) and once
+for every reader count given, and writes the frames per second as JSON.
+
+Without --ffmpeg the frames are read from disk and "decoded" by keeping every
+n-th byte, with --latency-ms added per frame to stand in for the file server,
+and the encoder compresses them with zlib. With --ffmpeg the real ffmpeg
+decode and encode are used, which needs real images: pass --sequence.
+
+    python benchmarks/bench_quickdaily.py --frames 100 --frame-mb 24 --latency-ms 40
+    python benchmarks/bench_quickdaily.py --readers 2 4 8 --depth 32
+    python benchmarks/bench_quickdaily.py --ffmpeg --sequence /renders/shot.%04d.exr 1001 1100
+"""
+
+import os
+import sys
+import json
+import time
+import zlib
+import shutil
+import argparse
+import tempfile
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCHMARKS_DIR), "hooks"))
+from iksvy_lib import review
+
+
+class _ZlibEncoder(object):
+    """
+    Stand-in for the ffmpeg encoder, about as busy per frame.
+    """
+
+    def __init__(self, movie_path):
+        self._fh = open(movie_path, "wb")
+
+    def write(self, frame):
+        self._fh.write(zlib.compress(frame, 6))
+
+    def close(self):
+        self._fh.close()
+
+
+def _write_sequence(folder, frames, frame_mb):
+    block = os.urandom(1024 * 1024)
+    paths = []
+    for frame in range(1001, 1001 + frames):
+        path = os.path.join(folder, "bench.%04d.exr" % frame)
+        with open(path, "wb") as fh:
+            for _ in range(frame_mb):
+                fh.write(block)
+        paths.append(path)
+    return paths
+
+
+def _synthetic_decode(latency):
+    def decode(path, width, height):
+        with open(path, "rb") as fh:
+            data = fh.read()
+        time.sleep(latency)
+        size = width * height * 3
+        step = max(len(data) // size, 1)
+        return data[::step][:size]
+    return decode
+
+
+def run(args):
+    root = None
+    if args.sequence:
+        sequence, first, last = args.sequence
+        frame_paths = [sequence % frame for frame in range(int(first), int(last) + 1)]
+    else:
+        root = tempfile.mkdtemp(prefix="iksvy_bench_quickdaily_", dir=args.root)
+        frame_paths = _write_sequence(root, args.frames, args.frame_mb)
+
+    movie_folder = tempfile.mkdtemp(prefix="iksvy_bench_movie_")
+    movie_path = os.path.join(movie_folder, "quick.mov")
+
+    results = []
+    try:
+        for readers in [0] + args.readers:
+            best = None
+            for _ in range(args.repeat):
+                if args.ffmpeg:
+                    decode, encoder = None, None
+                else:
+                    decode = _synthetic_decode(args.latency_ms / 1000.0)
+                    encoder = _ZlibEncoder(movie_path)
+                stats = review.make_review_movie(
+                    frame_paths, movie_path, readers=readers, depth=args.depth,
+                    decode=decode, encoder=encoder)
+                if best is None or stats["seconds"] < best["seconds"]:
+                    best = stats
+            best.update({"readers": readers, "depth": args.depth if readers else None})
+            results.append(best)
+    finally:
+        shutil.rmtree(movie_folder, ignore_errors=True)
+        if root:
+            shutil.rmtree(root, ignore_errors=True)
+
+    serial_fps = results[0]["fps"]
+    for result in results:
+        result["speedup"] = result["fps"] / serial_fps if serial_fps else None
+
+    return {
+        "frames": len(frame_paths),
+        "frame_mb": None if args.sequence else args.frame_mb,
+        "latency_ms": None if args.ffmpeg else args.latency_ms,
+        "ffmpeg": args.ffmpeg,
+        "repeat": args.repeat,
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark serial against pipelined quickdailies.")
+    parser.add_argument("--frames", type=int, default=48)
+    parser.add_argument("--frame-mb", type=int, default=8, help="Size of every synthetic frame")
+    parser.add_argument("--latency-ms", type=float, default=20.0,
+                        help="Extra file server latency per synthetic frame")
+    parser.add_argument("--readers", type=int, nargs="+", default=[2, 4, 8])
+    parser.add_argument("--depth", type=int, default=review.DEFAULT_DEPTH)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--root", help="Folder to write the synthetic sequence in")
+    parser.add_argument("--ffmpeg", action="store_true", help="Decode and encode with ffmpeg")
+    parser.add_argument("--sequence", nargs=3, metavar=("PATH", "FIRST", "LAST"),
+                        help="Use an existing %%04d sequence instead of a synthetic one")
+    parser.add_argument("--output", help="Write the JSON report to this file instead of stdout")
+    args = parser.parse_args()
+    if args.ffmpeg and not args.sequence:
+        parser.error("--ffmpeg needs real frames, pass --sequence")
+
+    text = json.dumps(run(args), indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as fh:
+            fh.write(text)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Local render queue throughput, one layer after another against frame chunks
+on every worker.
+
+Renders --cameras x --layers jobs of --frames frames with the render queue in
+hooks/iksvy_lib/render_queue.py, once the way artists render by hand (one
+worker, a whole camera/layer at a time) and once for every worker count
+given, and writes the wall time and frames per second as JSON.
+
+The stub renderer sleeps --frame-ms per frame, standing in for a render bound
+by something other than the python process, as Render processes are. Pass
+--maya-scene to render a real scene with Maya's Render instead (the cameras
+and layers are then taken from --camera and --layer).
+
+    python benchmarks/bench_render_queue.py --cameras 2 --layers 3 --frames 48 --frame-ms 50
+    python benchmarks/bench_render_queue.py --workers 4 8 16
+    python benchmarks/bench_render_queue.py --maya-scene /shots/lgt.ma --camera shotCam \\
+        --layer defaultRenderLayer --frames 10 --workers 2 4
+"""
+
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCHMARKS_DIR), "hooks"))
+from iksvy_lib import render_queue
+
+
+def _frame_path_function(folder):
+    def frame_path(frame):
+        return os.path.join(folder, "bench.%04d.exr" % frame)
+    return frame_path
+
+
+def _make_jobs(root, cameras, layers, frames):
+    jobs = []
+    for camera in cameras:
+        for layer in layers:
+            folder = os.path.join(root, camera, layer)
+            jobs.append(render_queue.RenderJob(
+                camera, layer, range(1001, 1001 + frames), _frame_path_function(folder)))
+    return jobs
+
+
+def run(args):
+    if args.maya_scene:
+        renderer = render_queue.MayaRenderer()
+        cameras, layers = args.camera, args.layer
+        scene_path = args.maya_scene
+    else:
+        renderer = render_queue.StubRenderer(args.frame_ms / 1000.0)
+        cameras = ["cam%d" % i for i in range(1, args.cameras + 1)]
+        layers = ["layer%d" % i for i in range(1, args.layers + 1)]
+        scene_path = "bench.ma"
+
+    results = []
+    for workers in [1] + args.workers:
+        best = None
+        for _ in range(args.repeat):
+            root = tempfile.mkdtemp(prefix="iksvy_bench_render_", dir=args.root)
+            try:
+                jobs = _make_jobs(root, cameras, layers, args.frames)
+                if workers == 1:
+                    # by hand: each camera/layer in one go
+                    queue = render_queue.RenderQueue(renderer, 1, max_chunk_size=args.frames)
+                else:
+                    queue = render_queue.RenderQueue(renderer, workers)
+                stats = queue.render(scene_path, jobs)
+            finally:
+                shutil.rmtree(root, ignore_errors=True)
+            if best is None or stats["seconds"] < best["seconds"]:
+                best = stats
+        best["workers"] = workers
+        best["fps"] = best["frames"] / best["seconds"] if best["seconds"] else None
+        results.append(best)
+
+    serial_seconds = results[0]["seconds"]
+    for result in results:
+        result["speedup"] = serial_seconds / result["seconds"] if result["seconds"] else None
+
+    return {
+        "jobs": len(cameras) * len(layers),
+        "frames": args.frames,
+        "frame_ms": None if args.maya_scene else args.frame_ms,
+        "maya": bool(args.maya_scene),
+        "repeat": args.repeat,
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the local render queue.")
+    parser.add_argument("--cameras", type=int, default=2)
+    parser.add_argument("--layers", type=int, default=3)
+    parser.add_argument("--frames", type=int, default=24, help="Frames of every camera/layer")
+    parser.add_argument("--frame-ms", type=float, default=20.0,
+                        help="Time the stub renderer takes per frame")
+    parser.add_argument("--workers", type=int, nargs="+",
+                        default=[render_queue.default_workers()])
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--root", help="Folder to render in")
+    parser.add_argument("--maya-scene", help="Render this scene with Maya's Render")
+    parser.add_argument("--camera", nargs="+", default=[], help="Cameras of --maya-scene")
+    parser.add_argument("--layer", nargs="+", default=[], help="Render layers of --maya-scene")
+    parser.add_argument("--output", help="Write the JSON report to this file instead of stdout")
+    args = parser.parse_args()
+    if args.maya_scene and not (args.camera and args.layer):
+        parser.error("--maya-scene needs --camera and --layer")
+
+    text = json.dumps(run(args), indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as fh:
+            fh.write(text)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,866 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Headless stand-ins for Maya, Nuke, Toolkit and Shotgun.
+
+install() puts fake maya.cmds, maya.mel, maya.OpenMaya, nuke, tank and sgtk
+modules in sys.modules so the hooks in ../hooks can be imported and run
+outside of a DCC. The fakes are backed by a SyntheticScene built on a temp
+folder, and every filesystem call and Shotgun round trip is counted.
+"""
+
+import os
+import re
+import sys
+import glob
+import types
+import shutil
+import tempfile
+
+try:
+    import __builtin__ as builtins
+except ImportError:
+    import builtins
+
+
+##############################################################################################################
+# counters
+
+class Counters(object):
+    """
+    Counts filesystem calls and Shotgun round trips while active.
+    """
+
+    # low level calls everything else is built on, so os.path.exists,
+    # glob.glob, shutil.copy... are counted through them.
+    _FS_FUNCTIONS = ("stat", "lstat", "listdir", "scandir")
+
+    def __init__(self):
+        self.fs_calls = 0
+        self.shotgun_calls = 0
+        self._originals = {}
+
+    def reset(self):
+        self.fs_calls = 0
+        self.shotgun_calls = 0
+
+    def start(self):
+        """
+        Patch the os functions and builtin open so they are counted.
+        """
+        for name in self._FS_FUNCTIONS:
+            if hasattr(os, name):
+                self._originals[name] = getattr(os, name)
+                setattr(os, name, self._counting(getattr(os, name)))
+        self._originals["open"] = builtins.open
+        builtins.open = self._counting(builtins.open)
+
+    def stop(self):
+        """
+        Restore the functions patched by start().
+        """
+        for name, func in self._originals.items():
+            if name == "open":
+                builtins.open = func
+            else:
+                setattr(os, name, func)
+        self._originals = {}
+
+    def _counting(self, func):
+        def wrapper(*args, **kwargs):
+            self.fs_calls += 1
+            return func(*args, **kwargs)
+        return wrapper
+
+
+counters = Counters()
+
+
+##############################################################################################################
+# toolkit
+
+class TankError(Exception):
+    pass
+
+
+# key name -> (type, format_spec). Mirrors the keys section of core/templates.yml
+TEMPLATE_KEYS = {
+    "Sequence": ("str", None),
+    "Shot": ("str", None),
+    "Step": ("str", None),
+    "sg_asset_type": ("str", None),
+    "Asset": ("str", None),
+    "name": ("str", None),
+    "iteration": ("int", None),
+    "version": ("int", "03"),
+    "timestamp": ("str", None),
+    "width": ("int", None),
+    "height": ("int", None),
+    "nuke.output": ("str", None),
+    "SEQ": ("sequence", "04"),
+    "eye": ("str", None),
+    "YYYY": ("int", "04"),
+    "MM": ("int", "02"),
+    "DD": ("int", "02"),
+    "project": ("str", None),
+    "maya_extension": ("str", None),
+    "grp_name": ("str", None),
+    "maya.camera_name": ("str", None),
+    "maya.layer_name": ("str", None),
+}
+
+# the templates used by the hooks, as defined in core/templates.yml
+SHOT_ROOT = "sequences/{Sequence}/{Shot}/{Step}"
+TEMPLATE_DEFINITIONS = {
+    "maya_shot_work": SHOT_ROOT + "/work/maya/NAU_{Sequence}_{Shot}_{name}_v{version}.{maya_extension}",
+    "maya_shot_publish": SHOT_ROOT + "/publish/maya/NAU_{Sequence}_{Shot}_{name}_v{version}.{maya_extension}",
+    "maya_shot_camera": SHOT_ROOT + "/publish/maya/camera/NAU_{Sequence}_{Shot}_cam{name}_v{version}.fbx",
+    "maya_shot_mesh_alembic_cache": SHOT_ROOT + "/publish/maya/NAU_{Sequence}_{Shot}_{name}[_{grp_name}]_v{version}.abc",
+    "maya_shot_render": SHOT_ROOT + "/work/maya/images/{maya.camera_name}/{maya.layer_name}/{name}.{SEQ}.EXR",
+}
+
+_KEY_RE = re.compile(r"\{([^}]+)\}")
+_OPTIONAL_RE = re.compile(r"\[([^\]]+)\]")
+
+
+class FakeTemplate(object):
+    """
+    Just enough of sgtk's TemplatePath for the hooks: fields in and out of
+    paths, optional sections and sequence keys.
+    """
+
+    def __init__(self, name, definition, root):
+        self.name = name
+        self.definition = definition
+        self.root = root
+        self.keys = dict((k, k) for k in _KEY_RE.findall(definition))
+        self._regex = self._build_regex()
+
+    def __repr__(self):
+        return "<FakeTemplate %s: %s>" % (self.name, self.definition)
+
+    @property
+    def parent(self):
+        definition = _OPTIONAL_RE.sub("", self.definition)
+        return FakeTemplate(self.name + "_parent", os.path.dirname(definition), self.root)
+
+    def _build_regex(self):
+        seen = {}
+        parts = []
+        pos = 0
+        definition = self.definition
+        tokens = re.finditer(r"\{([^}]+)\}|\[|\]", definition)
+        for token in tokens:
+            parts.append(re.escape(definition[pos:token.start()]))
+            pos = token.end()
+            if token.group(0) == "[":
+                parts.append("(?:")
+            elif token.group(0) == "]":
+                parts.append(")?")
+            else:
+                key = token.group(1)
+                group = key.replace(".", "__")
+                if key in seen:
+                    parts.append("(?P=%s)" % group)
+                else:
+                    seen[key] = True
+                    parts.append("(?P<%s>[^/]+?)" % group)
+        parts.append(re.escape(definition[pos:]))
+        return re.compile("^" + "".join(parts) + "$")
+
+    def _format(self, key, value):
+        key_type, format_spec = TEMPLATE_KEYS.get(key, ("str", None))
+        if key_type == "sequence" and isinstance(value, str):
+            return value
+        if key_type in ("int", "sequence") and format_spec:
+            return ("%" + format_spec + "d") % value
+        return str(value)
+
+    def _substitute(self, fields, missing=None):
+        def optional(match):
+            section = match.group(1)
+            if all(k in fields for k in _KEY_RE.findall(section)):
+                return section
+            return ""
+
+        def key(match):
+            name = match.group(1)
+            if name in fields:
+                return self._format(name, fields[name])
+            if missing is None:
+                raise TankError("Tried to resolve a path from the template %s and a set of "
+                                "input fields '%s' but the following required fields were "
+                                "missing from the input: ['%s']" % (self, fields, name))
+            return missing
+
+        relative = _KEY_RE.sub(key, _OPTIONAL_RE.sub(optional, self.definition))
+        return os.path.join(self.root, relative.replace("/", os.path.sep))
+
+    def apply_fields(self, fields):
+        return self._substitute(fields)
+
+    def get_fields(self, path):
+        relative = os.path.relpath(os.path.abspath(path), self.root).replace(os.path.sep, "/")
+        match = self._regex.match(relative)
+        if not match:
+            raise TankError("Template %s: Path '%s' is not a valid path for this template" % (self, path))
+        fields = {}
+        for key in self.keys:
+            value = match.groupdict().get(key.replace(".", "__"))
+            if value is None:
+                continue
+            key_type = TEMPLATE_KEYS.get(key, ("str", None))[0]
+            if key_type in ("int", "sequence") and value.isdigit():
+                value = int(value)
+            fields[key] = value
+        return fields
+
+    def validate(self, path):
+        try:
+            self.get_fields(path)
+        except TankError:
+            return False
+        return True
+
+    def glob_pattern(self, fields, skip_keys=None):
+        skip_keys = skip_keys or []
+        fields = dict((k, v) for k, v in fields.items() if k not in skip_keys)
+        return self._substitute(fields, missing="*")
+
+
+class FakeShotgun(object):
+    """
+    In memory Shotgun where every call counts as one round trip.
+    """
+
+    def __init__(self):
+        self.entities = {}
+        self._next_id = 1
+        # custom fields of the site, per entity type
+        self.custom_fields = {"PublishedFile": ["sg_sequence_info"]}
+
+    def _filter_match(self, entity, flt):
+        field, operator, value = flt[0], flt[1], flt[2]
+        current = entity.get(field)
+        if isinstance(current, dict) and isinstance(value, dict):
+            current, value = (current.get("type"), current.get("id")), (value.get("type"), value.get("id"))
+        if operator == "is":
+            return current == value
+        if operator == "is_not":
+            return current != value
+        if operator == "in":
+            if isinstance(current, dict):
+                return (current.get("type"), current.get("id")) in [
+                    (v.get("type"), v.get("id")) for v in value]
+            return current in value
+        if operator == "greater_than":
+            return current is not None and current > value
+        if operator == "less_than":
+            return current is not None and current < value
+        if operator == "starts_with":
+            return current is not None and current.startswith(value)
+        raise TankError("FakeShotgun does not support the '%s' filter operator" % operator)
+
+    def find(self, entity_type, filters, fields=None, order=None, limit=0, **kwargs):
+        counters.shotgun_calls += 1
+        results = [dict(e) for e in self.entities.get(entity_type, [])
+                   if all(self._filter_match(e, f) for f in filters)]
+        for sort in reversed(order or []):
+            results.sort(key=lambda e: e.get(sort["field_name"]),
+                         reverse=sort.get("direction") == "desc")
+        if limit:
+            results = results[:limit]
+        return results
+
+    def find_one(self, entity_type, filters, fields=None, order=None, **kwargs):
+        results = self.find(entity_type, filters, fields, order, limit=1)
+        return results[0] if results else None
+
+    def create(self, entity_type, data, return_fields=None):
+        counters.shotgun_calls += 1
+        entity = dict(data)
+        entity.update({"type": entity_type, "id": self._next_id})
+        self._next_id += 1
+        self.entities.setdefault(entity_type, []).append(entity)
+        return dict(entity)
+
+    def update(self, entity_type, entity_id, data):
+        counters.shotgun_calls += 1
+        for entity in self.entities.get(entity_type, []):
+            if entity["id"] == entity_id:
+                entity.update(data)
+                return dict(entity)
+        return None
+
+    def schema_field_read(self, entity_type, field_name=None):
+        counters.shotgun_calls += 1
+        if field_name not in self.custom_fields.get(entity_type, []):
+            raise TankError("FakeShotgun has no field %s.%s" % (entity_type, field_name))
+        return {field_name: {"data_type": {"value": "text"}}}
+
+    def upload_thumbnail(self, entity_type, entity_id, path, **kwargs):
+        counters.shotgun_calls += 1
+        return self.update(entity_type, entity_id, {"image": path})
+
+    def batch(self, requests):
+        counters.shotgun_calls += 1
+        results = []
+        for request in requests:
+            if request["request_type"] == "create":
+                results.append(self.create(request["entity_type"], request["data"]))
+            else:
+                results.append(self.update(request["entity_type"], request["entity_id"], request["data"]))
+        # the calls above are part of the same round trip
+        counters.shotgun_calls -= len(requests)
+        return results
+
+
+class FakePipelineConfiguration(object):
+    """
+    Stand-in for the pipeline configuration of a FakeTk.
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def get_project_disk_name(self):
+        return os.path.basename(self.root)
+
+    def get_project_id(self):
+        return 1
+
+
+class FakeTk(object):
+    """
+    Stand-in for the sgtk API instance.
+    """
+
+    def __init__(self, root):
+        self.roots = {"primary": root}
+        self.project_path = root
+        self.pipeline_configuration = FakePipelineConfiguration(root)
+        self.templates = dict((name, FakeTemplate(name, definition, root))
+                              for name, definition in TEMPLATE_DEFINITIONS.items())
+        self.shotgun = FakeShotgun()
+
+    def paths_from_template(self, template, fields, skip_keys=None, **kwargs):
+        pattern = template.glob_pattern(fields, skip_keys)
+        return [path for path in glob.glob(pattern) if template.validate(path)]
+
+    def abstract_paths_from_template(self, template, fields):
+        paths = set()
+        for path in self.paths_from_template(template, fields, ["SEQ", "eye"]):
+            path_fields = template.get_fields(path)
+            if "SEQ" in path_fields:
+                path_fields["SEQ"] = "%04d"
+            paths.add(template.apply_fields(path_fields))
+        return sorted(paths)
+
+    def template_from_path(self, path):
+        matches = [t for t in self.templates.values() if t.validate(path)]
+        if len(matches) > 1:
+            raise TankError("%d templates are matching the path '%s'" % (len(matches), path))
+        return matches[0] if matches else None
+
+
+def register_publish(tk, context, path, name, version_number, **kwargs):
+    """
+    Stand-in for tank.util.register_publish doing the same Shotgun round
+    trips as the real one: find the type, create the publish and upload the
+    thumbnail.
+    """
+    sg = tk.shotgun
+    type_name = kwargs.get("published_file_type")
+    publish_type = sg.find_one("PublishedFileType", [["code", "is", type_name]])
+    if not publish_type:
+        publish_type = sg.create("PublishedFileType", {"code": type_name})
+    data = {
+        "code": os.path.basename(path),
+        "name": name,
+        "version_number": version_number,
+        "path": {"local_path": path},
+        "description": kwargs.get("comment"),
+        "entity": context.entity,
+        "task": kwargs.get("task"),
+        "published_file_type": {"type": "PublishedFileType", "id": publish_type["id"]},
+    }
+    data.update(kwargs.get("sg_fields") or {})
+    entity = sg.create("PublishedFile", data)
+    if kwargs.get("thumbnail_path"):
+        sg.upload_thumbnail("PublishedFile", entity["id"], kwargs["thumbnail_path"])
+    return entity
+
+
+class FakeContext(object):
+    def __init__(self, project, entity, step):
+        self.project = project
+        self.entity = entity
+        self.step = step
+        self.task = None
+        self.user = None
+
+
+class FakeApp(object):
+    """
+    Stand-in for the app or engine a hook is run from.
+    """
+
+    def __init__(self, tk, context, settings):
+        self.tank = tk
+        self.sgtk = tk
+        self.shotgun = tk.shotgun
+        self.context = context
+        self.settings = settings
+        self.engine = None
+        self.debug_messages = []
+
+    def get_template(self, setting_name):
+        return self.tank.templates.get(self.settings[setting_name])
+
+    def get_template_by_name(self, template_name):
+        return self.tank.templates.get(template_name)
+
+    def get_setting(self, name, default=None):
+        return self.settings.get(name, default)
+
+    def ensure_folder_exists(self, path):
+        if not os.path.exists(path):
+            os.makedirs(path)
+
+    def log_debug(self, msg):
+        self.debug_messages.append(msg)
+
+    log_info = log_warning = log_error = log_debug
+
+
+class FakeEngine(FakeApp):
+    def __init__(self, tk, context, settings):
+        super(FakeEngine, self).__init__(tk, context, settings)
+        self.apps = {}
+        self.engine = self
+
+
+class Hook(object):
+    """
+    Stand-in for tank.Hook.
+    """
+
+    def __init__(self, parent):
+        self.parent = parent
+
+    def get_publish_path(self, sg_publish_data):
+        return sg_publish_data["path"]["local_path"]
+
+    def execute(self, **kwargs):
+        return None
+
+
+##############################################################################################################
+# synthetic scene
+
+class SyntheticScene(object):
+    """
+    A Maya shot scene with cameras, render layers, mesh groups and rendered
+    frames for every camera/layer on a temp folder.
+    """
+
+    SEQUENCE = "SQ010"
+    SHOT = "SH0010"
+    STEP = "LAY"
+
+    def __init__(self, cameras=4, layers=3, mesh_groups=20, frames=48, root=None):
+        self.root = root or tempfile.mkdtemp(prefix="iksvy_bench_")
+        self.cameras = ["shotCam%d" % i for i in range(1, cameras + 1)]
+        self.layers = ["defaultRenderLayer"] + ["layer%d" % i for i in range(1, layers)]
+        self.mesh_groups = ["|grp_%03d" % i for i in range(1, mesh_groups + 1)]
+        self.frames = list(range(1001, 1001 + frames))
+        # a couple of groups without meshes, like lights or locators
+        self.empty_groups = ["|lights", "|locators"]
+        self.selection = []
+        self.exports = []
+
+        self.tk = FakeTk(self.root)
+        self.context = FakeContext(
+            {"type": "Project", "id": 1, "name": "bench"},
+            {"type": "Shot", "id": 2, "name": self.SHOT},
+            {"type": "Step", "id": 3, "name": self.STEP})
+        self.fields = {
+            "Sequence": self.SEQUENCE,
+            "Shot": self.SHOT,
+            "Step": self.STEP,
+            "name": "layout",
+            "version": 3,
+            "maya_extension": "ma",
+        }
+        self.scene_path = self.tk.templates["maya_shot_work"].apply_fields(self.fields)
+        self._write(self.scene_path, b"//Maya ASCII scene\n")
+
+        render_template = self.tk.templates["maya_shot_render"]
+        for camera in self.cameras:
+            for layer in self.layers:
+                for frame in self.frames:
+                    fields = dict(self.fields)
+                    fields.update({
+                        "maya.camera_name": camera,
+                        "maya.layer_name": layer.replace("defaultRenderLayer", "masterLayer"),
+                        "name": os.path.basename(self.scene_path).split(".")[0],
+                        "SEQ": frame,
+                    })
+                    self._write(render_template.apply_fields(fields), b"\0" * 1024)
+
+        self.thumbnail_path = os.path.join(self.root, "thumb.png")
+        self._write(self.thumbnail_path, b"\x89PNG")
+
+    def _write(self, path, data):
+        folder = os.path.dirname(path)
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+        with open(path, "wb") as fh:
+            fh.write(data)
+
+    def cleanup(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def meshes(self):
+        return ["%s|mesh%sShape" % (grp, grp.lstrip("|grp_")) for grp in self.mesh_groups]
+
+    def dag_nodes(self):
+        """
+        :returns: The DAG in depth first order, as (long name, depth, node
+                  type) with the world first
+        """
+        nodes = [("", 0, "world")]
+        meshes = self.meshes()
+        for grp in self.mesh_groups:
+            nodes.append((grp, 1, "transform"))
+            nodes.extend((mesh, 2, "mesh") for mesh in meshes if mesh.startswith(grp + "|"))
+        nodes.extend((grp, 1, "transform") for grp in self.empty_groups)
+        for camera in ["persp"] + self.cameras:
+            nodes.append(("|" + camera, 1, "transform"))
+            nodes.append(("|%s|%sShape" % (camera, camera), 2, "camera"))
+        return nodes
+
+    # maya.cmds ------------------------------------------------------------------------------------------
+
+    def cmds_file(self, *args, **kwargs):
+        if kwargs.get("query"):
+            return self.scene_path
+        if args and (kwargs.get("exportSelected") or kwargs.get("exportAll")):
+            self._write(args[0], b"export")
+            self.exports.append(args[0])
+            return args[0]
+        return None
+
+    def cmds_ls(self, *args, **kwargs):
+        if kwargs.get("geometry"):
+            return self.meshes()
+        if kwargs.get("assemblies"):
+            return self.mesh_groups + self.empty_groups + ["|" + c for c in self.cameras] + ["|persp"]
+        node_type = kwargs.get("type") or kwargs.get("typ")
+        if args and kwargs.get("dag"):
+            grp = args[0]
+            if node_type == "mesh" and grp in self.mesh_groups:
+                return [m for m in self.meshes() if m.startswith(grp + "|")]
+            return []
+        if node_type == "renderLayer":
+            return list(self.layers)
+        if node_type == "animCurve":
+            return ["%s_translateX" % c for c in self.cameras]
+        if node_type == "camera":
+            return ["%sShape" % c for c in self.cameras] + ["perspShape"]
+        return []
+
+    def cmds_listCameras(self, *args, **kwargs):
+        return ["persp"] + list(self.cameras)
+
+    def cmds_objExists(self, name):
+        return name in self.mesh_groups or name in self.cameras or name in self.empty_groups
+
+    def cmds_select(self, *args, **kwargs):
+        self.selection = list(args)
+
+    def cmds_playbackOptions(self, **kwargs):
+        if kwargs.get("min"):
+            return float(self.frames[0])
+        return float(self.frames[-1])
+
+    def cmds_getAttr(self, attr, **kwargs):
+        # render settings rendering the frames on disk
+        return {
+            "defaultRenderGlobals.animation": True,
+            "defaultRenderGlobals.startFrame": float(self.frames[0]),
+            "defaultRenderGlobals.endFrame": float(self.frames[-1]),
+        }.get(attr, True)
+
+    def cmds_currentTime(self, **kwargs):
+        return float(self.frames[0])
+
+    def cmds_getPanel(self, *args, **kwargs):
+        if kwargs.get("typeOf"):
+            return "modelPanel"
+        if kwargs.get("type"):
+            return ["modelPanel4"]
+        return "modelPanel4"
+
+    def cmds_modelPanel(self, panel, **kwargs):
+        return "persp"
+
+    def cmds_lookThru(self, *args, **kwargs):
+        pass
+
+    def cmds_playblast(self, **kwargs):
+        self._write(kwargs["completeFilename"], b"\xff\xd8\xff")
+        return kwargs["completeFilename"]
+
+    # maya.mel -------------------------------------------------------------------------------------------
+
+    def mel_eval(self, command):
+        if command.startswith("exists"):
+            return 1
+        if command.startswith("AbcExport"):
+            match = re.search(r"-file (\S+?)\"?$", command)
+            if match:
+                self._write(match.group(1), b"abc")
+                self.exports.append(match.group(1))
+            return None
+        return None
+
+
+##############################################################################################################
+# module installation
+
+class _Recorder(object):
+    """
+    Records calls on nuke.nodes.X / nuke.createNode.
+    """
+
+    def __init__(self):
+        self.calls = []
+
+    def __getattr__(self, name):
+        def node(*args, **kwargs):
+            self.calls.append((name, args, kwargs))
+            return {"Class": name, "args": args, "knobs": kwargs}
+        return node
+
+
+def _module(name, **attrs):
+    module = types.ModuleType(name)
+    module.__dict__.update(attrs)
+    return module
+
+
+class _FakeMObject(object):
+    # node type -> the MFn types it has
+    FN_TYPES = {
+        "world": (),
+        "transform": ("kTransform",),
+        "mesh": ("kMesh", "kGeometric"),
+        "camera": ("kCamera",),
+    }
+
+    def __init__(self, node_type):
+        self.node_type = node_type
+
+    def hasFn(self, fn_type):
+        return fn_type in self.FN_TYPES[self.node_type]
+
+
+class _FakeMDagPath(object):
+    def __init__(self):
+        self.name = ""
+
+    def fullPathName(self):
+        return self.name
+
+    def partialPathName(self):
+        return self.name.rsplit("|", 1)[-1]
+
+    def pop(self):
+        self.name = self.name.rsplit("|", 1)[0]
+
+
+def _fake_dag_iterator_class(scene):
+    """
+    MItDag over the nodes of scene.dag_nodes()
+    """
+    class FakeMItDag(object):
+        kDepthFirst = 0
+
+        def __init__(self, traversal=None, filter_type=None):
+            self._nodes = scene.dag_nodes()
+            self._index = 0
+
+        def isDone(self):
+            return self._index >= len(self._nodes)
+
+        def next(self):
+            self._index += 1
+
+        def depth(self):
+            return self._nodes[self._index][1]
+
+        def currentItem(self):
+            return _FakeMObject(self._nodes[self._index][2])
+
+        def getPath(self, path):
+            path.name = self._nodes[self._index][0]
+
+    return FakeMItDag
+
+
+def _fake_dependency_iterator_class(scene):
+    """
+    MItDependencyNodes over the geometry shapes of the scene
+    """
+    class FakeMItDependencyNodes(object):
+
+        def __init__(self, filter_type=None):
+            self._nodes = [name for name, _, node_type in scene.dag_nodes() if node_type == "mesh"]
+            self._index = 0
+
+        def isDone(self):
+            return self._index >= len(self._nodes)
+
+        def next(self):
+            self._index += 1
+
+        def thisNode(self):
+            return _FakeMObject("mesh")
+
+    return FakeMItDependencyNodes
+
+
+def _maya_api_module(scene):
+    """
+    maya.OpenMaya with the message classes used by the scene journal and
+    the DAG iteration classes used by the scan. The callbacks are never
+    triggered, they just get an id.
+    """
+    ids = iter(range(1, 1000000))
+
+    def add_callback(*args, **kwargs):
+        return next(ids)
+
+    message_class = type("MMessage", (object,), {
+        "addNodeAddedCallback": staticmethod(add_callback),
+        "addNodeRemovedCallback": staticmethod(add_callback),
+        "addAllDagChangesCallback": staticmethod(add_callback),
+        "addNameChangedCallback": staticmethod(add_callback),
+        "addAttributeChangedCallback": staticmethod(add_callback),
+        "addCallback": staticmethod(add_callback),
+        "removeCallback": staticmethod(lambda callback_id: None),
+        "kAfterNew": 1,
+        "kAfterOpen": 2,
+        "kAttributeSet": 16,
+    })
+    return _module(
+        "maya.OpenMaya",
+        MMessage=message_class,
+        MDGMessage=message_class,
+        MDagMessage=message_class,
+        MNodeMessage=message_class,
+        MSceneMessage=message_class,
+        MObject=object,
+        MItDag=_fake_dag_iterator_class(scene),
+        MItDependencyNodes=_fake_dependency_iterator_class(scene),
+        MDagPath=_FakeMDagPath,
+        MFn=type("MFn", (object,), dict((name, name) for name in (
+            "kInvalid", "kTransform", "kMesh", "kGeometric", "kCamera"))),
+        MFnDagNode=type("MFnDagNode", (object,), {
+            "setObject": lambda self, node: None,
+            "isIntermediateObject": lambda self: False,
+        }),
+        MFnCamera=type("MFnCamera", (object,), {
+            "__init__": lambda self, node: None,
+            "isOrtho": lambda self: False,
+        }),
+    )
+
+
+def install(scene):
+    """
+    Install the fake modules in sys.modules, backed by the given scene.
+
+    :param scene: The SyntheticScene the fake maya/nuke/tank modules work on
+    :returns:     The FakeEngine returned by tank.platform.current_engine()
+    """
+    engine = FakeEngine(scene.tk, scene.context, {})
+
+    cmds = _module(
+        "maya.cmds",
+        file=scene.cmds_file,
+        ls=scene.cmds_ls,
+        listCameras=scene.cmds_listCameras,
+        objExists=scene.cmds_objExists,
+        select=scene.cmds_select,
+        playbackOptions=scene.cmds_playbackOptions,
+        getAttr=scene.cmds_getAttr,
+        currentTime=scene.cmds_currentTime,
+        getPanel=scene.cmds_getPanel,
+        modelPanel=scene.cmds_modelPanel,
+        lookThru=scene.cmds_lookThru,
+        playblast=scene.cmds_playblast,
+    )
+    mel = _module("maya.mel", eval=scene.mel_eval)
+    open_maya = _maya_api_module(scene)
+    maya = _module("maya", cmds=cmds, mel=mel, OpenMaya=open_maya)
+
+    nodes = _Recorder()
+    nuke = _module(
+        "nuke",
+        nodes=nodes,
+        createNode=lambda *args, **kwargs: nodes.calls.append(("createNode", args, kwargs)),
+        nodePaste=lambda path: nodes.calls.append(("nodePaste", (path,), {})),
+    )
+
+    platform = _module("tank.platform", current_engine=lambda: engine)
+    # the service workers open their own connection, the same fake one here
+    sg_util = _module("tank.util.shotgun", create_sg_connection=lambda: scene.tk.shotgun)
+    util = _module("tank.util", register_publish=register_publish, shotgun=sg_util)
+    tank = _module(
+        "tank",
+        Hook=Hook,
+        TankError=TankError,
+        platform=platform,
+        util=util,
+        get_hook_baseclass=lambda: Hook,
+    )
+
+    sys.modules.update({
+        "maya": maya,
+        "maya.cmds": cmds,
+        "maya.mel": mel,
+        "maya.OpenMaya": open_maya,
+        "nuke": nuke,
+        "tank": tank,
+        "tank.platform": platform,
+        "tank.util": util,
+        "tank.util.shotgun": sg_util,
+        "sgtk": tank,
+    })
+    return engine
+
+
+def load_hook(path, class_name, parent):
+    """
+    Import a hook file the way Toolkit does and instantiate its hook class.
+
+    :param path:       Path to the hook file
+    :param class_name: Name of the Hook subclass defined in the file
+    :param parent:     The app or engine to use as the hook parent
+    :returns:          The hook instance
+    """
+    import imp
+    module_name = "iksvy_bench_%s" % re.sub(r"\W", "_", os.path.basename(path)[:-3])
+    module = imp.load_source(module_name, path)
+    return getattr(module, class_name)(parent)
@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Benchmark the publish hooks against a synthetic scene.
+
+Runs the scan, pre-publish and secondary publish Maya hooks and the Nuke
+loader actions hook with the headless stand-ins from headless.py, and writes
+the wall time, filesystem calls and Shotgun round trips of each one as JSON.
+
+Usage (with the same python as mayapy, the hooks are python 2):
+
+    python benchmarks/run_benchmarks.py --cameras 4 --layers 3 --mesh-groups 50 \\
+        --frames 100 --output bench.json
+
+    python benchmarks/run_benchmarks.py --compare bench.json
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+CONFIG_ROOT = os.path.dirname(BENCHMARKS_DIR)
+HOOKS_DIR = os.path.join(CONFIG_ROOT, "hooks")
+
+sys.path.insert(0, BENCHMARKS_DIR)
+import headless
+
+# the secondary outputs configured for tk-multi-publish in env/shot_step.yml
+SECONDARY_OUTPUTS = [
+    {"name": "rendered_image", "publish_template": "maya_shot_render",
+     "scene_item_type": "rendered_image", "tank_type": "Rendered Image"},
+    {"name": "camera", "publish_template": "maya_shot_camera",
+     "scene_item_type": "camera", "tank_type": "Camera"},
+    {"name": "alembic_cache", "publish_template": "maya_shot_mesh_alembic_cache",
+     "scene_item_type": "mesh_group", "tank_type": "Alembic Cache"},
+]
+
+PUBLISH_SETTINGS = {
+    "template_work": "maya_shot_work",
+    "primary_publish_template": "maya_shot_publish",
+    "secondary_outputs": SECONDARY_OUTPUTS,
+}
+
+
+def _measure(func, repeat):
+    """
+    Run func repeat times and collect its timings and counters.
+
+    :returns: A dictionary with the results of the best run, the timing of
+              every run and the value returned by the last one
+    """
+    timings = []
+    result = None
+    headless.counters.start()
+    try:
+        for _ in range(repeat):
+            headless.counters.reset()
+            start = time.time()
+            result = func()
+            timings.append(time.time() - start)
+    finally:
+        headless.counters.stop()
+    return {
+        "wall_time": min(timings),
+        "wall_times": timings,
+        "fs_calls": headless.counters.fs_calls,
+        "shotgun_calls": headless.counters.shotgun_calls,
+    }, result
+
+
+def _tasks_from_items(tk, items):
+    """
+    Build the secondary tasks the publish app would build from the scan items.
+    """
+    tasks = []
+    for item in items:
+        for output in SECONDARY_OUTPUTS:
+            if output["scene_item_type"] == item["type"]:
+                task_output = dict(output)
+                task_output["publish_template"] = tk.templates[output["publish_template"]]
+                tasks.append({"item": item, "output": task_output})
+    return tasks
+
+
+def run(args):
+    """
+    Build the synthetic scene, run every hook on it and return the report.
+    """
+    scene = headless.SyntheticScene(
+        cameras=args.cameras, layers=args.layers,
+        mesh_groups=args.mesh_groups, frames=args.frames)
+    # keep the thumbnails the publish makes out of the user's store
+    os.environ["IKSVY_THUMBNAIL_DIR"] = os.path.join(scene.root, "thumbnails")
+    try:
+        engine = headless.install(scene)
+        app = headless.FakeApp(scene.tk, scene.context, PUBLISH_SETTINGS)
+        app.engine = engine
+        hooks = {}
+
+        def load(file_name, class_name, parent=app):
+            return headless.load_hook(os.path.join(HOOKS_DIR, file_name), class_name, parent)
+
+        def progress_cb(*args):
+            pass
+
+        # scan: the first scan after opening the scene, then a scan with no
+        # scene changes in between
+        scan_hook = load("iksvy_scan_scene_tk-maya.py", "ScanSceneHook")
+
+        def cold_scan():
+            from iksvy_lib import scene_journal
+            scene_journal.get_journal().reset()
+            return scan_hook.execute()
+
+        hooks["scan_cold"], items = _measure(cold_scan, args.repeat)
+        hooks["scan_warm"], items = _measure(scan_hook.execute, args.repeat)
+
+        tasks = _tasks_from_items(scene.tk, items)
+        work_template = scene.tk.templates["maya_shot_work"]
+        primary_publish_path = scene.tk.templates["maya_shot_publish"].apply_fields(scene.fields)
+
+        pre_publish_hook = load("iksvy_secondary_pre_publish_tk-maya.py", "PrePublishHook")
+        hooks["pre_publish"], _ = _measure(
+            lambda: pre_publish_hook.execute(tasks, work_template, progress_cb, {}),
+            args.repeat)
+
+        publish_hook = load("iksvy_secondary_publish_tk-maya.py", "PublishHook")
+        hooks["publish"], errors = _measure(
+            lambda: publish_hook.execute(
+                tasks, work_template, "benchmark", scene.thumbnail_path, None,
+                None, primary_publish_path, progress_cb, {}),
+            args.repeat)
+        if errors:
+            raise RuntimeError("Publish hook reported errors: %s" % errors)
+
+        # the thumbnails are made in the background, let them finish before
+        # the scene is removed
+        from iksvy_lib import thumbnails
+        thumbnails.get_service().wait()
+
+        # loader: create a read node for a published render sequence, from
+        # the registered publish and from a bare path that has to be scanned
+        nuke_actions_hook = load("iksvy_tk-nuke_actions.py", "NukeActions")
+        render_path = [item for item in items if item["type"] == "rendered_image"][0]
+        render_path = render_path["other_params"]["path"]
+        sg_publish_data = [publish for publish in scene.tk.shotgun.entities["PublishedFile"]
+                           if publish["path"]["local_path"] == render_path][-1]
+        hooks["nuke_read_node"], _ = _measure(
+            lambda: nuke_actions_hook.execute_action("read_node", None, sg_publish_data),
+            args.repeat)
+        bare_publish_data = {"path": {"local_path": render_path}}
+        hooks["nuke_read_node_scan"], _ = _measure(
+            lambda: nuke_actions_hook.execute_action("read_node", None, bare_publish_data),
+            args.repeat)
+    finally:
+        scene.cleanup()
+
+    return {
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "scene": {
+            "cameras": args.cameras,
+            "layers": args.layers,
+            "mesh_groups": args.mesh_groups,
+            "frames": args.frames,
+            "items": len(items),
+            "tasks": len(tasks),
+        },
+        "repeat": args.repeat,
+        "hooks": hooks,
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], cwd=CONFIG_ROOT).decode("utf-8").strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline, report):
+    """
+    Print how each hook changed between a baseline report and this one.
+    """
+    lines = ["%-20s %12s %12s %8s %10s %10s" % (
+        "hook", "base (s)", "now (s)", "ratio", "fs calls", "sg calls")]
+    for name, now in sorted(report["hooks"].items()):
+        base = baseline["hooks"].get(name)
+        if not base:
+            lines.append("%-20s %12s %12.4f" % (name, "-", now["wall_time"]))
+            continue
+        ratio = now["wall_time"] / base["wall_time"] if base["wall_time"] else 0.0
+        lines.append("%-20s %12.4f %12.4f %8.2f %4d->%-5d %4d->%-5d" % (
+            name, base["wall_time"], now["wall_time"], ratio,
+            base["fs_calls"], now["fs_calls"], base["shotgun_calls"], now["shotgun_calls"]))
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the publish hooks on a synthetic scene.")
+    parser.add_argument("--cameras", type=int, default=4)
+    parser.add_argument("--layers", type=int, default=3)
+    parser.add_argument("--mesh-groups", type=int, default=20)
+    parser.add_argument("--frames", type=int, default=48)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="Write the JSON report to this file instead of stdout")
+    parser.add_argument("--compare", help="A previous JSON report to compare the results with")
+    args = parser.parse_args()
+
+    report = run(args)
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as fh:
+            fh.write(text)
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as fh:
+            baseline = json.load(fh)
+        sys.stderr.write(compare(baseline, report) + "\n")
+
+
+if __name__ == "__main__":
+    main()
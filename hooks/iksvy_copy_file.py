@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+import os
+import sys
+import time
+
+from tank import Hook
+from tank import TankError
+
+# shared code for the iksvy hooks lives next to them
+_HOOKS_DIR = os.path.dirname(os.path.abspath(__file__))
+if _HOOKS_DIR not in sys.path:
+    sys.path.append(_HOOKS_DIR)
+from iksvy_lib import copying
+from iksvy_lib import tracing
+
+# set to 1 to hard link scene files that can't be cloned, see allow_hardlinks
+ALLOW_HARDLINKS_ENV = "IKSVY_ALLOW_HARDLINKS"
+
+
+class CopyFile(Hook):
+    """
+    Copy file hook that copies frame sequences in parallel and publishes
+    scene files without copying them.
+
+    The publish app calls this hook once per frame when publishing a write
+    node (work/images -> publish/elements). The first call for a sequence
+    copies every frame of it with a pool of threads, and the calls for the
+    following frames find their frame already copied and return straight
+    away.
+
+    Files that are not frames, like the Maya and Nuke scenes of a primary
+    publish, are cloned to the publish area when it is on the same
+    filesystem, copied with a checksum otherwise, and made read only.
+    """
+
+    # number of threads copying frames
+    copy_workers = copying.DEFAULT_WORKERS
+
+    # compare the sha1 of every frame copied with its source
+    verify_copies = False
+
+    # hard link scene files that can't be cloned instead of copying them.
+    # This makes the work file read only as well, see copying.publish_file
+    allow_hardlinks = False
+
+    def execute(self, source_path, target_path, task=None, **kwargs):
+        """
+        Main hook entry point
+
+        :param source_path:     String
+                                Source file path to copy
+
+        :param target_path:     String
+                                Target file path to copy to
+
+        :param task:            Dictionary
+                                The publish task this copy is done for, None
+                                when the caller has no task
+        """
+        # frames already brought over by the batch copy of their sequence
+        if copying.is_up_to_date(source_path, target_path):
+            return
+
+        with tracing.span("copy", path=source_path):
+            pairs = copying.sequence_pairs(source_path, target_path)
+            if not pairs:
+                self._publish_file(source_path, target_path)
+                return
+
+            try:
+                stats = copying.copy_files(pairs, self.copy_workers, self.verify_copies)
+            except (IOError, OSError) as e:
+                raise TankError("Failed to copy '%s' to '%s': %s" % (source_path, target_path, e))
+            tracing.count("fs_call_sites", len(pairs))
+
+        self.parent.log_debug(
+            "Copied %d files (%.1f MB) to %s in %.2fs, %.1f MB/s. %d were already up to date." % (
+                stats["copied"], stats["bytes"] / (1024.0 * 1024.0), os.path.dirname(target_path),
+                stats["seconds"], stats["mb_per_s"], stats["skipped"]))
+
+    def _publish_file(self, source_path, target_path):
+        """
+        Publish a single file, cloning it rather than copying when possible.
+
+        :param source_path: File to publish
+        :param target_path: Publish path
+        """
+        start = time.time()
+        try:
+            allow_hardlinks = self.allow_hardlinks or os.environ.get(ALLOW_HARDLINKS_ENV) == "1"
+            method = copying.publish_file(source_path, target_path, allow_hardlinks)
+        except (IOError, OSError) as e:
+            raise TankError("Failed to copy '%s' to '%s': %s" % (source_path, target_path, e))
+        tracing.count("fs_call_sites")
+
+        self.parent.log_debug("Published %s to %s with a %s in %.2fs" % (
+            source_path, target_path, method, time.time() - start))
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+import os
+import sys
+
+from tank import Hook
+
+# shared code for the iksvy hooks lives next to them
+_HOOKS_DIR = os.path.dirname(os.path.abspath(__file__))
+if _HOOKS_DIR not in sys.path:
+    sys.path.append(_HOOKS_DIR)
+from iksvy_lib import tracing
+
+# set to 1 to get every version in the loader, like the stock hook
+ALL_VERSIONS_ENV = "IKSVY_LOADER_ALL_VERSIONS"
+
+
+class FilterPublishes(Hook):
+    """
+    Loader filter hook keeping only the latest version of every publish.
+
+    The loader then only builds and sorts the rows it displays instead of
+    every version of every publish. The latest version is the highest
+    version_number of the list the loader already got, so no more Shotgun
+    queries are made.
+
+    The history of a publish is still there on demand. The history view of
+    the loader calls this hook too, with the versions of a single publish,
+    and lists holding a single publish are returned untouched. The same goes
+    for a location with only one publish, whose versions all show in the
+    main view. Setting IKSVY_LOADER_ALL_VERSIONS=1 (or show_all_versions)
+    turns the filtering off altogether.
+    """
+
+    # return every version, like the default hook
+    show_all_versions = False
+
+    def execute(self, publishes, **kwargs):
+        """
+        Main hook entry point
+
+        :param publishes:   List of dictionaries
+                            A list of  dictionaries for the current location within the app. Each
+                            item in the list is a Dictionary of the form:
+
+                            {
+                                 "sg_publish" : {Shotgun entity dictionary for a Published File entity}
+                            }
+
+        :returns:           The filtered list of dictionaries of the same form as the input 'publishes'
+                            list
+        """
+        if self.show_all_versions or os.environ.get(ALL_VERSIONS_ENV) == "1" or len(publishes) < 2:
+            return publishes
+
+        with tracing.span("filter_publishes", publishes=len(publishes)):
+            chosen = _choose_latest([publish["sg_publish"] for publish in publishes])
+
+        # the versions of a single publish, as the history view asks for them
+        if len(chosen) < 2:
+            return publishes
+
+        tracing.log_debug(self.parent, "Loader showing %d of %d publishes", len(chosen), len(publishes))
+        return [publish for publish in publishes if publish["sg_publish"]["id"] in chosen]
+
+
+def _publish_key(sg_publish):
+    """
+    :param sg_publish: PublishedFile dictionary
+    :returns:          The (entity type, entity id, name, type id, task id)
+                       the publish is a version of
+    """
+    entity = sg_publish.get("entity") or {}
+    return (entity.get("type") or "", entity.get("id") or 0, sg_publish.get("name") or "",
+            _link_id(sg_publish.get("published_file_type")), _link_id(sg_publish.get("task")))
+
+
+def _link_id(link):
+    return link["id"] if link else 0
+
+
+def _choose_latest(sg_publishes):
+    """
+    :param sg_publishes: The PublishedFile dictionaries to choose from
+    :returns:            Set with the id of the highest version of every key
+    """
+    highest = {}
+    for sg_publish in sg_publishes:
+        key = _publish_key(sg_publish)
+        current = highest.get(key)
+        if current is None or sg_publish.get("version_number") > current.get("version_number"):
+            highest[key] = sg_publish
+    return set(sg_publish["id"] for sg_publish in highest.values())
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+import os
+import sys
+import datetime
+
+from tank import Hook
+
+# shared code for the iksvy hooks lives next to them
+_HOOKS_DIR = os.path.dirname(os.path.abspath(__file__))
+if _HOOKS_DIR not in sys.path:
+    sys.path.append(_HOOKS_DIR)
+from iksvy_lib import hiero_transcode
+from iksvy_lib import transcoding
+
+
+class PreExport(Hook):
+    """
+    Pre export hook sending the plate and DPX transcodes of the exported
+    shots to a local pool of Nuke processes, one shot per process.
+
+    The transcode tasks of the Hiero export preset (plates and renders) are
+    taken out of the export and replaced by tasks handing each exported
+    track item to the pool, see iksvy_lib.hiero_transcode. The pool writes
+    the plate (template_plate_path) and render (template_render_path)
+    outputs. Shots whose outputs for today already exist with the length of
+    the cut are skipped.
+    """
+
+    # number of shots transcoded at the same time, the CPU count by default
+    transcode_workers = None
+
+    def execute(self, processor, **kwargs):
+        """
+        Main hook entry point
+
+        :param processor:   The tk-hiero-export processor about to start the export
+        """
+        app = self.parent
+        removed = hiero_transcode.install(
+            processor, self._shot_job, self._nuke_executable(), self.transcode_workers,
+            app.log_info, app.log_error)
+        app.log_debug("Transcodes of the preset run on the pool instead: %s" % (
+            ", ".join(preset.name() for preset in removed) or "none"))
+
+    def _shot_job(self, item):
+        """
+        :param item: A track item of the export
+        :returns:    The ShotJob transcoding it
+        """
+        app = self.parent
+        plate_template = app.get_template("template_plate_path")
+        render_template = app.get_template("template_render_path")
+        today = datetime.date.today()
+
+        sequence = item.parentSequence()
+        media = item.source().mediaSource()
+        start = media.startTime()
+        fields = {
+            "Sequence": sequence.name(),
+            "Shot": item.name(),
+            "project": item.project().name(),
+            "YYYY": today.year,
+            "MM": today.month,
+            "DD": today.day,
+            "SEQ": "FORMAT: %d",
+        }
+        return transcoding.ShotJob(
+            shot=item.name(),
+            source_path=media.fileinfos()[0].filename(),
+            first_frame=int(start + item.sourceIn()),
+            last_frame=int(start + item.sourceOut()),
+            plate_path=plate_template.apply_fields(fields),
+            render_path=render_template.apply_fields(fields),
+        )
+
+    def _nuke_executable(self):
+        """
+        :returns: The Nuke binary of the running Nuke Studio/Hiero
+        """
+        try:
+            import nuke
+            return nuke.EXE_PATH
+        except (ImportError, AttributeError):
+            return sys.executable
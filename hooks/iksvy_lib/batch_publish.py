@@ -0,0 +1,572 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Headless publish of the latest Maya work file of every shot/step of a
+sequence.
+
+find_work_files() picks the highest version of maya_shot_work for each
+shot and step on disk. WorkerPool starts as many mayapy processes as there
+are workers and feeds them one work file at a time: each worker opens the
+scene, starts tk-maya in the context of the file and runs the scan,
+secondary pre-publish and secondary publish hooks of tk-multi-publish, the
+same ones the Publish dialog runs, on every item of the secondary outputs.
+A mayapy process publishes file after file, so Maya and the engine are only
+started once per worker and not once per shot.
+
+Jobs go to the workers as JSON lines on their stdin and results come back
+as JSON lines on their stdout, behind RESULT_MARKER so they can be told
+from whatever Maya and the hooks print, which goes to a log per worker. A
+worker that dies takes only its current file with it, and is started again
+for the rest.
+
+batch_publish() does all of it for a sequence and writes the report, with
+the result and the seconds of every phase of every shot/step.
+"""
+
+import os
+import sys
+import json
+import time
+import threading
+import subprocess
+import multiprocessing
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+# path of mayapy, next to the running interpreter by default
+MAYAPY_ENV = "IKSVY_MAYAPY"
+
+# prefix of the result lines a worker prints
+RESULT_MARKER = "IKSVY_BATCH_RESULT "
+
+PUBLISH_APP = "tk-multi-publish"
+ENGINE_NAME = "tk-maya"
+
+# name -> tank_type of the secondary outputs of tk-multi-publish in env/shot_step.yml
+SECONDARY_OUTPUTS = {
+    "rendered_image": "Rendered Image",
+    "camera": "Camera",
+    "alembic_cache": "Alembic Cache",
+}
+
+# fields of maya_shot_work that vary inside a sequence
+_WORK_KEYS = ("Shot", "Step", "name", "version", "maya_extension")
+
+# started by WorkerPool with: mayapy -c WORKER_SCRIPT <config> <core python folder>
+WORKER_SCRIPT = ("import sys; sys.path.insert(0, %r); "
+                 "from iksvy_lib import batch_publish; batch_publish.worker_main(sys.argv[1:])")
+
+
+def default_workers():
+    """
+    :returns: The number of mayapy workers, one per core
+    """
+    try:
+        return multiprocessing.cpu_count()
+    except NotImplementedError:
+        return 1
+
+
+def find_mayapy():
+    """
+    :returns: IKSVY_MAYAPY, or the mayapy next to the running interpreter
+    """
+    if os.environ.get(MAYAPY_ENV):
+        return os.environ[MAYAPY_ENV]
+    name = "mayapy.exe" if sys.platform == "win32" else "mayapy"
+    return os.path.join(os.path.dirname(sys.executable), name)
+
+
+def _resolve_executable(path):
+    """
+    :returns: The path of an executable, looked up in PATH if it is only a
+              name, or None if it doesn't exist
+    """
+    if os.path.dirname(path):
+        return path if os.path.isfile(path) else None
+    for folder in os.environ.get("PATH", "").split(os.pathsep):
+        candidate = os.path.join(folder, path)
+        if os.path.isfile(candidate):
+            return candidate
+    return None
+
+
+def find_work_files(tk, sequence, work_template):
+    """
+    The latest work file of every shot and step of a sequence.
+
+    :param tk:            Sgtk API instance
+    :param sequence:      Code of the sequence
+    :param work_template: The maya_shot_work template
+    :returns:             List of dictionaries with the path, Shot, Step,
+                          name and version of each file, by shot and step
+    """
+    latest = {}
+    paths = tk.paths_from_template(work_template, {"Sequence": sequence}, skip_keys=list(_WORK_KEYS))
+    for path in paths:
+        fields = work_template.get_fields(path)
+        key = (fields["Shot"], fields["Step"])
+        # the highest version, and the newest file between names
+        rank = (fields["version"], os.path.getmtime(path))
+        if key not in latest or rank > latest[key][0]:
+            latest[key] = (rank, {
+                "path": path,
+                "Shot": fields["Shot"],
+                "Step": fields["Step"],
+                "name": fields.get("name"),
+                "version": fields["version"],
+            })
+    return [latest[key][1] for key in sorted(latest)]
+
+
+def find_published_versions(tk, sequence, secondary_outputs=SECONDARY_OUTPUTS):
+    """
+    The secondary outputs the shot/step versions of a sequence have been
+    published with already, from the GUI or from an earlier batch.
+
+    :param tk:                Sgtk API instance
+    :param sequence:          Code of the sequence
+    :param secondary_outputs: Dictionary of output name -> publish type
+    :returns:                 Set of (Shot, Step, version, output name)
+    """
+    outputs = dict((tank_type, name) for name, tank_type in secondary_outputs.items())
+    from iksvy_lib import context_cache
+
+    filters = [
+        ["project", "is", {"type": "Project", "id": tk.pipeline_configuration.get_project_id()}],
+        ["entity.Shot.sg_sequence.Sequence.code", "is", sequence],
+        ["published_file_type.PublishedFileType.code", "in", list(outputs)],
+    ]
+    publishes = tk.shotgun.find("PublishedFile", filters,
+                                ["entity", "version_number", "path", "published_file_type"])
+
+    # the step is the folder of the shot/step root the publish is under
+    cache = context_cache.get_cache(tk)
+    versions = set()
+    for publish in publishes:
+        local_path = (publish.get("path") or {}).get("local_path")
+        prefix = cache.prefix_for(local_path) if local_path else None
+        tank_type = (publish.get("published_file_type") or {}).get("name")
+        if prefix and publish.get("entity") and tank_type in outputs:
+            versions.add((publish["entity"]["name"], os.path.basename(prefix),
+                          publish["version_number"], outputs[tank_type]))
+    return versions
+
+
+class WorkerPool(object):
+    """
+    mayapy processes publishing one work file after another.
+    """
+
+    def __init__(self, command, workers=None, log_folder=None, env=None, log=None):
+        """
+        :param command:    Command line that starts a worker
+        :param workers:    Processes run at a time, one per core by default
+        :param log_folder: Folder for the output of each worker, which is
+                           dropped if None
+        :param env:        Environment of the workers, this one by default
+        :param log:        Called with a message when a worker dies
+        """
+        self.command = command
+        self.workers = workers or default_workers()
+        self.log_folder = log_folder
+        self.env = env
+        self.log = log
+
+    def run(self, jobs):
+        """
+        Publish all the jobs.
+
+        :param jobs: List of dictionaries for worker_main, each with the
+                     path of a work file
+        :returns:    List with the result of every job, in the same order
+        """
+        pending = queue.Queue()
+        for index, job in enumerate(jobs):
+            pending.put((index, job))
+        results = [None] * len(jobs)
+
+        threads = []
+        for number in range(min(self.workers, len(jobs))):
+            thread = threading.Thread(target=self._run_worker, args=(number, pending, results))
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join()
+        return results
+
+    def _start(self, number, log_file):
+        return subprocess.Popen(self.command, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                stderr=log_file or open(os.devnull, "w"), env=self.env,
+                                universal_newlines=True)
+
+    def _run_worker(self, number, pending, results):
+        """
+        Feed one worker process until there are no jobs left. Runs in a
+        thread of its own per worker.
+        """
+        log_file = None
+        if self.log_folder:
+            log_file = open(os.path.join(self.log_folder, "worker_%02d.log" % number), "w")
+        process = None
+        try:
+            while True:
+                try:
+                    index, job = pending.get_nowait()
+                except queue.Empty:
+                    break
+                start = time.time()
+                if process is None:
+                    try:
+                        process = self._start(number, log_file)
+                    except (IOError, OSError) as e:
+                        message = "Could not start %s: %s" % (self.command[0], e)
+                        if self.log:
+                            self.log("Publishing %s failed: %s" % (job["path"], message))
+                        results[index] = {"status": "failed", "errors": [message], "timings": {},
+                                          "path": job["path"], "worker": number, "seconds": 0.0}
+                        continue
+
+                result = None
+                try:
+                    process.stdin.write(json.dumps(job) + "\n")
+                    process.stdin.flush()
+                    result = self._read_result(process, log_file)
+                except (IOError, OSError):
+                    pass
+
+                if result is None:
+                    # the worker died with the file, the next one gets a new one
+                    process.wait()
+                    message = "mayapy exited with %s" % process.returncode
+                    if self.log:
+                        self.log("Publishing %s failed: %s" % (job["path"], message))
+                    result = {"status": "crashed", "errors": [message], "timings": {}}
+                    process = None
+
+                result.update({"path": job["path"], "worker": number,
+                               "seconds": time.time() - start})
+                results[index] = result
+        finally:
+            if process is not None:
+                # no more jobs: closing stdin ends the worker
+                process.stdin.close()
+                process.wait()
+            if log_file:
+                log_file.close()
+
+    def _read_result(self, process, log_file):
+        """
+        :returns: The result of the job the worker is on, or None if it died
+        """
+        while True:
+            line = process.stdout.readline()
+            if not line:
+                return None
+            if line.startswith(RESULT_MARKER):
+                return json.loads(line[len(RESULT_MARKER):])
+            if log_file:
+                log_file.write(line)
+                log_file.flush()
+
+
+def worker_main(args):
+    """
+    Entry point of a worker, in mayapy: publish the work files that come in
+    on stdin until it is closed.
+
+    :param args: The pipeline configuration and the folder of the Toolkit
+                 core python modules
+    """
+    config_path, core_python = args
+    if core_python not in sys.path:
+        sys.path.insert(0, core_python)
+
+    # whatever gets printed from here on goes to the worker log, stdout is
+    # kept for the results
+    results = sys.stdout
+    sys.stdout = sys.stderr
+
+    import maya.standalone
+    maya.standalone.initialize()
+    import sgtk
+
+    tk = sgtk.sgtk_from_path(config_path)
+    for line in iter(sys.stdin.readline, ""):
+        if not line.strip():
+            continue
+        job = json.loads(line)
+        try:
+            result = publish_work_file(tk, job)
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            result = {"status": "failed", "errors": [str(e)], "timings": {}}
+        results.write(RESULT_MARKER + json.dumps(result) + "\n")
+        results.flush()
+
+    engine = sgtk.platform.current_engine()
+    if engine is not None:
+        engine.destroy()
+
+
+def publish_work_file(tk, job):
+    """
+    Open a work file and publish its secondary outputs, as the Publish
+    dialog would with every item selected. Runs in a worker.
+
+    :param tk:  Sgtk API instance
+    :param job: Dictionary with the path of the work file, the comment, the
+                names of the outputs to publish (all of them if empty) and
+                whether to render the missing camera/layers first
+    :returns:   Dictionary with the status, the items published per output,
+                the errors and the seconds of every phase
+    """
+    import maya.cmds as cmds
+    from iksvy_lib import context_cache
+
+    timings = {}
+    start = time.time()
+    path = job["path"]
+    cmds.file(path, open=True, force=True, prompt=False)
+    timings["open"] = time.time() - start
+
+    phase = time.time()
+    context = context_cache.get_cache(tk).context_from_path(path)
+    engine = _engine_for(tk, context)
+    app = engine.apps[PUBLISH_APP]
+    if type(app).__name__ == "LazyApp":
+        # the stand-in of apps/tk-multi-lazyapp: the hooks need the real app
+        app = app.load()
+    timings["engine"] = time.time() - phase
+
+    # the scan hook reads it when it runs
+    os.environ["IKSVY_RENDER_AND_PUBLISH"] = "1" if job.get("render") else "0"
+
+    phase = time.time()
+    items = app.execute_hook("hook_scan_scene")
+    timings["scan"] = time.time() - phase
+
+    tasks = _tasks_from_items(app, items, job.get("outputs"))
+    published = {}
+    for task in tasks:
+        name = task["output"]["name"]
+        published[name] = published.get(name, 0) + 1
+    result = {"status": "ok", "items": published, "errors": [], "timings": timings}
+    if not tasks:
+        result["status"] = "nothing"
+        timings["total"] = time.time() - start
+        return result
+
+    work_template = app.get_template("template_work")
+    user_data = {}
+
+    phase = time.time()
+    pre_results = app.execute_hook("hook_secondary_pre_publish", tasks=tasks,
+                                   work_template=work_template, progress_cb=_progress,
+                                   user_data=user_data)
+    timings["pre_publish"] = time.time() - phase
+
+    # the pre publish hook reports every task, with no errors if it is fine
+    failed = [r for r in pre_results or [] if r.get("errors")]
+    for r in failed:
+        result["errors"].extend(_task_errors(r))
+    failed_tasks = [r["task"] for r in failed]
+    tasks = [task for task in tasks if task not in failed_tasks]
+
+    if tasks:
+        phase = time.time()
+        publish_results = app.execute_hook(
+            "hook_secondary_publish", tasks=tasks, work_template=work_template,
+            comment=job.get("comment", ""), thumbnail_path=None,
+            sg_task=context.task, primary_task=None,
+            primary_publish_path=_primary_publish_path(app, work_template, path),
+            progress_cb=_progress, user_data=user_data)
+        for r in publish_results or []:
+            result["errors"].extend(_task_errors(r))
+            failed_tasks.append(r["task"])
+        timings["publish"] = time.time() - phase
+
+    # the thumbnails and the render migrations finish in the background
+    phase = time.time()
+    from iksvy_lib import migration
+    from iksvy_lib import thumbnails
+    thumbnails.get_service().wait()
+    migration.get_service().wait()
+    timings["background"] = time.time() - phase
+
+    for task in failed_tasks:
+        published[task["output"]["name"]] -= 1
+    if result["errors"]:
+        result["status"] = "errors"
+    timings["total"] = time.time() - start
+    return result
+
+
+def _engine_for(tk, context):
+    """
+    :returns: tk-maya running in the context, started again if it is in
+              another one
+    """
+    import sgtk
+    engine = sgtk.platform.current_engine()
+    if engine is not None and engine.context == context:
+        return engine
+    if engine is not None:
+        engine.destroy()
+    return sgtk.platform.start_engine(ENGINE_NAME, tk, context)
+
+
+def _tasks_from_items(app, items, outputs=None):
+    """
+    The secondary publish tasks for the scanned items, every item with the
+    outputs of its type, as the Publish dialog builds them.
+
+    :param outputs: Names of the outputs to publish, all of them if empty
+    """
+    tasks = []
+    for output in app.get_setting("secondary_outputs"):
+        if outputs and output["name"] not in outputs:
+            continue
+        output = dict(output, publish_template=app.get_template_by_name(output["publish_template"]))
+        for item in items:
+            if item["type"] == output["scene_item_type"]:
+                tasks.append({"item": item, "output": output})
+    return tasks
+
+
+def _primary_publish_path(app, work_template, path):
+    """
+    :returns: The published scene of the work file if there is one, the work
+              file itself otherwise
+    """
+    publish_template = app.get_template("primary_publish_template")
+    publish_path = publish_template.apply_fields(work_template.get_fields(path))
+    if os.path.exists(publish_path):
+        return publish_path
+    return path
+
+
+def _task_errors(result):
+    task = result["task"]
+    return ["%s (%s): %s" % (task["item"]["name"], task["output"]["name"], error)
+            for error in result.get("errors") or []]
+
+
+def _progress(percentage, msg=None, stage=None):
+    if msg:
+        print("%3d%% %s" % (percentage, msg))
+
+
+def batch_publish(tk, sequence, mayapy=None, workers=None, outputs=None, comment="",
+                  render=False, republish=False, report_folder=None, log=None):
+    """
+    Publish the latest Maya work file of every shot/step of a sequence in a
+    pool of mayapy workers and write a report.
+
+    :param tk:            Sgtk API instance
+    :param sequence:      Code of the sequence
+    :param mayapy:        Path of mayapy, find_mayapy() by default
+    :param workers:       mayapy processes at a time, one per core by default
+    :param outputs:       Names of the secondary outputs to publish, all of
+                          them if empty
+    :param comment:       Comment of the publishes
+    :param render:        Render the missing camera/layers before publishing
+    :param republish:     Publish again the outputs a version has been
+                          published with already, which are left out
+                          otherwise
+    :param report_folder: Folder for the report and the worker logs,
+                          ~/.iksvy/batch_publish by default
+    :param log:           Called with progress messages
+    :returns:             Path of the report
+    """
+    import tank
+
+    log = log or (lambda message: None)
+    mayapy = _resolve_executable(mayapy or find_mayapy())
+    if mayapy is None:
+        raise ValueError("mayapy not found, set it in the app settings or in %s" % MAYAPY_ENV)
+
+    work_template = tk.templates["maya_shot_work"]
+    files = find_work_files(tk, sequence, work_template)
+    # publishing an output of a version again would export over its read
+    # only publishes and register them twice, the other outputs still go
+    published = set() if republish else find_published_versions(tk, sequence)
+    wanted = list(outputs or sorted(SECONDARY_OUTPUTS))
+    skipped = []
+    pending = []
+    for f in files:
+        done = [name for name in wanted if (f["Shot"], f["Step"], f["version"], name) in published]
+        f["outputs"] = [name for name in wanted if name not in done]
+        f["already_published"] = done
+        (pending if f["outputs"] else skipped).append(f)
+    files = pending
+    log("%d work files to publish in %s, %d already published" % (len(files), sequence, len(skipped)))
+
+    report_folder = report_folder or os.path.join(os.path.expanduser("~"), ".iksvy", "batch_publish")
+    stamp = time.strftime("%Y%m%d_%H%M%S")
+    log_folder = os.path.join(report_folder, "%s_%s" % (sequence, stamp))
+    if not os.path.isdir(log_folder):
+        os.makedirs(log_folder)
+
+    # the worker imports this module from the same hooks folder and the
+    # same core as this session
+    core_python = os.path.dirname(os.path.dirname(os.path.abspath(tank.__file__)))
+    hooks_folder = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    command = [mayapy, "-c", WORKER_SCRIPT % hooks_folder,
+               tk.pipeline_configuration.get_path(), core_python]
+
+    jobs = [{"path": f["path"], "comment": comment, "outputs": f["outputs"], "render": render}
+            for f in files]
+    start = time.time()
+    pool = WorkerPool(command, workers, log_folder=log_folder, log=log)
+    results = pool.run(jobs)
+    seconds = time.time() - start
+
+    shots = []
+    for f, result in zip(files, results):
+        # a job left without result by a worker thread that went down
+        result = result or {"status": "failed", "errors": ["No result from the worker"],
+                            "timings": {}, "seconds": 0.0}
+        shot = dict(f)
+        shot.update(result)
+        shots.append(shot)
+        log("%s %s v%03d: %s" % (f["Shot"], f["Step"], f["version"], result["status"]))
+    for f in skipped:
+        shot = dict(f, status="skipped", errors=[], timings={}, seconds=0.0)
+        shots.append(shot)
+    shots.sort(key=lambda shot: (shot["Shot"], shot["Step"]))
+
+    summary = {}
+    for shot in shots:
+        summary[shot["status"]] = summary.get(shot["status"], 0) + 1
+    report = {
+        "sequence": sequence,
+        "started": stamp,
+        "workers": pool.workers,
+        "seconds": seconds,
+        # seconds a single worker would have taken, against the wall clock
+        "worker_seconds": sum(shot["seconds"] for shot in shots),
+        "summary": summary,
+        "logs": log_folder,
+        "shots": shots,
+    }
+    report_path = os.path.join(report_folder, "%s_%s.json" % (sequence, stamp))
+    with open(report_path, "w") as fh:
+        json.dump(report, fh, indent=2, sort_keys=True)
+    log("Batch publish of %s done in %.0fs: %s. Report: %s" % (
+        sequence, seconds, ", ".join("%d %s" % (n, s) for s, n in sorted(summary.items())), report_path))
+    return report_path
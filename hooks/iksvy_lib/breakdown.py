@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Batched reference filtering for the breakdown scene operation hooks.
+
+A scene references the same few publishes many times (300 Alembic caches
+of 20 assets) next to plenty of files that aren't publishes at all (file
+textures). tk-multi-breakdown works out the template and the latest version
+of every reference the hook returns, one by one, so the hooks only return
+the references to a versioned publish, found with templates matched once
+per folder through the session's ContextCache.
+"""
+
+from . import context_cache
+
+
+def resolve_items(tk, items):
+    """
+    Work out the template and version of the file of every breakdown item.
+
+    :param tk:    Sgtk API instance
+    :param items: Breakdown items, dictionaries with at least "path"
+    :returns:     The items with a versioned template, each with "template",
+                  "fields" and "version" added
+    """
+    cache = context_cache.get_cache(tk)
+    resolved = []
+    fields_by_path = {}
+    for item in items:
+        path = item["path"]
+        if path not in fields_by_path:
+            template = cache.template_from_path(path)
+            fields = template.get_fields(path) if template else None
+            fields_by_path[path] = (template, fields)
+        template, fields = fields_by_path[path]
+        if not fields or "version" not in fields:
+            continue
+        item = dict(item)
+        item.update({"template": template, "fields": fields, "version": fields["version"]})
+        resolved.append(item)
+    return resolved
+
+
+def breakdown_items(tk, items):
+    """
+    Keep the references of a scene scan the breakdown can do something with.
+
+    :param tk:    Sgtk API instance
+    :param items: The references found in the scene, dictionaries with node,
+                  type and path
+    :returns:     The references to a versioned publish, in scan order, as
+                  they came in. The app resolves their template and latest
+                  version itself
+    """
+    return [dict((key, item[key]) for key in ("node", "type", "path"))
+            for item in resolve_items(tk, items)]
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Path to context and path to template resolution, cached per step folder.
+
+Every file of a shot or asset step lives under its @shot_root
+(sequences/{Sequence}/{Shot}/{Step}) or @asset_root
+(assets/{sg_asset_type}/{Asset}/{Step}) folder, and the schema has no
+folders below the step, so all the files under one such prefix share the
+same context. ContextCache resolves the context of a prefix once, keeps it
+in an in-process LRU and in a JSON file on the local disk, and hands it out
+for any path under that prefix from then on.
+"""
+
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+
+# first folder and number of folders of @shot_root and @asset_root in
+# core/templates.yml, below the project root
+ROOT_PREFIXES = (("sequences", 3), ("assets", 3))
+
+DEFAULT_MAX_ENTRIES = 256
+
+# contexts on disk older than this are resolved again
+DEFAULT_MAX_AGE = 7 * 24 * 3600
+
+
+class ContextCache(object):
+    """
+    Context and template of paths, resolved once per step folder.
+    """
+
+    def __init__(self, tk, cache_path=None, max_entries=DEFAULT_MAX_ENTRIES,
+                 max_age=DEFAULT_MAX_AGE):
+        """
+        :param tk:          Sgtk API instance
+        :param cache_path:  JSON file the contexts are kept in between
+                            sessions, None to only cache in memory
+        :param max_entries: Size of the in-process LRU
+        :param max_age:     Seconds a context on disk is trusted for
+        """
+        self._tk = tk
+        self._cache_path = cache_path
+        self._max_entries = max_entries
+        self._max_age = max_age
+        self._lock = threading.Lock()
+        self._contexts = OrderedDict()
+        self._templates = {}
+        self._disk = self._load()
+        self.lookups = 0
+
+    def prefix_for(self, path):
+        """
+        :returns: The @shot_root/@asset_root folder the path is in, or None
+        """
+        path = os.path.normpath(path)
+        for root in self._roots():
+            if not path.startswith(root + os.path.sep):
+                continue
+            parts = path[len(root) + 1:].split(os.path.sep)
+            for first, depth in ROOT_PREFIXES:
+                # the prefix plus at least one folder or file below it
+                if parts[0] == first and len(parts) > depth + 1:
+                    return os.path.join(root, *parts[:depth + 1])
+        return None
+
+    def context_from_path(self, path):
+        """
+        :returns: The context of the path, from the cache when another path
+                  of the same step folder was resolved before
+        """
+        prefix = self.prefix_for(path)
+        if prefix is None:
+            self.lookups += 1
+            return self._tk.context_from_path(path)
+
+        with self._lock:
+            context = self._contexts.pop(prefix, None)
+            if context is not None:
+                self._contexts[prefix] = context
+                return context
+
+        context = self._from_disk(prefix)
+        if context is None:
+            self.lookups += 1
+            context = self._tk.context_from_path(prefix)
+            self._to_disk(prefix, context)
+
+        with self._lock:
+            self._contexts[prefix] = context
+            while len(self._contexts) > self._max_entries:
+                self._contexts.popitem(last=False)
+        return context
+
+    def template_from_path(self, path):
+        """
+        :returns: The template matching the path, remembered for the folder
+                  and extension of the path
+        """
+        key = (os.path.dirname(path), os.path.splitext(path)[1])
+        with self._lock:
+            template = self._templates.get(key)
+        if template is not None and template.validate(path):
+            return template
+        template = self._tk.template_from_path(path)
+        if template is not None:
+            # a path matching nothing says nothing about the files next to
+            # it, only templates are remembered
+            with self._lock:
+                self._templates[key] = template
+        return template
+
+    def _roots(self):
+        roots = getattr(self._tk, "roots", None) or {}
+        return [os.path.normpath(root) for root in roots.values()] or [
+            os.path.normpath(self._tk.project_path)]
+
+    def _load(self):
+        if not self._cache_path:
+            return {}
+        try:
+            with open(self._cache_path) as fh:
+                return json.load(fh)
+        except (IOError, OSError, ValueError):
+            return {}
+
+    def _from_disk(self, prefix):
+        entry = self._disk.get(prefix)
+        if not entry or time.time() - entry["time"] > self._max_age:
+            return None
+        import tank
+        try:
+            return tank.context.deserialize(str(entry["context"]))
+        except Exception:
+            # written by another core version
+            return None
+
+    def _to_disk(self, prefix, context):
+        if not self._cache_path:
+            return
+        import tank
+        with self._lock:
+            self._disk[prefix] = {"time": time.time(), "context": tank.context.serialize(context)}
+            folder = os.path.dirname(self._cache_path)
+            try:
+                if not os.path.isdir(folder):
+                    os.makedirs(folder)
+                # write then rename, several sessions share the file
+                tmp_path = "%s.%d" % (self._cache_path, os.getpid())
+                with open(tmp_path, "w") as fh:
+                    json.dump(self._disk, fh)
+                os.rename(tmp_path, self._cache_path)
+            except (IOError, OSError):
+                pass
+
+
+_caches = {}
+
+
+def get_cache(tk, cache_folder=None):
+    """
+    :param tk:           Sgtk API instance
+    :param cache_folder: Folder for the on-disk cache, ~/.iksvy by default
+    :returns:            The ContextCache of the project of tk, shared by the
+                         whole session
+    """
+    key = os.path.normpath(tk.project_path)
+    if key not in _caches:
+        cache_folder = cache_folder or os.path.join(os.path.expanduser("~"), ".iksvy")
+        cache_path = os.path.join(cache_folder, "contexts_%s.json" % os.path.basename(key))
+        _caches[key] = ContextCache(tk, cache_path)
+    return _caches[key]
@@ -0,0 +1,346 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+File copy engine for the copy file hooks.
+
+Copies use the kernel zero-copy calls when the python running them has them
+(os.copy_file_range, os.sendfile) and fall back to a buffered copy. Files
+whose target already has the same size and modification time are skipped,
+and copy_files() spreads a batch of copies over a thread pool.
+
+publish_file() avoids copying altogether when it can, by cloning (reflink)
+the file when source and target share a filesystem, or hard linking it when
+the caller asks for it.
+"""
+
+import os
+import re
+import stat
+import time
+import errno
+import shutil
+import hashlib
+from multiprocessing.pool import ThreadPool
+
+DEFAULT_WORKERS = 8
+
+_CHUNK_SIZE = 8 * 1024 * 1024
+
+# ioctl request cloning a file on filesystems with copy on write (btrfs, xfs...)
+FICLONE = 0x40049409
+
+# publish methods returned by publish_file()
+REFLINK = "reflink"
+HARDLINK = "hardlink"
+COPY = "copy"
+
+# name.1001.exr, name_1001.dpx...
+_FRAME_RE = re.compile(r"^(?P<prefix>.*?)(?P<sep>[._])(?P<frame>\d+)(?P<ext>\.[^.]+)$")
+
+
+def ensure_folder(folder):
+    """
+    Create a folder open to everybody, like the default copy file hook does.
+
+    The umask is process wide, so rather than clearing it the folders created
+    are opened up with chmod. Call it from one thread only, see ensure_folders.
+    """
+    missing = []
+    parent = folder
+    while parent and not os.path.isdir(parent):
+        missing.append(parent)
+        parent = os.path.dirname(parent)
+    if not missing:
+        return
+    try:
+        os.makedirs(folder)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+    for created in reversed(missing):
+        os.chmod(created, 0o777)
+
+
+def ensure_folders(paths):
+    """
+    Create the folders of a batch of files before copying them in parallel.
+
+    :param paths: The file paths about to be written
+    """
+    for folder in sorted(set(os.path.dirname(path) for path in paths)):
+        ensure_folder(folder)
+
+
+def is_up_to_date(source_path, target_path):
+    """
+    :returns: True if the target exists with the size and mtime of the source
+    """
+    try:
+        source_stat = os.stat(source_path)
+        target_stat = os.stat(target_path)
+    except OSError:
+        return False
+    return (source_stat.st_size == target_stat.st_size and
+            int(source_stat.st_mtime) == int(target_stat.st_mtime))
+
+
+def file_hash(path):
+    """
+    :returns: The sha1 hex digest of a file
+    """
+    sha1 = hashlib.sha1()
+    with open(path, "rb") as fh:
+        chunk = fh.read(_CHUNK_SIZE)
+        while chunk:
+            sha1.update(chunk)
+            chunk = fh.read(_CHUNK_SIZE)
+    return sha1.hexdigest()
+
+
+def _copy_data(source_fh, target_fh, size):
+    """
+    Move size bytes between two open files, in the kernel when possible.
+    """
+    source_fd = source_fh.fileno()
+    target_fd = target_fh.fileno()
+    for name in ("copy_file_range", "sendfile"):
+        func = getattr(os, name, None)
+        if func is None:
+            continue
+        try:
+            copied = 0
+            while copied < size:
+                if name == "sendfile":
+                    sent = func(target_fd, source_fd, copied, min(_CHUNK_SIZE, size - copied))
+                else:
+                    sent = func(source_fd, target_fd, min(_CHUNK_SIZE, size - copied), copied, copied)
+                if not sent:
+                    break
+                copied += sent
+            if copied == size:
+                return
+        except OSError as e:
+            # not supported between these two filesystems, try the next way
+            if e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP):
+                raise
+        source_fh.seek(0)
+        target_fh.seek(0)
+        target_fh.truncate()
+    shutil.copyfileobj(source_fh, target_fh, _CHUNK_SIZE)
+
+
+def copy_file(source_path, target_path, verify=False):
+    """
+    Copy a file, keeping its permissions and times so the copy is later
+    recognised as up to date.
+
+    :param source_path: File to copy
+    :param target_path: Where to copy it to
+    :param verify:      Compare the sha1 of source and target after the copy
+    :returns:           The number of bytes copied
+    :raises IOError:    If verify is on and the checksums don't match
+    """
+    size = os.path.getsize(source_path)
+    with open(source_path, "rb") as source_fh:
+        with open(target_path, "wb") as target_fh:
+            _copy_data(source_fh, target_fh, size)
+    shutil.copystat(source_path, target_path)
+
+    if verify and file_hash(source_path) != file_hash(target_path):
+        raise IOError("Checksum mismatch copying '%s' to '%s'" % (source_path, target_path))
+    return size
+
+
+def _copy_job(args):
+    """
+    Copy one file unless it is up to date. Runs in the pool threads.
+    """
+    source_path, target_path, verify = args
+    if is_up_to_date(source_path, target_path):
+        return 0, True
+    return copy_file(source_path, target_path, verify), False
+
+
+def copy_files(pairs, workers=DEFAULT_WORKERS, verify=False):
+    """
+    Copy a batch of files in parallel, skipping the ones already up to date.
+
+    :param pairs:   List of (source_path, target_path)
+    :param workers: Number of copy threads
+    :param verify:  Check the sha1 of every file copied
+    :returns:       Dictionary with the number of files copied and skipped,
+                    the bytes copied, the seconds it took and the throughput
+                    in MB/s
+    """
+    start = time.time()
+    jobs = [(source, target, verify) for source, target in pairs]
+    ensure_folders([target for _, target in pairs])
+    if workers > 1 and len(jobs) > 1:
+        pool = ThreadPool(min(workers, len(jobs)))
+        try:
+            results = pool.map(_copy_job, jobs)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [_copy_job(job) for job in jobs]
+    seconds = time.time() - start
+
+    copied_bytes = sum(size for size, _ in results)
+    skipped = len([skip for _, skip in results if skip])
+    return {
+        "copied": len(results) - skipped,
+        "skipped": skipped,
+        "bytes": copied_bytes,
+        "seconds": seconds,
+        "mb_per_s": (copied_bytes / (1024.0 * 1024.0)) / seconds if seconds else 0.0,
+    }
+
+
+def sequence_pairs(source_path, target_path):
+    """
+    Find every frame of the sequence a source frame belongs to, together
+    with the path it should be copied to.
+
+    The target is worked out by putting each frame number in the target
+    path, so both paths must end with the same frame number.
+
+    :param source_path: A frame of the source sequence
+    :param target_path: Where that frame is copied to
+    :returns:           List of (source_path, target_path) for all the frames
+                        of the sequence, or None if the paths aren't frames
+    """
+    source_dir, source_name = os.path.split(source_path)
+    target_dir, target_name = os.path.split(target_path)
+    source_match = _FRAME_RE.match(source_name)
+    target_match = _FRAME_RE.match(target_name)
+    if not source_match or not target_match:
+        return None
+    if source_match.group("frame") != target_match.group("frame"):
+        return None
+
+    padding = len(source_match.group("frame"))
+    frame_re = re.compile("^%s%s(\\d{%d})%s$" % (
+        re.escape(source_match.group("prefix")), re.escape(source_match.group("sep")),
+        padding, re.escape(source_match.group("ext"))))
+    target_pattern = "%s%s%%s%s" % (
+        target_match.group("prefix"), target_match.group("sep"), target_match.group("ext"))
+
+    pairs = []
+    for name in sorted(os.listdir(source_dir)):
+        match = frame_re.match(name)
+        if match:
+            pairs.append((os.path.join(source_dir, name),
+                          os.path.join(target_dir, target_pattern % match.group(1))))
+    return pairs
+
+
+def same_filesystem(source_path, target_folder):
+    """
+    :returns: True if the file and the folder are on the same filesystem
+    """
+    return os.stat(source_path).st_dev == os.stat(target_folder).st_dev
+
+
+def reflink(source_path, target_path):
+    """
+    Clone a file, the clone shares its data blocks with the source until
+    either of them is modified.
+
+    :raises OSError, IOError: If the platform or filesystem can't clone files
+    """
+    import fcntl
+    with open(source_path, "rb") as source_fh:
+        with open(target_path, "wb") as target_fh:
+            fcntl.ioctl(target_fh.fileno(), FICLONE, source_fh.fileno())
+
+
+def copy_file_checked(source_path, target_path):
+    """
+    Copy a file in chunks, hashing the data on the way, and check the target
+    read back from disk has the same checksum.
+
+    :returns:        The sha1 of the file
+    :raises IOError: If the checksums don't match
+    """
+    sha1 = hashlib.sha1()
+    with open(source_path, "rb") as source_fh:
+        with open(target_path, "wb") as target_fh:
+            chunk = source_fh.read(_CHUNK_SIZE)
+            while chunk:
+                sha1.update(chunk)
+                target_fh.write(chunk)
+                chunk = source_fh.read(_CHUNK_SIZE)
+    shutil.copystat(source_path, target_path)
+
+    digest = sha1.hexdigest()
+    if file_hash(target_path) != digest:
+        raise IOError("Checksum mismatch copying '%s' to '%s'" % (source_path, target_path))
+    return digest
+
+
+def make_read_only(path):
+    """
+    Remove the write permissions of a file for everybody.
+    """
+    mode = os.stat(path).st_mode
+    os.chmod(path, mode & ~(stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH))
+
+
+def _remove(path):
+    if os.path.lexists(path):
+        os.remove(path)
+
+
+def publish_file(source_path, target_path, allow_hardlink=False):
+    """
+    Put a copy of a file at its publish location and make it read only,
+    without copying the data when the filesystem allows it.
+
+    On the same filesystem the file is cloned or, failing that and only if
+    asked to, hard linked. Hard links are off by default: a hard link shares
+    its inode, and so its permissions, with the source, and making the publish
+    read only makes the work file read only too.
+
+    Anywhere else the file is copied in chunks and checked with a sha1.
+
+    :param source_path:    File to publish
+    :param target_path:    Publish path
+    :param allow_hardlink: Use a hard link when the file can't be cloned,
+                           instead of a checked copy
+    :returns:              The method used, one of REFLINK, HARDLINK or COPY
+    """
+    target_folder = os.path.dirname(target_path)
+    ensure_folder(target_folder)
+    # a previous, failed, publish of the same version
+    _remove(target_path)
+
+    method = COPY
+    if same_filesystem(source_path, target_folder):
+        try:
+            reflink(source_path, target_path)
+            shutil.copystat(source_path, target_path)
+            method = REFLINK
+        except (IOError, OSError, ImportError):
+            _remove(target_path)
+            if allow_hardlink and hasattr(os, "link"):
+                try:
+                    os.link(source_path, target_path)
+                    method = HARDLINK
+                except OSError:
+                    _remove(target_path)
+
+    if method == COPY:
+        copy_file_checked(source_path, target_path)
+
+    make_read_only(target_path)
+    return method
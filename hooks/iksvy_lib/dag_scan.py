@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Single pass over the Maya DAG for the scan scene hook.
+
+The scan needs three things from the DAG: whether there is any geometry,
+the perspective cameras and the top level groups holding meshes. Asking
+maya.cmds for each of them walks the DAG once for the geometry, once for
+the cameras and once more per top level group, and builds a list of names
+every time. scan_dag() gets the three of them with one MItDag iteration,
+only making strings for the cameras and groups it returns.
+"""
+
+from collections import namedtuple
+
+# has_geometry: True if there is any non intermediate geometry shape
+# cameras:      the transforms of the perspective cameras, as listCameras
+#               names them, in DAG order
+# mesh_groups:  the long names of the top level groups with meshes below,
+#               in DAG order
+DagScan = namedtuple("DagScan", ["has_geometry", "cameras", "mesh_groups"])
+
+
+def scan_dag():
+    """
+    Classify the whole DAG in one depth first iteration.
+
+    :returns: A DagScan
+    """
+    import maya.OpenMaya as OpenMaya
+
+    has_geometry = False
+    cameras = []
+    seen_cameras = set()
+    mesh_groups = []
+
+    # the top level group being walked and whether a mesh was found under it
+    group = None
+    group_has_mesh = False
+
+    dag_node = OpenMaya.MFnDagNode()
+    path = OpenMaya.MDagPath()
+    dag_iter = OpenMaya.MItDag(OpenMaya.MItDag.kDepthFirst, OpenMaya.MFn.kInvalid)
+    while not dag_iter.isDone():
+        depth = dag_iter.depth()
+        if depth == 1:
+            # depth first: every node until the next top level one is below it
+            if group_has_mesh:
+                mesh_groups.append(group)
+            dag_iter.getPath(path)
+            group = path.fullPathName()
+            group_has_mesh = False
+
+        elif depth > 1:
+            node = dag_iter.currentItem()
+            if node.hasFn(OpenMaya.MFn.kMesh):
+                # intermediate meshes count, like in cmds.ls(dag=True, type="mesh")
+                group_has_mesh = True
+
+            if not has_geometry and node.hasFn(OpenMaya.MFn.kGeometric):
+                dag_node.setObject(node)
+                has_geometry = not dag_node.isIntermediateObject()
+
+            if node.hasFn(OpenMaya.MFn.kCamera) and not OpenMaya.MFnCamera(node).isOrtho():
+                dag_iter.getPath(path)
+                path.pop()
+                # instanced cameras are visited once per instance
+                camera = path.partialPathName()
+                if camera not in seen_cameras:
+                    seen_cameras.add(camera)
+                    cameras.append(camera)
+
+        dag_iter.next()
+
+    if group_has_mesh:
+        mesh_groups.append(group)
+
+    return DagScan(has_geometry, cameras, mesh_groups)
@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Fingerprints of the deforming geometry of a mesh group.
+
+mesh_group_fingerprint() hashes everything the Alembic export of a group
+depends on: the topology, UVs and rest points of its meshes, the sets their
+faces are in (shading groups and face sets), their transforms, and every
+node upstream of them (rigs, deformers, constraints) with its settable
+values and, for animation curves, all their keys and tangents. The per
+vertex data of the deformers (skin weights, tweaks, deformer weights) is
+hashed for the nodes of the scene itself, and through the file they come
+from for referenced ones. Two publishes with the same fingerprint export the
+same Alembic, so the second one can reuse the file of the first instead of
+baking it again.
+
+Nodes whose output can't be told from their attributes (simulations,
+expressions, caches read from disk) make the group unfingerprintable, and
+it is always exported.
+"""
+
+import os
+import json
+import array
+import hashlib
+
+# upstream nodes that make a fingerprint meaningless
+VOLATILE_NODE_TYPES = set([
+    "expression", "script",
+    "nucleus", "nCloth", "nRigid", "hairSystem", "follicle", "particle", "nParticle",
+    "cacheFile", "AlembicNode", "gpuCache", "mtoa_standin",
+])
+
+# attributes that change all the time without changing the geometry
+_IGNORED_ATTRIBUTES = set(["isHistoricallyInteresting", "nodeState", "caching", "frozen"])
+
+# upstream nodes with nothing to hash: their output only depends on the frame
+_IGNORED_NODE_TYPES = set(["time"])
+
+
+def fingerprint_path(abc_path):
+    """
+    :returns: The sidecar file recording the fingerprint of an exported .abc
+    """
+    return abc_path + ".fingerprint"
+
+
+def read_fingerprint(abc_path):
+    """
+    :returns: The fingerprint recorded for an .abc, or None
+    """
+    try:
+        with open(fingerprint_path(abc_path)) as fh:
+            return json.load(fh).get("fingerprint")
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def write_fingerprint(abc_path, fingerprint, reused_from=None):
+    with open(fingerprint_path(abc_path), "w") as fh:
+        json.dump({"fingerprint": fingerprint, "reused_from": reused_from}, fh)
+
+
+def _attribute_values(cmds, node, frame):
+    # every scalar attribute, plus the keyable elements of arrays like the
+    # blend shape weights. Per vertex arrays (skin weights, tweaks) are
+    # hashed apart, see _component_values
+    attrs = set(cmds.listAttr(node, scalar=True, settable=True) or [])
+    attrs.update(cmds.listAttr(node, scalar=True, keyable=True, multi=True) or [])
+    values = []
+    for attr in sorted(attrs - _IGNORED_ATTRIBUTES):
+        try:
+            # read at a fixed frame, animated values depend on the current one
+            values.append((attr, cmds.getAttr("%s.%s" % (node, attr), time=frame)))
+        except (RuntimeError, ValueError):
+            # compound children and message attributes
+            pass
+    return values
+
+
+def _reference_file(cmds, node):
+    """
+    :returns: The file a referenced node comes from with its size and mtime,
+              so an updated rig changes the fingerprint
+    """
+    if not cmds.referenceQuery(node, isNodeReferenced=True):
+        return None
+    path = cmds.referenceQuery(node, filename=True, withoutCopyNumber=True)
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return path, None, None
+    return path, stat.st_size, int(stat.st_mtime)
+
+
+def _packed(typecode, values):
+    """
+    :returns: The bytes of a list of numbers, much cheaper to hash than repr
+    """
+    packed = array.array(typecode, values)
+    return packed.tobytes() if hasattr(packed, "tobytes") else packed.tostring()
+
+
+def _mesh_data(mesh, with_points):
+    """
+    :param mesh:        Long name of a mesh shape
+    :param with_points: Whether to read the vertex positions too
+    :returns:           Topology, UVs and, if asked, points of the mesh as
+                        bytes, read through the API
+    """
+    import maya.api.OpenMaya as om
+
+    selection = om.MSelectionList()
+    selection.add(mesh)
+    fn_mesh = om.MFnMesh(selection.getDagPath(0))
+
+    counts, connects = fn_mesh.getVertices()
+    data = [_packed("i", counts), _packed("i", connects)]
+    for uv_set in sorted(fn_mesh.getUVSetNames()):
+        us, vs = fn_mesh.getUVs(uv_set)
+        uv_counts, uv_ids = fn_mesh.getAssignedUVs(uv_set)
+        data.extend([uv_set.encode("utf-8"), _packed("f", us), _packed("f", vs),
+                     _packed("i", uv_counts), _packed("i", uv_ids)])
+    if with_points:
+        points = fn_mesh.getPoints(om.MSpace.kObject)
+        data.append(_packed("d", [c for point in points for c in (point.x, point.y, point.z)]))
+    return b"".join(data)
+
+
+def _skin_weights(cmds, skin):
+    """
+    :returns: The influences of a skinCluster and its weights on every
+              geometry it deforms, as bytes
+    """
+    import maya.api.OpenMaya as om
+    import maya.api.OpenMayaAnim as oma
+
+    selection = om.MSelectionList()
+    selection.add(skin)
+    fn_skin = oma.MFnSkinCluster(selection.getDependNode(0))
+
+    data = [repr(cmds.skinCluster(skin, query=True, influence=True) or []).encode("utf-8")]
+    for index in range(fn_skin.numOutputConnections()):
+        path = fn_skin.getPathAtIndex(fn_skin.indexForOutputConnection(index))
+        if not path.hasFn(om.MFn.kMesh):
+            # the weights of other geometry are hashed through the attributes
+            data.append(repr(cmds.getAttr("%s.weightList" % skin)).encode("utf-8"))
+            continue
+        fn_component = om.MFnSingleIndexedComponent()
+        component = fn_component.create(om.MFn.kMeshVertComponent)
+        fn_component.setCompleteData(om.MFnMesh(path).numVertices)
+        weights, _ = fn_skin.getWeights(path, component)
+        data.append(_packed("d", weights))
+    return b"".join(data)
+
+
+def _component_values(cmds, node):
+    """
+    :returns: The per vertex data of a deformer (weights, tweaks, blend
+              weights): every element of its array attributes
+    """
+    if cmds.nodeType(node) == "skinCluster":
+        values = [_skin_weights(cmds, node)]
+        skipped = "weightList"
+    else:
+        values = []
+        skipped = None
+    for attr in cmds.listAttr(node, multi=True) or []:
+        if skipped and attr.startswith(skipped):
+            continue
+        try:
+            values.append((attr, cmds.getAttr("%s.%s" % (node, attr))))
+        except (RuntimeError, ValueError):
+            # compound elements, their children are listed too
+            pass
+    return values
+
+
+def _set_members(cmds, meshes, transforms):
+    """
+    :returns: The sets the meshes or their faces are in (shading groups,
+              face sets, deformer sets) with the members of the group in each
+    """
+    nodes = set(meshes) | set(transforms)
+    sets = set()
+    for mesh in meshes:
+        sets.update(cmds.listSets(object=mesh) or [])
+    members = []
+    for object_set in sorted(sets):
+        in_group = [member for member in cmds.ls(cmds.sets(object_set, query=True) or [], long=True)
+                    if member.split(".", 1)[0] in nodes]
+        members.append((object_set, cmds.nodeType(object_set), sorted(in_group)))
+    return members
+
+
+def _anim_curve_keys(cmds, curve):
+    keys = cmds.keyframe(curve, query=True, timeChange=True, valueChange=True) or []
+    tangents = cmds.keyTangent(curve, query=True, inAngle=True, outAngle=True,
+                               inWeight=True, outWeight=True,
+                               inTangentType=True, outTangentType=True) or []
+    return keys, tangents
+
+
+def mesh_group_fingerprint(group, frame, extra=None):
+    """
+    Hash the deformation relevant state of a mesh group.
+
+    :param group: Long name of the group
+    :param frame: Frame the attribute values are read at, e.g. the first
+                  exported frame
+    :param extra: Anything else the export depends on, e.g. frame range and
+                  AbcExport flags
+    :returns:     Hex digest, or None if the group depends on something that
+                  can't be fingerprinted
+    """
+    import maya.cmds as cmds
+
+    digest = hashlib.sha1(json.dumps(extra, sort_keys=True).encode("utf-8"))
+
+    def add(*values):
+        digest.update(repr(values).encode("utf-8"))
+
+    meshes = cmds.ls(group, dag=True, long=True, type="mesh") or []
+    transforms = cmds.ls(group, dag=True, long=True, type="transform") or []
+
+    # topology and UVs of every mesh, and the rest shape: the points of the
+    # intermediate (orig) shape of deformed meshes, of the mesh itself otherwise
+    intermediates = set(mesh for mesh in meshes
+                        if cmds.getAttr("%s.intermediateObject" % mesh))
+    deformed = set(mesh.rsplit("|", 1)[0] for mesh in intermediates)
+    for mesh in sorted(meshes):
+        rest_shape = mesh in intermediates or mesh.rsplit("|", 1)[0] not in deformed
+        add(mesh, mesh in intermediates)
+        digest.update(_mesh_data(mesh, rest_shape))
+
+    # shading group and face set assignments, written by -writeFaceSets
+    add(_set_members(cmds, meshes, transforms))
+
+    for transform in sorted(transforms):
+        add(transform, cmds.getAttr("%s.matrix" % transform, time=frame),
+            cmds.getAttr("%s.visibility" % transform, time=frame))
+
+    # everything upstream: rig, deformers, constraints, animation
+    history = cmds.ls(cmds.listHistory(meshes + transforms, pruneDagObjects=False) or [],
+                      long=True) or []
+    reference_files = set()
+    for node in sorted(set(history) - set(meshes) - set(transforms)):
+        node_type = cmds.nodeType(node)
+        if node_type in VOLATILE_NODE_TYPES:
+            return None
+        if node_type in _IGNORED_NODE_TYPES:
+            continue
+        if cmds.objectType(node, isAType="animCurve"):
+            add(node, node_type, _anim_curve_keys(cmds, node))
+        else:
+            add(node, node_type, _attribute_values(cmds, node, frame))
+        reference_file = _reference_file(cmds, node)
+        if reference_file is None and cmds.objectType(node, isAType="geometryFilter"):
+            # painted weights and tweaks of the scene's own deformers, those
+            # of referenced ones come with the rig file
+            add(node, _component_values(cmds, node))
+        reference_files.add(reference_file)
+    add(sorted(reference_files - set([None])))
+
+    return digest.hexdigest()
@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Hiero export tasks sending the plate and render transcodes of the exported
+shots to a transcoding.TranscodePool.
+
+install() swaps the transcode tasks of a shot processor's export template
+for a single QueuedTranscodePreset. Hiero then creates a QueuedTranscodeTask
+for every track item it exports, so the shots transcoded are exactly the
+ones of the export. The first task started sends all of them to the pool,
+and every task follows its shot until the pool is done with it.
+
+Only for Nuke Studio/Hiero: this module imports hiero.
+"""
+
+import threading
+
+import hiero.core
+from hiero.exporters import FnTranscodeExporter
+
+from . import transcoding
+
+# the pools still transcoding, so they can be waited on
+_pools = []
+_pools_lock = threading.Lock()
+
+
+def running_pools():
+    """
+    :returns: The TranscodePools still running
+    """
+    with _pools_lock:
+        return list(_pools)
+
+
+def one_item_per_shot(items, log=None):
+    """
+    A shot on several tracks (plate plus reference layers) would start
+    several transcodes writing the same files: keep the item on the lowest
+    track, the plate.
+
+    :param items: The track items exported
+    :param log:   Called with a message for every item left out
+    :returns:     The items to transcode, in the order given
+    """
+    shots = {}
+    for item in sorted(items, key=lambda item: item.parentTrack().trackIndex()):
+        if item.name() in shots:
+            if log:
+                log("Skipping %s on track %s, already on track %s" % (
+                    item.name(), item.parentTrack().name(), shots[item.name()].parentTrack().name()))
+            continue
+        shots[item.name()] = item
+    return [item for item in items if shots[item.name()] is item]
+
+
+class _Export(object):
+    """
+    The shots of one export, and the pool transcoding them.
+    """
+
+    def __init__(self, make_job, executable, workers, log_info, log_error):
+        self.make_job = make_job
+        self.executable = executable
+        self.workers = workers
+        self.log_info = log_info
+        self.log_error = log_error
+        self.pool = None
+        self._items = []
+        self._started = False
+        self._lock = threading.Lock()
+
+    def add(self, item):
+        self._items.append(item)
+
+    def start(self):
+        """
+        Send the shots of the export to a pool, the first time only. Every
+        task has been created by then, so every item is known.
+        """
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+            jobs = [self.make_job(item) for item in one_item_per_shot(self._items, self.log_info)]
+            pending = [job for job in jobs if not transcoding.is_complete(job)]
+            self.log_info("Transcoding %d shots, %d already up to date." % (
+                len(pending), len(jobs) - len(pending)))
+            if not pending:
+                return
+            self.pool = transcoding.TranscodePool(
+                self.executable, self.workers, self._progress, self._finished)
+            with _pools_lock:
+                _pools.append(self.pool)
+            self.pool.submit(pending)
+
+    def is_done(self, shot):
+        """
+        :returns: True once the pool is done with a shot, or isn't going to
+                  transcode it
+        """
+        if self.pool is None or not self.pool.is_running():
+            return True
+        return self.pool.summary().get(shot, {}).get("state") != transcoding.PENDING
+
+    def _progress(self, shot, state, done, total):
+        self.log_info("Transcode %d/%d: %s %s" % (done, total, shot, state))
+        if state == transcoding.FAILED:
+            self.log_error("Transcode of %s failed:\n%s" % (shot, self.pool.status[shot]["error"]))
+
+    def _finished(self, pool):
+        with _pools_lock:
+            if pool in _pools:
+                _pools.remove(pool)
+
+
+class QueuedTranscodeTask(hiero.core.TaskBase):
+    """
+    Export task of a track item whose transcodes run on the pool of its
+    export.
+    """
+
+    def __init__(self, initDict):
+        hiero.core.TaskBase.__init__(self, initDict)
+        self._export = self._preset.export
+        self._export.add(self._item)
+
+    def startTask(self):
+        self._export.start()
+
+    def taskStep(self):
+        # polled by the export queue until it returns False
+        return not self._export.is_done(self._item.name())
+
+    def progress(self):
+        return 1.0 if self._export.is_done(self._item.name()) else 0.0
+
+
+class QueuedTranscodePreset(hiero.core.TaskPresetBase):
+    """
+    Preset of the QueuedTranscodeTasks of an export. Made by install(),
+    with the export they belong to.
+    """
+
+    def __init__(self, name, properties, export=None):
+        hiero.core.TaskPresetBase.__init__(self, QueuedTranscodeTask, name)
+        self.properties().update(properties)
+        self.export = export
+
+    def supportedItems(self):
+        return hiero.core.TaskPresetBase.kTrackItem
+
+
+hiero.core.taskRegistry.registerTask(QueuedTranscodePreset, QueuedTranscodeTask)
+
+
+def install(processor, make_job, executable, workers=None, log_info=None, log_error=None):
+    """
+    Replace the transcode tasks of a shot processor about to export with
+    QueuedTranscodeTasks.
+
+    :param processor:  The shot processor, before it starts processing
+    :param make_job:   Called with a track item, returns its ShotJob
+    :param executable: The Nuke executable used to transcode
+    :param workers:    Number of Nuke processes, the CPU count by default
+    :param log_info:   Called with progress messages
+    :param log_error:  Called with the error of every failed shot
+    :returns:          The transcode presets taken out of the export
+    """
+    template = processor._exportTemplate.flatten()
+    if not template:
+        return []
+    removed = [(path, preset) for path, preset in template
+               if isinstance(preset, FnTranscodeExporter.TranscodePreset)]
+    kept = [(path, preset) for path, preset in template
+            if not isinstance(preset, FnTranscodeExporter.TranscodePreset)]
+
+    noop = lambda msg: None
+    export = _Export(make_job, executable, workers, log_info or noop, log_error or noop)
+    # the task writes nothing itself, any path of the template will do
+    path = removed[0][0] if removed else template[0][0]
+    processor._exportTemplate.restore(
+        kept + [(path, QueuedTranscodePreset("Queued transcode", {}, export))])
+    return [preset for _, preset in removed]
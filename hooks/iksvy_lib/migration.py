@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Migration of published renders from the scratch root to the primary root.
+
+Renders land on the 'scratch' storage root (fast local disks) and Maya
+publishes them in place. MigrationService then moves the frames of each
+publish, in the background, to the same relative path under the 'primary'
+root (bulk storage):
+
+1. every frame is copied next to its primary path and checked against the
+   sha1 the publish manifest recorded for it, then renamed into place;
+2. the PublishedFile is pointed at the primary copy;
+3. only then are the scratch frames removed, and replaced by links to the
+   primary ones where the platform has them.
+
+The PublishedFile so always points at a complete sequence, on scratch until
+the last frame is verified on primary. A migration that fails, or that the
+session quits before finishing, leaves the publish on scratch untouched.
+"""
+
+import os
+import json
+import threading
+from multiprocessing.pool import ThreadPool
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from . import copying
+
+SCRATCH_ROOT = "scratch"
+PRIMARY_ROOT = "primary"
+
+DEFAULT_WORKERS = 4
+
+# suffix of the frames being copied, they are renamed once verified
+_PARTIAL_SUFFIX = ".migrating"
+
+
+def primary_path(path, roots):
+    """
+    :param path:  A path, abstract (%04d) or not
+    :param roots: The storage roots of the project, name -> path
+    :returns:     The same path under the primary root, or None if the path
+                  isn't on the scratch root or both roots are the same folder
+    """
+    scratch = roots.get(SCRATCH_ROOT)
+    primary = roots.get(PRIMARY_ROOT)
+    if not scratch or not primary:
+        return None
+    scratch = os.path.normpath(scratch)
+    if scratch == os.path.normpath(primary):
+        return None
+    path = os.path.normpath(path)
+    if not path.startswith(scratch + os.path.sep):
+        return None
+    return os.path.join(os.path.normpath(primary), path[len(scratch) + 1:])
+
+
+def _migrate_frame(args):
+    """
+    Copy one frame to its primary path and check it. Runs in the pool threads.
+    """
+    source_path, target_path, expected_sha1 = args
+    partial_path = target_path + _PARTIAL_SUFFIX
+    try:
+        digest = copying.copy_file_checked(source_path, partial_path)
+        if expected_sha1 and digest != expected_sha1:
+            raise IOError("'%s' changed since it was published" % source_path)
+        if os.path.exists(target_path):
+            os.remove(target_path)
+        os.rename(partial_path, target_path)
+    finally:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+    return os.path.getsize(target_path)
+
+
+def copy_frames(pairs, manifest=None, workers=DEFAULT_WORKERS):
+    """
+    Copy frames to the primary root, verifying every copy.
+
+    :param pairs:    List of (scratch path, primary path)
+    :param manifest: The manifest of the publish, file name -> {sha1, ...},
+                     the copies are checked against it when given
+    :param workers:  Number of copy threads
+    :returns:        The number of bytes copied
+    :raises IOError: If a frame doesn't match its manifest checksum
+    """
+    manifest = manifest or {}
+    jobs = [(source, target, manifest.get(os.path.basename(source), {}).get("sha1"))
+            for source, target in pairs]
+    copying.ensure_folders([target for _, target in pairs])
+    if workers > 1 and len(jobs) > 1:
+        pool = ThreadPool(min(workers, len(jobs)))
+        try:
+            sizes = pool.map(_migrate_frame, jobs)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        sizes = [_migrate_frame(job) for job in jobs]
+    return sum(sizes)
+
+
+def release_scratch(pairs, link=True, log=None):
+    """
+    Remove the scratch copy of migrated frames.
+
+    :param pairs: List of (scratch path, primary path)
+    :param link:  Leave a link to the primary frame in place of each scratch
+                  frame, so scripts still reading the scratch paths work
+    :param log:   Called with a message for each link that couldn't be made
+    """
+    for source, target in pairs:
+        os.remove(source)
+        if link and hasattr(os, "symlink"):
+            try:
+                os.symlink(target, source)
+            except OSError as e:
+                # the frame is safe on primary, only the scratch path is gone
+                if log:
+                    log("Could not link %s to %s, scripts reading the scratch path won't find it: %s" % (
+                        source, target, e))
+
+
+def _read_manifest(manifest_path):
+    try:
+        with open(manifest_path) as fh:
+            return json.load(fh).get("manifest")
+    except (IOError, OSError, ValueError):
+        return None
+
+
+class MigrationService(object):
+    """
+    Migrates published sequences on a worker thread, one at a time, in the
+    order they were submitted.
+    """
+
+    def __init__(self, workers=DEFAULT_WORKERS, link=True):
+        self.workers = workers
+        self.link = link
+        self._jobs = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, entity, sequence_path, frame_paths, roots, update,
+               manifest_path=None, log=None):
+        """
+        Queue the migration of a published sequence.
+
+        :param entity:        The PublishedFile entity dictionary
+        :param sequence_path: The abstract (%04d) path it was published with
+        :param frame_paths:   The paths of its frames
+        :param roots:         The storage roots of the project, name -> path
+        :param update:        Called on the worker thread with (entity,
+                              primary sequence path, primary manifest path)
+                              once every frame is on primary, to point the
+                              publish at them
+        :param manifest_path: The checksum manifest of the sequence
+        :param log:           Called with a message when the migration fails,
+                              or a scratch frame couldn't be linked to primary
+        :returns:             False if the sequence isn't on the scratch root
+        """
+        target_path = primary_path(sequence_path, roots)
+        if target_path is None:
+            return False
+        pairs = [(path, primary_path(path, roots)) for path in frame_paths]
+        self._jobs.put((entity, target_path, pairs, manifest_path, roots, update, log))
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run)
+                self._thread.daemon = True
+                self._thread.start()
+        return True
+
+    def wait(self):
+        """
+        Block until every queued sequence has been migrated.
+        """
+        self._jobs.join()
+
+    def _run(self):
+        while True:
+            # the worker stops once there is nothing left to do, under the
+            # lock so a job submitted meanwhile starts a new one
+            with self._lock:
+                try:
+                    job = self._jobs.get_nowait()
+                except queue.Empty:
+                    self._thread = None
+                    return
+            entity, target_path, pairs, manifest_path, roots, update, log = job
+            try:
+                self._migrate(entity, target_path, pairs, manifest_path, roots, update, log)
+            except Exception as e:
+                if log:
+                    log("Migration of %s %s to the primary root failed, it stays on scratch: %s" % (
+                        entity["type"], entity["id"], e))
+            finally:
+                self._jobs.task_done()
+
+    def _migrate(self, entity, target_path, pairs, manifest_path, roots, update, log):
+        manifest = None
+        target_manifest_path = None
+        if manifest_path:
+            manifest = _read_manifest(manifest_path)
+            target_manifest_path = primary_path(manifest_path, roots)
+
+        copy_frames(pairs, manifest, self.workers)
+        if target_manifest_path and os.path.exists(manifest_path):
+            copying.copy_file_checked(manifest_path, target_manifest_path)
+
+        # from here on the publish points at primary, scratch can go
+        update(entity, target_path, target_manifest_path)
+
+        release_scratch(pairs, self.link, log)
+        if target_manifest_path and os.path.exists(manifest_path):
+            release_scratch([(manifest_path, target_manifest_path)], self.link, log)
+
+
+_service = None
+
+
+def get_service():
+    """
+    :returns: The MigrationService shared by all publishes in this session
+    """
+    global _service
+    if _service is None:
+        _service = MigrationService()
+    return _service
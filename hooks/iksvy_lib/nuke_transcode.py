@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Transcode one shot with Nuke in terminal mode:
+
+    nuke -t nuke_transcode.py '<ShotJob as json>'
+
+Writes the .mov plate and the DPX sequence of the shot from its source media.
+Used by transcoding.run_job, not meant to be imported.
+"""
+
+import sys
+import json
+
+import nuke
+
+
+def transcode(job):
+    read = nuke.nodes.Read(file=job["source_path"].replace("\\", "/"),
+                           first=job["first_frame"], last=job["last_frame"])
+
+    plate = nuke.nodes.Write(file=job["plate_path"].replace("\\", "/"), file_type="mov")
+    plate.setInput(0, read)
+    render = nuke.nodes.Write(file=job["render_path"].replace("\\", "/"), file_type="dpx")
+    render.setInput(0, read)
+
+    nuke.execute(render, job["first_frame"], job["last_frame"])
+    nuke.execute(plate, job["first_frame"], job["last_frame"])
+
+
+if __name__ == "__main__":
+    transcode(json.loads(sys.argv[1]))
@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Local render queue for the camera/render layers of a Maya scene.
+
+Each camera/layer is a RenderJob. The queue cuts the frame range of every
+job in chunks so there are enough of them to keep all the workers busy, and
+renders each chunk with its own headless Maya 'Render' process, as many at a
+time as there are workers. A chunk renders into a folder of its own, and its
+frames are only moved to their template paths once the chunk has finished,
+so the scan never sees half rendered sequences.
+
+The renderer is any callable taking (scene_path, camera, layer, start, end,
+output_folder, image_format), the format being the extension of the template
+paths the frames go to, so the file written is what its name says. MayaRenderer runs Maya's Render, StubRenderer writes dummy
+frames and is what IKSVY_RENDERER=stub selects, to test the queue and the
+publish without Maya or render licenses.
+"""
+
+import os
+import re
+import sys
+import time
+import shutil
+import tempfile
+import subprocess
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+
+# path of Maya's Render, next to the running Maya by default
+MAYA_RENDER_ENV = "IKSVY_MAYA_RENDER"
+
+# "maya" or "stub"
+RENDERER_ENV = "IKSVY_RENDERER"
+
+# frames of a chunk, at most: a failed chunk only loses this many
+MAX_CHUNK_SIZE = 25
+
+# frame number and extension at the end of a rendered file name
+_FRAME_RE = re.compile(r"(\d+)\.[^.]+$")
+
+
+def default_workers():
+    """
+    :returns: The number of render processes run at a time, one per core
+    """
+    try:
+        return multiprocessing.cpu_count()
+    except NotImplementedError:
+        return 1
+
+
+def split_frames(frames, chunks, max_chunk_size=MAX_CHUNK_SIZE):
+    """
+    Cut a list of frames in consecutive chunks of about the same size.
+
+    :param frames:         The frames to render, sorted
+    :param chunks:         The number of chunks wanted
+    :param max_chunk_size: The most frames a chunk can have
+    :returns:              List of lists of frames
+    """
+    if not frames:
+        return []
+    size = -(-len(frames) // max(1, min(chunks, len(frames))))
+    size = min(size, max_chunk_size)
+    return [frames[i:i + size] for i in range(0, len(frames), size)]
+
+
+class RenderJob(object):
+    """
+    The frames of a camera/layer and where each of them goes.
+    """
+
+    def __init__(self, camera, layer, frames, frame_path):
+        """
+        :param camera:     The camera to render through
+        :param layer:      The render layer node to render
+        :param frames:     The frames to render
+        :param frame_path: Called with a frame number, returns the path the
+                           frame goes to (the render template path)
+        """
+        self.camera = camera
+        self.layer = layer
+        self.frames = sorted(frames)
+        self.frame_path = frame_path
+
+    def __repr__(self):
+        return "<RenderJob %s/%s %d frames>" % (self.camera, self.layer, len(self.frames))
+
+
+class MayaRenderer(object):
+    """
+    Renders a chunk with Maya's command line Render, in a process of its own.
+    """
+
+    def __init__(self, executable=None, extra_args=None):
+        """
+        :param executable: Path of Render, IKSVY_MAYA_RENDER or the Render
+                           next to the running Maya by default
+        :param extra_args: More arguments for Render, e.g. ["-r", "arnold"]
+        """
+        self.executable = executable or os.environ.get(MAYA_RENDER_ENV) or self._find_render()
+        self.extra_args = list(extra_args or [])
+
+    def _find_render(self):
+        name = "Render.exe" if sys.platform == "win32" else "Render"
+        return os.path.join(os.path.dirname(sys.executable), name)
+
+    def __call__(self, scene_path, camera, layer, start, end, output_folder, image_format):
+        args = [self.executable] + self.extra_args + [
+            "-rl", layer, "-cam", camera, "-s", str(start), "-e", str(end),
+            "-rd", output_folder, "-im", "frame", "-fnc", "name.#.ext", "-pad", "4",
+            "-of", image_format, scene_path]
+        log_path = os.path.join(output_folder, "render.log")
+        with open(log_path, "w") as log:
+            returncode = subprocess.call(args, stdout=log, stderr=subprocess.STDOUT)
+        if returncode:
+            # the chunk folder goes away with its log, keep the end of it
+            with open(log_path) as log:
+                tail = "".join(log.readlines()[-20:])
+            raise RuntimeError("Render exited with %d:\n%s" % (returncode, tail))
+
+
+class StubRenderer(object):
+    """
+    Writes a small dummy frame for each frame of a chunk, taking seconds per
+    frame to do it, in place of Render.
+    """
+
+    def __init__(self, seconds_per_frame=0.0, frame_bytes=1024):
+        self.seconds_per_frame = seconds_per_frame
+        self.frame_bytes = frame_bytes
+
+    def __call__(self, scene_path, camera, layer, start, end, output_folder, image_format):
+        for frame in range(start, end + 1):
+            if self.seconds_per_frame:
+                time.sleep(self.seconds_per_frame)
+            with open(os.path.join(output_folder, "frame.%04d.%s" % (frame, image_format)), "wb") as fh:
+                fh.write(b"\0" * self.frame_bytes)
+
+
+def get_renderer(extra_args=None):
+    """
+    :param extra_args: More arguments for Maya's Render
+    :returns:          The renderer IKSVY_RENDERER asks for, Maya's by default
+    """
+    if os.environ.get(RENDERER_ENV) == "stub":
+        return StubRenderer()
+    return MayaRenderer(extra_args=extra_args)
+
+
+def _collect_frames(folder):
+    """
+    :returns: Dictionary of frame number -> path of the frames rendered in a
+              chunk folder, at any depth (renderers add layer/camera folders)
+    """
+    frames = {}
+    for dirpath, _, filenames in os.walk(folder):
+        for filename in filenames:
+            match = _FRAME_RE.search(filename)
+            if match:
+                frames[int(match.group(1))] = os.path.join(dirpath, filename)
+    return frames
+
+
+class RenderQueue(object):
+    """
+    Renders camera/layer jobs in frame chunks, several at a time.
+    """
+
+    def __init__(self, renderer=None, workers=None, max_chunk_size=MAX_CHUNK_SIZE, log=None):
+        """
+        :param renderer:       Callable rendering a chunk, get_renderer() by default
+        :param workers:        Chunks rendered at a time, one per core by default
+        :param max_chunk_size: The most frames a chunk can have
+        :param log:            Called with a message when a chunk fails
+        """
+        self.renderer = renderer or get_renderer()
+        self.workers = workers or default_workers()
+        self.max_chunk_size = max_chunk_size
+        self.log = log
+
+    def render(self, scene_path, jobs):
+        """
+        Render the frames of all the jobs.
+
+        :param scene_path: The saved scene the renders read
+        :param jobs:       List of RenderJob
+        :returns:          Dictionary with the number of chunks, the frames
+                           rendered, the chunks that failed and the seconds
+                           it took
+        """
+        # two chunks per worker keep them all busy until the end, however the
+        # jobs divide among them. More would load the scene more times
+        chunks_per_job = -(-2 * self.workers // max(1, len(jobs)))
+        chunks = []
+        for job in jobs:
+            for frames in split_frames(job.frames, chunks_per_job, self.max_chunk_size):
+                chunks.append((scene_path, job, frames))
+
+        start = time.time()
+        if self.workers > 1 and len(chunks) > 1:
+            pool = ThreadPool(min(self.workers, len(chunks)))
+            try:
+                results = pool.map(self._render_chunk, chunks)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            results = [self._render_chunk(chunk) for chunk in chunks]
+
+        return {
+            "chunks": len(chunks),
+            "frames": sum(results),
+            "failed": len([frames for frames in results if not frames]),
+            "seconds": time.time() - start,
+        }
+
+    def _render_chunk(self, chunk):
+        """
+        Render a chunk and move its frames to their paths. Runs in the pool
+        threads, the render itself in a process of its own.
+
+        :returns: The number of frames rendered
+        """
+        scene_path, job, frames = chunk
+        target_folder = os.path.dirname(job.frame_path(frames[0]))
+        if not os.path.isdir(target_folder):
+            try:
+                os.makedirs(target_folder)
+            except OSError:
+                # created by another chunk
+                pass
+        output_folder = tempfile.mkdtemp(prefix=".render_%d_%d_" % (frames[0], frames[-1]),
+                                         dir=target_folder)
+        # the format the template says, not whatever the render globals have
+        image_format = os.path.splitext(job.frame_path(frames[0]))[1][1:].lower()
+        try:
+            self.renderer(scene_path, job.camera, job.layer, frames[0], frames[-1], output_folder,
+                          image_format)
+            rendered = _collect_frames(output_folder)
+            for frame in frames:
+                if frame in rendered:
+                    os.rename(rendered[frame], job.frame_path(frame))
+            return len([frame for frame in frames if frame in rendered])
+        except Exception as e:
+            if self.log:
+                self.log("Rendering %s/%s frames %d-%d failed: %s" % (
+                    job.camera, job.layer, frames[0], frames[-1], e))
+            return 0
+        finally:
+            shutil.rmtree(output_folder, ignore_errors=True)
@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Pipelined review (quickdaily) movie generation.
+
+Reading EXR/DPX frames from the file server is slower than encoding them, so
+a serial loop leaves the encoder waiting on every frame. make_review_movie()
+decodes and resizes the frames ahead of the encoder with a few reader threads
+and hands them over, in order, through a bounded queue: at most `depth`
+frames are held in memory at any time.
+
+Frames are decoded and scaled by ffmpeg, one process per frame in the reader
+threads, and encoded by a single ffmpeg process reading raw RGB on stdin.
+Both steps can be replaced (see make_review_movie) which is what the
+benchmark does.
+
+    python review.py --movie /tmp/quick.mov /renders/shot.%04d.exr 1001 1100
+"""
+
+import os
+import time
+import threading
+import subprocess
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+DEFAULT_READERS = 4
+DEFAULT_DEPTH = 16
+
+FFMPEG = os.environ.get("IKSVY_FFMPEG", "ffmpeg")
+
+# same size as the tk-nuke-quickdailies settings in the environments
+DEFAULT_WIDTH = 1024
+DEFAULT_HEIGHT = 768
+DEFAULT_FPS = 24
+
+
+def prefetch(items, load, readers=DEFAULT_READERS, depth=DEFAULT_DEPTH):
+    """
+    Load items ahead of the caller with a pool of reader threads.
+
+    :param items:   Sequence of items to load, e.g. frame paths
+    :param load:    Called with each item in a reader thread
+    :param readers: Number of reader threads. 0 loads every item serially in
+                    the calling thread
+    :param depth:   Maximum number of loaded items waiting to be consumed
+    :returns:       Generator of load(item), in the order of items. An error
+                    raised by load() is raised again when its item is reached
+    """
+    if readers <= 0:
+        for item in items:
+            yield load(item)
+        return
+
+    items = list(items)
+    slots = queue.Queue(max(depth, 1))
+    tasks = queue.Queue()
+    stop = threading.Event()
+
+    class _Slot(object):
+        def __init__(self):
+            self.done = threading.Event()
+            self.value = None
+            self.error = None
+
+    def feed():
+        # reserves a place in the bounded queue before a frame is read, this
+        # is what keeps the readers at most `depth` frames ahead
+        for item in items:
+            slot = _Slot()
+            while not stop.is_set():
+                try:
+                    slots.put(slot, timeout=0.1)
+                    break
+                except queue.Full:
+                    pass
+            if stop.is_set():
+                break
+            tasks.put((slot, item))
+        for _ in range(readers):
+            tasks.put(None)
+
+    def read():
+        while True:
+            task = tasks.get()
+            if task is None:
+                return
+            slot, item = task
+            if not stop.is_set():
+                try:
+                    slot.value = load(item)
+                except Exception as e:
+                    slot.error = e
+            slot.done.set()
+
+    threads = [threading.Thread(target=feed)]
+    threads.extend(threading.Thread(target=read) for _ in range(readers))
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+
+    try:
+        for _ in range(len(items)):
+            slot = slots.get()
+            slot.done.wait()
+            if slot.error:
+                raise slot.error
+            value, slot.value = slot.value, None
+            yield value
+    finally:
+        stop.set()
+        # unblock the feeder if the consumer stopped early
+        while not slots.empty():
+            try:
+                slots.get_nowait()
+            except queue.Empty:
+                break
+
+
+def input_options(path):
+    """
+    :returns: The ffmpeg options to read an image with: EXR frames are linear
+              and are converted to sRGB
+    """
+    if path.lower().endswith(".exr"):
+        return ["-apply_trc", "iec61966_2_1"]
+    return []
+
+
+def decode_frame(path, width, height):
+    """
+    Decode one frame scaled to width x height.
+
+    :returns: The frame as raw 8 bit RGB bytes
+    """
+    command = [FFMPEG, "-v", "error"] + input_options(path) + [
+        "-i", path, "-vf", "scale=%d:%d" % (width, height),
+        "-f", "rawvideo", "-pix_fmt", "rgb24", "-"]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    data, errors = process.communicate()
+    if process.returncode != 0:
+        raise IOError("Could not decode %s: %s" % (path, errors.decode("utf-8", "replace")))
+    return data
+
+
+class MovieEncoder(object):
+    """
+    Encodes raw RGB frames into a movie with one ffmpeg process.
+    """
+
+    def __init__(self, movie_path, width, height, fps=DEFAULT_FPS):
+        command = [FFMPEG, "-v", "error", "-y",
+                   "-f", "rawvideo", "-pix_fmt", "rgb24",
+                   "-s", "%dx%d" % (width, height), "-r", str(fps), "-i", "-",
+                   "-c:v", "mjpeg", "-q:v", "3", "-pix_fmt", "yuvj420p",
+                   movie_path]
+        self._process = subprocess.Popen(command, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    def write(self, frame):
+        self._process.stdin.write(frame)
+
+    def close(self):
+        self._process.stdin.close()
+        errors = self._process.stderr.read()
+        if self._process.wait() != 0:
+            raise IOError("Movie encode failed: %s" % errors.decode("utf-8", "replace"))
+
+
+def make_review_movie(frame_paths, movie_path, width=DEFAULT_WIDTH, height=DEFAULT_HEIGHT,
+                      fps=DEFAULT_FPS, readers=DEFAULT_READERS, depth=DEFAULT_DEPTH,
+                      decode=None, encoder=None):
+    """
+    Write a review movie of a frame sequence, decoding frames ahead of the encoder.
+
+    :param frame_paths: Paths of the frames, in order
+    :param movie_path:  The movie to write, e.g. from shot_quicktime_quick
+    :param readers:     Number of reader threads, 0 for the serial path
+    :param depth:       Maximum number of decoded frames waiting for the encoder
+    :param decode:      Callable (path, width, height) -> frame, decode_frame by default
+    :param encoder:     Object with write(frame) and close(), a MovieEncoder by default
+    :returns:           Dictionary with frames, seconds, fps and encoder_wait_s, the
+                        time the encoder spent waiting for frames
+    """
+    decode = decode or decode_frame
+    if encoder is None:
+        encoder = MovieEncoder(movie_path, width, height, fps)
+
+    start = time.time()
+    waited = 0.0
+    count = 0
+    frames = prefetch(frame_paths, lambda path: decode(path, width, height), readers, depth)
+    try:
+        while True:
+            wait_start = time.time()
+            try:
+                frame = next(frames)
+            except StopIteration:
+                break
+            waited += time.time() - wait_start
+            encoder.write(frame)
+            count += 1
+    finally:
+        frames.close()
+        encoder.close()
+
+    seconds = time.time() - start
+    return {
+        "frames": count,
+        "seconds": seconds,
+        "fps": count / seconds if seconds else 0.0,
+        "encoder_wait_s": waited,
+    }
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Make a review movie of a frame sequence.")
+    parser.add_argument("sequence", help="Frame path with a %%04d frame number")
+    parser.add_argument("first_frame", type=int)
+    parser.add_argument("last_frame", type=int)
+    parser.add_argument("--movie", required=True)
+    parser.add_argument("--width", type=int, default=DEFAULT_WIDTH)
+    parser.add_argument("--height", type=int, default=DEFAULT_HEIGHT)
+    parser.add_argument("--fps", type=float, default=DEFAULT_FPS)
+    parser.add_argument("--readers", type=int, default=DEFAULT_READERS)
+    parser.add_argument("--depth", type=int, default=DEFAULT_DEPTH)
+    args = parser.parse_args()
+
+    frame_paths = [args.sequence % frame for frame in range(args.first_frame, args.last_frame + 1)]
+    stats = make_review_movie(frame_paths, args.movie, args.width, args.height, args.fps,
+                              args.readers, args.depth)
+    print("%(frames)d frames in %(seconds).2fs, %(fps).1f fps "
+          "(encoder waited %(encoder_wait_s).2fs)" % stats)
+
+
+if __name__ == "__main__":
+    main()
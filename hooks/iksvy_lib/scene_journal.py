@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Journal of Maya scene changes used by the scan scene hook.
+
+The journal keeps the last scan result for each category of publish item
+together with a dirty flag. Maya callbacks flag a category as dirty when
+something that could change its result happens (a mesh is created, a camera
+is deleted, a render layer is added...) so the next scan only has to rebuild
+the dirty categories.
+
+Besides nodes coming and going, the attributes of geometry shapes listed in
+_SHAPE_ATTRIBUTE_CATEGORIES are watched with a callback per shape, e.g.
+turning a shape into an intermediate object changes the geometry items.
+"""
+
+# categories of items cached by the scan hook
+GEOMETRY = "geometry"
+CAMERAS = "cameras"
+MESH_GROUPS = "mesh_groups"
+RENDER_LAYERS = "render_layers"
+
+CATEGORIES = (GEOMETRY, CAMERAS, MESH_GROUPS, RENDER_LAYERS)
+
+# node type -> categories made dirty when a node of that type is added/removed
+_NODE_TYPE_CATEGORIES = {
+    "geometryShape": (GEOMETRY, MESH_GROUPS),
+    "camera": (CAMERAS,),
+    "renderLayer": (RENDER_LAYERS,),
+}
+
+# geometry shape attribute -> categories made dirty when it is set
+_SHAPE_ATTRIBUTE_CATEGORIES = {
+    # intermediate shapes don't count as geometry (see dag_scan)
+    "intermediateObject": (GEOMETRY,),
+}
+
+
+class SceneJournal(object):
+    """
+    Cached scan results plus the set of categories that need a rescan.
+    """
+
+    def __init__(self):
+        self._cache = {}
+        self._dirty = set(CATEGORIES)
+        self._callback_ids = []
+        # render results are keyed by (camera, layer, name, version) and
+        # validated against the mtime of the render folder on disk
+        self.render_cache = {}
+
+    def install(self):
+        """
+        Register the Maya callbacks feeding the journal. Safe to call more
+        than once, callbacks are only registered the first time.
+        """
+        if self._callback_ids:
+            return
+
+        import maya.OpenMaya as OpenMaya
+
+        for node_type, categories in _NODE_TYPE_CATEGORIES.items():
+            callback = self._make_dirty_callback(categories)
+            self._callback_ids.append(
+                OpenMaya.MDGMessage.addNodeAddedCallback(callback, node_type))
+            self._callback_ids.append(
+                OpenMaya.MDGMessage.addNodeRemovedCallback(callback, node_type))
+
+        # reparenting changes which top level groups contain meshes and
+        # renaming changes the item names of cameras, groups and layers:
+        self._callback_ids.append(
+            OpenMaya.MDagMessage.addAllDagChangesCallback(
+                self._make_dirty_callback((MESH_GROUPS, CAMERAS))))
+        self._callback_ids.append(
+            OpenMaya.MNodeMessage.addNameChangedCallback(
+                OpenMaya.MObject(), self._make_dirty_callback((MESH_GROUPS, CAMERAS, RENDER_LAYERS))))
+
+        # attribute callbacks are per node: on the shapes already in the
+        # scene, and on every shape created or loaded from now on
+        self._callback_ids.append(
+            OpenMaya.MDGMessage.addNodeAddedCallback(self._watch_shape, "geometryShape"))
+        shapes = OpenMaya.MItDependencyNodes(OpenMaya.MFn.kGeometric)
+        while not shapes.isDone():
+            self._watch_shape(shapes.thisNode())
+            shapes.next()
+
+        # a new or opened scene invalidates everything
+        for message in (OpenMaya.MSceneMessage.kAfterNew, OpenMaya.MSceneMessage.kAfterOpen):
+            self._callback_ids.append(
+                OpenMaya.MSceneMessage.addCallback(message, self._on_scene_changed))
+
+    def uninstall(self):
+        """
+        Remove all the callbacks registered by install() and forget the
+        cached results.
+        """
+        if self._callback_ids:
+            import maya.OpenMaya as OpenMaya
+            for callback_id in self._callback_ids:
+                try:
+                    OpenMaya.MMessage.removeCallback(callback_id)
+                except RuntimeError:
+                    # a shape callback, gone with its node
+                    pass
+            self._callback_ids = []
+        self.reset()
+
+    def reset(self):
+        """
+        Flag every category as dirty and drop all cached results.
+        """
+        self._cache.clear()
+        self.render_cache.clear()
+        self._dirty = set(CATEGORIES)
+
+    def mark_dirty(self, *categories):
+        """
+        Flag the given categories as needing a rescan.
+        """
+        self._dirty.update(categories)
+
+    def is_dirty(self, category):
+        """
+        :returns: True if the category has to be rescanned
+        """
+        return category in self._dirty or category not in self._cache
+
+    def get(self, category):
+        """
+        :returns: The cached result for the category
+        """
+        return self._cache[category]
+
+    def store(self, category, value):
+        """
+        Cache a fresh scan result for the category and flag it as clean.
+
+        :returns: The stored value
+        """
+        self._cache[category] = value
+        self._dirty.discard(category)
+        return value
+
+    def _make_dirty_callback(self, categories):
+        """
+        Build a Maya callback that flags the given categories as dirty. The
+        callbacks are called with different arguments depending on the
+        message type so they just ignore them.
+        """
+        def callback(*args):
+            self._dirty.update(categories)
+        return callback
+
+    def _watch_shape(self, node, *args):
+        """
+        Watch the attributes of a geometry shape that change the scan.
+        """
+        import maya.OpenMaya as OpenMaya
+        self._callback_ids.append(
+            OpenMaya.MNodeMessage.addAttributeChangedCallback(node, self._on_shape_attribute_changed))
+
+    def _on_shape_attribute_changed(self, message, plug, *args):
+        import maya.OpenMaya as OpenMaya
+        if not message & OpenMaya.MNodeMessage.kAttributeSet:
+            return
+        # long attribute name, without the node
+        categories = _SHAPE_ATTRIBUTE_CATEGORIES.get(plug.partialName(False, False, False, False, False, True))
+        if categories:
+            self._dirty.update(categories)
+
+    def _on_scene_changed(self, *args):
+        self.reset()
+
+
+_journal = None
+
+
+def get_journal():
+    """
+    :returns: The SceneJournal shared by all scans in this Maya session
+    """
+    global _journal
+    if _journal is None:
+        _journal = SceneJournal()
+    return _journal
@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Frame sequence inspection for render publishes.
+
+describe_sequence() looks at every frame of a sequence once, in a thread
+pool, and returns the information downstream tools would otherwise get by
+scanning the disk again: frame range, missing frames, size, resolution and
+a checksum per frame.
+"""
+
+import os
+import re
+import json
+import struct
+import hashlib
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+
+# the work is mostly waiting on the file server, so use more threads than cores
+DEFAULT_WORKERS = min(16, multiprocessing.cpu_count() * 2)
+
+_CHUNK_SIZE = 1024 * 1024
+
+_EXR_MAGIC = 20000630
+
+# custom text field on PublishedFile holding the sequence description as JSON
+SEQUENCE_INFO_FIELD = "sg_sequence_info"
+
+# whether the site has SEQUENCE_INFO_FIELD, per site url
+_field_on_site = {}
+
+
+def has_sequence_info_field(sg):
+    """
+    :param sg: Shotgun connection
+    :returns:  True if PublishedFile has SEQUENCE_INFO_FIELD on the site,
+               asked once per site and session
+    """
+    site = getattr(sg, "base_url", None)
+    if site not in _field_on_site:
+        try:
+            _field_on_site[site] = bool(sg.schema_field_read("PublishedFile", SEQUENCE_INFO_FIELD))
+        except Exception:
+            # the API raises a Fault when the field doesn't exist
+            _field_on_site[site] = False
+    return _field_on_site[site]
+
+
+def read_resolution(path):
+    """
+    Read the resolution from the header of an EXR or DPX image.
+
+    :param path: Path to the image
+    :returns:    (width, height) or None if the format isn't supported or
+                 the header can't be read
+    """
+    ext = os.path.splitext(path)[1].lower()
+    try:
+        with open(path, "rb") as fh:
+            if ext == ".exr":
+                return _read_exr_resolution(fh)
+            if ext == ".dpx":
+                return _read_dpx_resolution(fh)
+    except (IOError, OSError, struct.error, ValueError):
+        pass
+    return None
+
+
+def _read_exr_resolution(fh):
+    """
+    Walk the attributes of an EXR header up to the display window.
+    """
+    magic, _ = struct.unpack("<ii", fh.read(8))
+    if magic != _EXR_MAGIC:
+        return None
+    data_window = None
+    while True:
+        name = _read_null_terminated(fh)
+        if not name:
+            break
+        attr_type = _read_null_terminated(fh)
+        size = struct.unpack("<i", fh.read(4))[0]
+        value = fh.read(size)
+        if attr_type == b"box2i" and name in (b"displayWindow", b"dataWindow"):
+            x_min, y_min, x_max, y_max = struct.unpack("<iiii", value)
+            window = (x_max - x_min + 1, y_max - y_min + 1)
+            if name == b"displayWindow":
+                return window
+            data_window = window
+    return data_window
+
+
+def _read_null_terminated(fh, max_length=256):
+    chars = []
+    while len(chars) < max_length:
+        char = fh.read(1)
+        if not char or char == b"\0":
+            break
+        chars.append(char)
+    return b"".join(chars)
+
+
+def _read_dpx_resolution(fh):
+    """
+    Read pixels per line and lines per element from a DPX header.
+    """
+    header = fh.read(780)
+    if header[:4] == b"SDPX":
+        endian = ">"
+    elif header[:4] == b"XPDS":
+        endian = "<"
+    else:
+        return None
+    width, height = struct.unpack(endian + "II", header[772:780])
+    return (width, height)
+
+
+def _inspect_frame(args):
+    """
+    Size and checksum of a single frame. Runs in the pool threads.
+    """
+    frame, path, checksums = args
+    size = os.path.getsize(path)
+    digest = None
+    if checksums:
+        sha1 = hashlib.sha1()
+        with open(path, "rb") as fh:
+            chunk = fh.read(_CHUNK_SIZE)
+            while chunk:
+                sha1.update(chunk)
+                chunk = fh.read(_CHUNK_SIZE)
+        digest = sha1.hexdigest()
+    return frame, os.path.basename(path), size, digest
+
+
+def format_frame_ranges(frames):
+    """
+    Compact a list of frame numbers into ranges, e.g. [1, 2, 3, 7] -> "1-3,7"
+    """
+    ranges = []
+    start = previous = None
+    for frame in sorted(frames):
+        if previous is not None and frame == previous + 1:
+            previous = frame
+            continue
+        if start is not None:
+            ranges.append(str(start) if start == previous else "%d-%d" % (start, previous))
+        start = previous = frame
+    if start is not None:
+        ranges.append(str(start) if start == previous else "%d-%d" % (start, previous))
+    return ",".join(ranges)
+
+
+def describe_sequence(frame_paths, workers=DEFAULT_WORKERS, checksums=True):
+    """
+    Gather everything worth knowing about a frame sequence in one pass.
+
+    :param frame_paths: Dictionary of frame number -> path for every frame on disk
+    :param workers:     Number of threads used to stat and checksum the frames
+    :param checksums:   Whether to compute a sha1 for every frame
+    :returns:           Dictionary with the keys first_frame, last_frame,
+                        frame_count, missing_frames (as ranges), total_bytes,
+                        resolution ("WxH" or None) and manifest (file name ->
+                        {frame, size, sha1})
+    """
+    if not frame_paths:
+        return None
+
+    frames = sorted(frame_paths)
+    jobs = [(frame, frame_paths[frame], checksums) for frame in frames]
+    if workers > 1 and len(jobs) > 1:
+        pool = ThreadPool(min(workers, len(jobs)))
+        try:
+            results = pool.map(_inspect_frame, jobs)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [_inspect_frame(job) for job in jobs]
+
+    manifest = {}
+    total_bytes = 0
+    for frame, file_name, size, digest in results:
+        total_bytes += size
+        manifest[file_name] = {"frame": frame, "size": size, "sha1": digest}
+
+    missing = sorted(set(range(frames[0], frames[-1] + 1)) - set(frames))
+    resolution = read_resolution(frame_paths[frames[len(frames) // 2]])
+
+    return {
+        "first_frame": frames[0],
+        "last_frame": frames[-1],
+        "frame_count": len(frames),
+        "missing_frames": format_frame_ranges(missing),
+        "total_bytes": total_bytes,
+        "resolution": "%dx%d" % resolution if resolution else None,
+        "manifest": manifest,
+    }
+
+
+def write_manifest(manifest_path, info):
+    """
+    Write the description of a sequence as JSON next to its frames.
+
+    :param manifest_path: Path of the JSON file to write
+    :param info:          Dictionary returned by describe_sequence()
+    """
+    with open(manifest_path, "w") as fh:
+        json.dump(info, fh, indent=2, sort_keys=True)
+
+
+def manifest_path_for(sequence_path):
+    """
+    :param sequence_path: Abstract path of the sequence, e.g. /renders/beauty.%04d.exr
+    :returns:             Path of its manifest, e.g. /renders/beauty.manifest.json
+    """
+    path = re.sub(r"[._]?%0?\d*d", "", sequence_path)
+    return "%s.manifest.json" % os.path.splitext(path)[0]
@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Background thumbnails for publishes.
+
+The publish registers with the scene screenshot and queues the real preview
+(a frame of the render, a playblast of the camera) with the ThumbnailService.
+A worker thread downscales it with an ffmpeg process, keeps the result in a
+local ThumbnailStore keyed by a hash of the source and uploads it to the
+PublishedFile, while Maya carries on. Publishing the same source again finds
+the thumbnail in the store and registers with it straight away.
+"""
+
+import os
+import shutil
+import hashlib
+import tempfile
+import threading
+import subprocess
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from . import review
+
+STORE_ENV = "IKSVY_THUMBNAIL_DIR"
+
+THUMBNAIL_WIDTH = 512
+
+# bytes read from each end of a source to hash it, frames are too big to read whole
+_SAMPLE_SIZE = 64 * 1024
+
+
+def source_key(path, salt=""):
+    """
+    Hash a source file by its size and the data at both ends.
+
+    :param path: The file the thumbnail is made from
+    :param salt: Extra text mixed in the hash, e.g. the frame of a playblast
+    :returns:    Hex digest identifying the source
+    """
+    size = os.path.getsize(path)
+    digest = hashlib.sha1(("%d:%s:" % (size, salt)).encode("utf-8"))
+    with open(path, "rb") as fh:
+        digest.update(fh.read(_SAMPLE_SIZE))
+        if size > 2 * _SAMPLE_SIZE:
+            fh.seek(-_SAMPLE_SIZE, os.SEEK_END)
+            digest.update(fh.read(_SAMPLE_SIZE))
+    return digest.hexdigest()
+
+
+def downscale(source_path, target_path, width=THUMBNAIL_WIDTH):
+    """
+    Write a jpg of the source image scaled to the given width with ffmpeg.
+    EXR frames are converted from linear to sRGB.
+    """
+    command = [review.FFMPEG, "-v", "error", "-y"] + review.input_options(source_path)
+    command.extend(["-i", source_path, "-vf", "scale=%d:-2" % width,
+                    "-frames:v", "1", "-q:v", "3", target_path])
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    output = process.communicate()[0]
+    if process.returncode != 0:
+        raise IOError("Could not make a thumbnail of %s: %s" % (
+            source_path, output.decode("utf-8", "replace")))
+
+
+class ThumbnailStore(object):
+    """
+    Local folder of thumbnails named after the hash of their source.
+    """
+
+    def __init__(self, root=None):
+        self.root = root or os.environ.get(STORE_ENV) or os.path.join(
+            os.path.expanduser("~"), ".iksvy", "thumbnails")
+
+    def path_for(self, key):
+        # two levels so no folder ends up with too many files
+        return os.path.join(self.root, key[:2], key + ".jpg")
+
+    def get(self, key):
+        """
+        :returns: The stored thumbnail for the key, or None
+        """
+        path = self.path_for(key)
+        return path if os.path.exists(path) else None
+
+    def put(self, key, image_path):
+        """
+        Move a thumbnail into the store.
+
+        :returns: The path of the stored thumbnail
+        """
+        path = self.path_for(key)
+        folder = os.path.dirname(path)
+        if not os.path.isdir(folder):
+            try:
+                os.makedirs(folder)
+            except OSError:
+                # created by another session
+                pass
+        shutil.move(image_path, path)
+        return path
+
+
+class ThumbnailService(object):
+    """
+    Makes and uploads thumbnails on a worker thread, one at a time, in the
+    order they were submitted.
+    """
+
+    def __init__(self, store=None, width=THUMBNAIL_WIDTH):
+        self.store = store or ThumbnailStore()
+        self.width = width
+        self._jobs = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, entity, source_path, upload, key=None, resize=True, log=None,
+               remove_source=False):
+        """
+        Queue the thumbnail of a publish.
+
+        :param entity:      The PublishedFile entity dictionary
+        :param source_path: Image the thumbnail is made from
+        :param upload:      Called on the worker thread with (entity, thumbnail path)
+        :param key:         Store key, the source_key of source_path by default
+        :param resize:      False if the source is already thumbnail sized
+        :param log:         Called with a message when the thumbnail fails
+        :param remove_source: Delete source_path once done with it, for
+                            temporary images
+        """
+        self._jobs.put((entity, source_path, upload, key, resize, log, remove_source))
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run)
+                self._thread.daemon = True
+                self._thread.start()
+
+    def wait(self):
+        """
+        Block until every queued thumbnail has been uploaded.
+        """
+        self._jobs.join()
+
+    def _run(self):
+        while True:
+            # the worker stops once there is nothing left to do, under the
+            # lock so a job submitted meanwhile starts a new one
+            with self._lock:
+                try:
+                    job = self._jobs.get_nowait()
+                except queue.Empty:
+                    self._thread = None
+                    return
+            entity, source_path, upload, key, resize, log, remove_source = job
+            try:
+                upload(entity, self._make(source_path, key, resize))
+            except Exception as e:
+                if log:
+                    log("Thumbnail of %s %s failed: %s" % (entity["type"], entity["id"], e))
+            finally:
+                if remove_source and os.path.exists(source_path):
+                    os.remove(source_path)
+                self._jobs.task_done()
+
+    def _make(self, source_path, key, resize):
+        key = key or source_key(source_path)
+        path = self.store.get(key)
+        if path:
+            return path
+        handle, tmp_path = tempfile.mkstemp(suffix=".jpg", prefix="iksvy_thumb_")
+        os.close(handle)
+        try:
+            if resize:
+                downscale(source_path, tmp_path, self.width)
+            else:
+                shutil.copyfile(source_path, tmp_path)
+            return self.store.put(key, tmp_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+
+_service = None
+
+
+def get_service():
+    """
+    :returns: The ThumbnailService shared by all publishes in this session
+    """
+    global _service
+    if _service is None:
+        _service = ThumbnailService()
+    return _service
@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Timing trace for the publish hooks.
+
+Tracing is off unless the IKSVY_TRACE_DIR environment variable points to a
+folder (or enable() is called). When it is on, the hooks record nested timing
+spans and counters, and flush() writes them as a Chrome trace (open it in
+chrome://tracing or https://ui.perfetto.dev).
+
+The fs_call_sites and shotgun_call_sites counters count the times the hooks
+go to disk or to Shotgun, one per toolkit or library call. A single one may
+make many system calls or API requests underneath (paths_from_template globs
+a whole folder tree), so they compare runs of the same code, not costs.
+
+Events are kept in memory until flushed, up to MAX_EVENTS. Past that the
+newest ones are dropped and counted in the dropped_events counter.
+
+When tracing is off span() hands back a shared do-nothing object and count()
+returns straight away, so the instrumentation can stay in the hooks.
+"""
+
+import os
+import json
+import time
+import threading
+
+TRACE_DIR_ENV = "IKSVY_TRACE_DIR"
+
+# events kept between two flushes
+MAX_EVENTS = 100000
+
+
+class _NullSpan(object):
+    """
+    Span used while tracing is disabled.
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span(object):
+    """
+    A timed section of code, recorded as a Chrome trace complete event.
+    """
+
+    def __init__(self, tracer, name, args):
+        self._tracer = tracer
+        self._name = name
+        self.args = args
+        self._start = None
+
+    def __enter__(self):
+        self._tracer._stack().append(self)
+        self._start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        end = time.time()
+        self._tracer._stack().pop()
+        if exc_type is not None:
+            self.args["error"] = str(exc_value)
+        self._tracer._add_event({
+            "name": self._name,
+            "ph": "X",
+            "ts": int(self._start * 1000000),
+            "dur": int((end - self._start) * 1000000),
+            "pid": os.getpid(),
+            "tid": threading.current_thread().ident,
+            "args": self.args,
+        })
+        return False
+
+
+class Tracer(object):
+    """
+    Collects the spans and counters of a publish session.
+    """
+
+    def __init__(self, trace_dir=None):
+        self.trace_dir = trace_dir
+        self.enabled = bool(trace_dir)
+        self._events = []
+        self._counters = {}
+        self._flushes = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def enable(self, trace_dir):
+        """
+        Start tracing, writing the traces to the given folder.
+        """
+        self.trace_dir = trace_dir
+        self.enabled = True
+
+    def disable(self):
+        """
+        Stop tracing and forget anything recorded so far.
+        """
+        self.enabled = False
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._events = []
+            self._counters = {}
+
+    def span(self, name, **args):
+        """
+        :param name: Name of the span, shown in the trace viewer
+        :param args: Extra values to attach to the span
+        :returns:    A context manager timing the code it wraps
+        """
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, args)
+
+    def count(self, counter, amount=1):
+        """
+        Add to a session counter (e.g. "fs_call_sites", "shotgun_call_sites").
+        The amount is also added to the innermost open span.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[counter] = self._counters.get(counter, 0) + amount
+        stack = self._stack()
+        if stack:
+            stack[-1].args[counter] = stack[-1].args.get(counter, 0) + amount
+
+    def counters(self):
+        """
+        :returns: A copy of the session counters
+        """
+        with self._lock:
+            return dict(self._counters)
+
+    def flush(self, session_name="publish"):
+        """
+        Write everything recorded since the last flush as a Chrome trace.
+
+        :param session_name: Used to build the trace file name
+        :returns:            The path of the trace written, None if tracing is disabled
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            events, self._events = self._events, []
+            counters, self._counters = self._counters, {}
+            # scans can follow each other within a second
+            self._flushes += 1
+            flushes = self._flushes
+
+        if not os.path.isdir(self.trace_dir):
+            os.makedirs(self.trace_dir)
+        trace_path = os.path.join(self.trace_dir, "%s_%s_%d_%d.json" % (
+            session_name, time.strftime("%Y%m%d_%H%M%S"), os.getpid(), flushes))
+        with open(trace_path, "w") as fh:
+            json.dump({
+                "traceEvents": events,
+                "displayTimeUnit": "ms",
+                "otherData": {"session": session_name, "counters": counters},
+            }, fh)
+        return trace_path
+
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _add_event(self, event):
+        with self._lock:
+            if len(self._events) < MAX_EVENTS:
+                self._events.append(event)
+            else:
+                self._counters["dropped_events"] = self._counters.get("dropped_events", 0) + 1
+
+
+# the tracer shared by all the hooks in this session
+tracer = Tracer(os.environ.get(TRACE_DIR_ENV))
+
+span = tracer.span
+count = tracer.count
+flush = tracer.flush
+
+
+def log_debug(bundle, msg, *args):
+    """
+    Log a debug message, only formatting it if debug logging is on.
+
+    Use it instead of bundle.log_debug("..." % value) when value is big (the
+    publish items, template fields...) so it isn't turned into a string for
+    nothing.
+
+    :param bundle: The app or engine to log through
+    :param msg:    Message, with %s style placeholders for args
+    :param args:   Values for the placeholders
+    """
+    logger = getattr(bundle, "logger", None)
+    if logger is not None:
+        # toolkit core v0.18+ exposes a standard logger that formats lazily
+        logger.debug(msg, *args)
+        return
+
+    engine = getattr(bundle, "engine", None)
+    if engine is not None and not engine.get_setting("debug_logging", False):
+        return
+    bundle.log_debug(msg % args if args else msg)
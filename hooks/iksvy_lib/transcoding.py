@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Per shot plate and render transcodes run on a local process pool.
+
+Each ShotJob is transcoded by a Nuke running in terminal mode with the
+nuke_transcode.py script next to this module: a .mov plate (hiero_plate_path)
+and a DPX sequence (hiero_render_path). A shot whose outputs are already on
+disk with as many frames as its cut is skipped.
+"""
+
+import os
+import re
+import json
+import time
+import threading
+import subprocess
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+
+TRANSCODE_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "nuke_transcode.py")
+
+# job states
+PENDING = "pending"
+SKIPPED = "skipped"
+DONE = "done"
+FAILED = "failed"
+
+
+class ShotJob(object):
+    """
+    The transcodes to run for one shot of the cut.
+    """
+
+    def __init__(self, shot, source_path, first_frame, last_frame, plate_path, render_path):
+        """
+        :param shot:        Name of the shot
+        :param source_path: Source media, a movie or a %04d sequence
+        :param first_frame: First source frame of the cut
+        :param last_frame:  Last source frame of the cut
+        :param plate_path:  The .mov to write
+        :param render_path: The %04d DPX sequence to write
+        """
+        self.shot = shot
+        self.source_path = source_path
+        self.first_frame = first_frame
+        self.last_frame = last_frame
+        self.plate_path = plate_path
+        self.render_path = render_path
+
+    @property
+    def cut_length(self):
+        return self.last_frame - self.first_frame + 1
+
+    def to_dict(self):
+        return dict(self.__dict__)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+
+def plate_info_path(plate_path):
+    """
+    :returns: The sidecar file recording how many frames a plate holds
+    """
+    return plate_path + ".json"
+
+
+def count_rendered_frames(render_path):
+    """
+    :param render_path: Abstract path of a sequence, e.g. /renders/shot.%04d.dpx
+    :returns:           The number of frames of the sequence on disk
+    """
+    folder, name = os.path.split(render_path)
+    if not os.path.isdir(folder):
+        return 0
+    frame_re = re.compile("^%s$" % re.sub(
+        r"%0(\d+)d", lambda m: r"\d{%s}" % m.group(1),
+        re.escape(name).replace(r"\%", "%")))
+    return len([f for f in os.listdir(folder) if frame_re.match(f)])
+
+
+def is_complete(job):
+    """
+    :returns: True if both outputs of the shot exist and match its cut length
+    """
+    info_path = plate_info_path(job.plate_path)
+    if not os.path.exists(job.plate_path) or not os.path.exists(info_path):
+        return False
+    try:
+        with open(info_path) as fh:
+            plate_frames = json.load(fh).get("frames")
+    except (IOError, ValueError):
+        return False
+    return (plate_frames == job.cut_length and
+            count_rendered_frames(job.render_path) == job.cut_length)
+
+
+def run_job(args):
+    """
+    Transcode one shot in its own Nuke process.
+
+    :param args: (nuke executable, job dictionary)
+    :returns:    (shot, state, seconds, error message)
+    """
+    executable, data = args
+    job = ShotJob.from_dict(data)
+    start = time.time()
+    if is_complete(job):
+        return job.shot, SKIPPED, 0.0, None
+
+    for path in (job.plate_path, job.render_path):
+        folder = os.path.dirname(path)
+        if not os.path.isdir(folder):
+            try:
+                os.makedirs(folder)
+            except OSError:
+                # created by another worker
+                pass
+
+    command = [executable, "-t", TRANSCODE_SCRIPT, json.dumps(job.to_dict())]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    output = process.communicate()[0]
+    if process.returncode != 0:
+        return job.shot, FAILED, time.time() - start, output[-2000:].decode("utf-8", "replace")
+
+    with open(plate_info_path(job.plate_path), "w") as fh:
+        json.dump({"frames": job.cut_length, "source": job.source_path}, fh)
+    return job.shot, DONE, time.time() - start, None
+
+
+class TranscodePool(object):
+    """
+    Runs ShotJobs in the background, one Nuke process per shot and as many
+    processes at once as workers, so the export carries on while shots are
+    transcoded.
+
+    The processes are started from a pool of threads rather than forking the
+    host application (Hiero) with multiprocessing.
+    """
+
+    def __init__(self, executable, workers=None, progress_cb=None, finished_cb=None):
+        """
+        :param executable:  The Nuke executable used to transcode
+        :param workers:     Number of processes, the CPU count by default
+        :param progress_cb: Called with (shot, state, done, total) every time
+                            a shot finishes
+        :param finished_cb: Called with the pool once its threads are done,
+                            whether the shots succeeded or not
+        """
+        self.executable = executable
+        self.workers = workers or multiprocessing.cpu_count()
+        self.progress_cb = progress_cb
+        self.finished_cb = finished_cb
+        self.status = {}
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, jobs):
+        """
+        Start transcoding the given jobs in the background.
+
+        :param jobs: List of ShotJob
+        """
+        with self._lock:
+            for job in jobs:
+                self.status[job.shot] = {"state": PENDING, "seconds": None, "error": None}
+        self._thread = threading.Thread(target=self._run, args=(jobs,))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def wait(self, timeout=None):
+        """
+        Block until every shot is done.
+
+        :returns: The status of every shot
+        """
+        if self._thread:
+            self._thread.join(timeout)
+        return self.summary()
+
+    def is_running(self):
+        """
+        :returns: True until every submitted shot is done
+        """
+        return self._thread is not None and self._thread.is_alive()
+
+    def summary(self):
+        """
+        :returns: Dictionary of shot -> {state, seconds, error}
+        """
+        with self._lock:
+            return dict((shot, dict(status)) for shot, status in self.status.items())
+
+    def _run(self, jobs):
+        pool = ThreadPool(min(self.workers, max(len(jobs), 1)))
+        try:
+            args = [(self.executable, job.to_dict()) for job in jobs]
+            done = 0
+            for shot, state, seconds, error in pool.imap_unordered(run_job, args):
+                done += 1
+                with self._lock:
+                    self.status[shot] = {"state": state, "seconds": seconds, "error": error}
+                if self.progress_cb:
+                    self.progress_cb(shot, state, done, len(jobs))
+        finally:
+            pool.close()
+            pool.join()
+            if self.finished_cb:
+                self.finished_cb(self)
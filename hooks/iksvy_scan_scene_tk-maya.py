@@ -10,17 +10,46 @@
 # not expressly granted therein are reserved by Shotgun Software Inc.
 
 import os
+import sys
+import itertools
 import maya.cmds as cmds
 
 import tank
 from tank import Hook
 from tank import TankError
 
+# shared code for the iksvy hooks lives next to them
+_HOOKS_DIR = os.path.dirname(os.path.abspath(__file__))
+if _HOOKS_DIR not in sys.path:
+    sys.path.append(_HOOKS_DIR)
+from iksvy_lib import dag_scan
+from iksvy_lib import render_queue
+from iksvy_lib import scene_journal
+from iksvy_lib import tracing
+
+# the journal categories filled in by the single DAG pass
+_DAG_CATEGORIES = (scene_journal.GEOMETRY, scene_journal.CAMERAS, scene_journal.MESH_GROUPS)
+
+# set to 1 to render the missing camera/layers before publishing them
+RENDER_AND_PUBLISH_ENV = "IKSVY_RENDER_AND_PUBLISH"
+
 class ScanSceneHook(Hook):
     """
     Hook to scan scene for items to publish
     """
 
+    # render and publish: the renderable camera/layers without frames on
+    # disk are rendered with the local render queue before the scan, so they
+    # come out as rendered_image items ready to publish
+    render_and_publish = False
+
+    # render processes run at a time. Each one loads the whole scene and the
+    # renderers use every core already, so only a couple of them
+    render_workers = 2
+
+    # more arguments for Maya's Render, e.g. ["-r", "arnold"]
+    render_args = []
+
     def execute(self, **kwargs):
         """
         Main hook entry point
@@ -55,8 +84,6 @@ class ScanSceneHook(Hook):
                         }
         """
 
-        items = []
-
         # get the main scene:
         scene_name = cmds.file(query=True, sn=True)
         if not scene_name:
@@ -65,31 +92,122 @@ class ScanSceneHook(Hook):
         scene_path = os.path.abspath(scene_name)
         name = os.path.basename(scene_path)
 
+        # the journal keeps the result of the previous scan and tracks which
+        # parts of the scene changed since then, so only those are rescanned:
+        journal = scene_journal.get_journal()
+        journal.install()
+
         # create the primary item - this will match the primary output 'scene_item_type':
-        items.append({"type": "work_file", "name": name})
+        primary_items = [{"type": "work_file", "name": name}]
 
-        # if there is any geometry in the scene (poly meshes or nurbs patches), then
-        # add a geometry item to the list:
-        if cmds.ls(geometry=True, noIntermediate=True):
-            items.append({"type":"geometry", "name":"All Scene Geometry"})
+        # the publish app expects a list, but every category is produced by
+        # its own generator so the expensive ones are only run when needed
+        with tracing.span("scan", scene=scene_path):
+            items = list(itertools.chain(
+                primary_items,
+                self._iter_geometry_items(journal),
+                self._iter_camera_items(journal),
+                self._iter_mesh_group_items(journal),
+                self._iter_rendered_image_items(journal, scene_name, name),
+            ))
 
+        tracing.log_debug(self.parent, "items vale: %s", items)
+
+        # the publish dialog may be closed without publishing, so the scan
+        # writes its own trace instead of waiting for the publish to
+        trace_path = tracing.flush("scan")
+        if trace_path:
+            self.parent.log_debug("Scan trace written to %s" % trace_path)
+        return items
+
+    def _scan_dag(self, journal):
+        """
+        Rescan the geometry, the cameras and the mesh groups, all three in a
+        single pass over the DAG, if any of them changed since the last scan.
+
+        :param journal: The SceneJournal holding the cached scan results
+        """
+        if not any(journal.is_dirty(category) for category in _DAG_CATEGORIES):
+            return
+        with tracing.span("scan.dag"):
+            scan = dag_scan.scan_dag()
+        journal.store(scene_journal.GEOMETRY, scan.has_geometry)
         # CAMARA CAMARA CAMARA CAMARA CAMARA CAMARA CAMARA CAMARA
         # Modificacion para publicar CAMARAS
-        # look for cameras to publish
         # Evito la cámara "persp"
-        cameras = [cameras for cameras in cmds.listCameras(p=True) if cameras != 'persp']
-        for camera in cameras:
-            items.append({"type": "camera", "name": camera})
-
+        journal.store(scene_journal.CAMERAS, [camera for camera in scan.cameras if camera != 'persp'])
         # ALEMBIC ALEMBIC ALEMBIC ALEMBIC ALEMBIC ALEMBIC ALEMBIC
         # Modificacion para publicar ALEMBIC
-        # look for root level groups that have meshes as children:
-        for grp in cmds.ls(assemblies=True, long=True):
-            if cmds.ls(grp, dag=True, type="mesh"):
-                # include this group as a 'mesh_group' type
-                items.append({"type":"mesh_group", "name":grp})
+        # root level groups that have meshes as children
+        journal.store(scene_journal.MESH_GROUPS, scan.mesh_groups)
+
+    def _iter_geometry_items(self, journal):
+        """
+        Yield the 'geometry' item if there is any geometry in the scene.
+
+        :param journal: The SceneJournal holding the cached scan results
+        """
+        # if there is any geometry in the scene (poly meshes or nurbs patches), then
+        # add a geometry item to the list:
+        self._scan_dag(journal)
+        if journal.get(scene_journal.GEOMETRY):
+            yield {"type":"geometry", "name":"All Scene Geometry"}
+
+    def _get_cameras(self, journal):
+        """
+        :param journal: The SceneJournal holding the cached scan results
+        :returns: The list of cameras that can be published
+        """
+        self._scan_dag(journal)
+        return journal.get(scene_journal.CAMERAS)
+
+    def _iter_camera_items(self, journal):
+        """
+        Yield a 'camera' item for each camera in the scene.
+
+        :param journal: The SceneJournal holding the cached scan results
+        """
+        for camera in self._get_cameras(journal):
+            yield {"type": "camera", "name": camera}
+
+    def _iter_mesh_group_items(self, journal):
+        """
+        Yield a 'mesh_group' item for each root level group containing meshes.
+
+        :param journal: The SceneJournal holding the cached scan results
+        """
+        self._scan_dag(journal)
+        for grp in journal.get(scene_journal.MESH_GROUPS):
+            # include this group as a 'mesh_group' type
+            yield {"type":"mesh_group", "name":grp}
+
+    def _get_render_layers(self, journal):
+        """
+        :param journal: The SceneJournal holding the cached scan results
+        :returns: The list of render layers, using the name they render with
+        """
+        if journal.is_dirty(scene_journal.RENDER_LAYERS):
+            # apparently maya has 2 names for the default layer. I'm
+            # guessing it actually renders out as 'masterLayer'.
+            journal.store(scene_journal.RENDER_LAYERS,
+                          [layer.replace("defaultRenderLayer", "masterLayer")
+                           for layer in cmds.ls(type="renderLayer")])
+        return journal.get(scene_journal.RENDER_LAYERS)
 
-        # RENDER RENDER RENDER RENDER RENDER RENDER RENDER RENDER 
+    def _iter_rendered_image_items(self, journal, scene_name, name):
+        """
+        Yield a 'rendered_image' item for each camera/layer with frames on disk.
+
+        The frames are not part of the scene so they can't be tracked by the
+        journal. Instead each camera/layer result is cached together with the
+        modification time of its render folder and only globbed again when
+        the folder changes.
+
+        :param journal:     The SceneJournal holding the cached scan results
+        :param scene_name:  The path of the current scene
+        :param name:        The file name of the current scene
+        """
+        # RENDER RENDER RENDER RENDER RENDER RENDER RENDER RENDER
         # Modificacion para publicar RENDER
         # we'll use the engine to get the templates
         engine = tank.platform.current_engine()
@@ -103,13 +221,34 @@ class ScanSceneHook(Hook):
         work_template_fields = work_template.get_fields(scene_name)
         version = work_template_fields["version"]
 
+        cameras = self._get_cameras(journal)
+        layers = self._get_render_layers(journal)
+        frames = self._get_render_frames()
+
+        def render_fields(camera, layer):
+            # these are the fields to populate into the template to match
+            # against. The context fields (Sequence, Shot, Step) come from
+            # the work file so only the current shot is searched.
+            fields = dict(work_template_fields)
+            fields.update({
+                'maya.camera_name': camera,
+                'maya.layer_name': layer,
+                # codigo original:
+                # 'name': layer,
+                # 'name': name,  # DA ERROR porque el nombre tiene .ma
+                # <Sgtk StringKey name> Illegal value 'scene.v008.ma' does not fit filter_by 'alphanumeric'
+                # Este nombre va a ser el nombre del fichero(s) publicado
+                'name': name.split('.')[0],  # ESTE FUNCIONA
+                'version': version,
+            })
+            return fields
 
         # get all the secondary output render templates and match them against
         # what is on disk
         secondary_outputs = app.get_setting("secondary_outputs")
         render_outputs = [out for out in secondary_outputs if out["tank_type"] == "Rendered Image"]
         for render_output in render_outputs:
-            self.parent.log_debug("render_output vale: %s" % render_output)
+            tracing.log_debug(self.parent, "render_output vale: %s", render_output)
             # AQUI ESTA EL ERROR!!!!
             # render_template = app.get_template(render_output["publish_template"])
 
@@ -117,9 +256,9 @@ class ScanSceneHook(Hook):
             # Es una forma tosca de resolverlo
             # se supone que lo anterior es mas elaborado
             render_template = engine.tank.templates.get("maya_shot_render")
-            self.parent.log_debug("render_template vale: %s" % render_template)
+            tracing.log_debug(self.parent, "render_template vale: %s", render_template)
             # maya_shot_render:
-            # definition: '@shot_root/work/maya/images/NAU_{name}_v{version}.{SEQ}.png'
+            # definition: '@shot_root/work/maya/images/{maya.camera_name}/{maya.layer_name}/{name}.{SEQ}.EXR'
             # root_name: 'primary'
 
             # now look for rendered images. note that the cameras returned from
@@ -128,56 +267,182 @@ class ScanSceneHook(Hook):
             # to be part of the publish path. For my simple test, the cameras
             # are not parented, so there is no hierarchy.
 
+            if self.render_and_publish or os.environ.get(RENDER_AND_PUBLISH_ENV) == "1":
+                self._render_missing_layers(engine, scene_name, render_template,
+                                            cameras, layers, frames, render_fields)
+
             # iterate over all cameras and layers
-            self.parent.log_debug("listCameras vale: %s" % cameras)
-            # cameras está creada más arriba, al preparar la lista de cámaras
+            tracing.log_debug(self.parent, "listCameras vale: %s", cameras)
 
             for camera in cameras:
-                for layer in cmds.ls(type="renderLayer"):
-                    # apparently maya has 2 names for the default layer. I'm
-                    # guessing it actually renders out as 'masterLayer'.
-                    layer = layer.replace("defaultRenderLayer", "masterLayer")
-                    # these are the fields to populate into the template to match
-                    # against
-                    fields = {
-                        'maya.camera_name': camera,
-                        'maya.layer_name': layer,
-                        # codigo original:
-                        # 'name': layer,
-                        # 'name': name,  # DA ERROR porque el nombre tiene .ma
-                        # <Sgtk StringKey name> Illegal value 'scene.v008.ma' does not fit filter_by 'alphanumeric'
-                        # Este nombre va a ser el nombre del fichero(s) publicado
-                        'name': name.split('.')[0],  # ESTE FUNCIONA
-                        'version': version,
+                for layer in layers:
+                    fields = render_fields(camera, layer)
+                    item = self._find_rendered_image_item(
+                        journal, engine, render_template, fields, frames)
+                    if item:
+                        yield item
+
+    def _render_missing_layers(self, engine, scene_name, render_template, cameras, layers, frames,
+                               render_fields):
+        """
+        Render the frames missing on disk of the renderable camera/layers
+        with the local render queue, one Render process per frame chunk.
+
+        :param engine:          The current engine
+        :param scene_name:      The path of the current scene
+        :param render_template: The template the frames are rendered with
+        :param cameras:         The cameras of the scene
+        :param layers:          The render layers, with the name they render with
+        :param frames:          The frames the render settings render
+        :param render_fields:   Called with (camera, layer), returns the
+                                template fields of their frames
+        :raises TankError:      If any frame chunk failed to render
+        """
+        # the render processes read the scene from disk
+        if cmds.file(query=True, modified=True):
+            raise TankError("Please Save your file before rendering it for the Publish")
+
+        jobs = []
+        for camera in cameras:
+            if not self._is_renderable_camera(camera):
+                continue
+            for layer in layers:
+                layer_node = layer.replace("masterLayer", "defaultRenderLayer")
+                if not cmds.getAttr("%s.renderable" % layer_node):
+                    continue
+                fields = render_fields(camera, layer)
+                missing = _missing_frames(render_template, fields, frames)
+                if not missing:
+                    # rendered already
+                    continue
+                jobs.append(render_queue.RenderJob(
+                    camera, layer_node, missing, _frame_path_function(render_template, fields)))
+        if not jobs:
+            return
+
+        queue = render_queue.RenderQueue(render_queue.get_renderer(self.render_args),
+                                         self.render_workers, log=self.parent.log_warning)
+        with tracing.span("scan.render", jobs=len(jobs)):
+            result = queue.render(os.path.abspath(scene_name), jobs)
+        tracing.log_debug(self.parent, "Rendered %d frames of %d camera/layers in %d chunks (%d failed) in %.1fs",
+                          result["frames"], len(jobs), result["chunks"], result["failed"], result["seconds"])
+        if result["failed"]:
+            raise TankError("%d of the %d render chunks failed, see the log for the Render output" % (
+                result["failed"], result["chunks"]))
+
+    def _get_render_frames(self):
+        """
+        :returns: The frames the render settings render
+        """
+        if not cmds.getAttr("defaultRenderGlobals.animation"):
+            return [int(cmds.currentTime(query=True))]
+        start = int(cmds.getAttr("defaultRenderGlobals.startFrame"))
+        end = int(cmds.getAttr("defaultRenderGlobals.endFrame"))
+        return list(range(start, end + 1))
+
+    def _is_renderable_camera(self, camera):
+        shapes = cmds.listRelatives(camera, shapes=True, type="camera", fullPath=True) or [camera]
+        return any(cmds.getAttr("%s.renderable" % shape) for shape in shapes)
+
+    def _find_rendered_image_item(self, journal, engine, render_template, fields, frames):
+        """
+        Look for the frames of a camera/layer on disk. Camera/layers missing
+        any of the frames the render settings render are left out, so half
+        renders are not published.
+
+        :param journal:         The SceneJournal holding the cached scan results
+        :param engine:          The current engine
+        :param render_template: The template the frames are rendered with
+        :param fields:          The fields to match the template against
+        :param frames:          The frames the render settings render
+        :returns:               A 'rendered_image' item or None if frames are missing
+        """
+        camera = fields['maya.camera_name']
+        layer = fields['maya.layer_name']
+
+        # the folder holding the frames. Its mtime changes whenever a frame
+        # is added or removed, which is what invalidates the cached result.
+        render_folder_mtime = None
+        try:
+            render_folder = render_template.parent.apply_fields(fields)
+        except TankError:
+            render_folder = None
+        if render_folder:
+            tracing.count("fs_call_sites")
+            if os.path.isdir(render_folder):
+                tracing.count("fs_call_sites")
+                render_folder_mtime = os.path.getmtime(render_folder)
+
+        cache_key = (camera, layer, fields['name'], fields['version'], tuple(frames))
+        cached = journal.render_cache.get(cache_key)
+        if render_folder and cached and cached[0] == render_folder_mtime:
+            return cached[1]
+
+        item = None
+        # no folder means no frames, no need to glob:
+        if not render_folder or render_folder_mtime is not None:
+            tracing.log_debug(self.parent, "fields vale: %s", fields)
+            # match existing paths against the render template
+            # Comprobar que existen los frames
+            with tracing.span("scan.renders", camera=camera, layer=layer):
+                tracing.count("fs_call_sites")
+                paths_existe = engine.tank.paths_from_template(
+                    render_template, fields)
+            tracing.log_debug(self.parent, "paths sin abs vale: %s", paths_existe)
+
+            missing = []
+            if paths_existe:
+                tracing.count("fs_call_sites", len(frames))
+                missing = _missing_frames(render_template, fields, frames)
+                if missing:
+                    self.parent.log_warning("%s/%s is missing %d of its %d frames (%s...), render them "
+                                            "before publishing it" % (camera, layer, len(missing), len(frames),
+                                                                      ", ".join(str(f) for f in missing[:5])))
+
+            # if there's a match, add an item to the render
+            if paths_existe and not missing:
+                tracing.count("fs_call_sites")
+                paths = engine.tank.abstract_paths_from_template(
+                    render_template, fields)
+                tracing.log_debug(self.parent, "paths vale: %s", paths)
+
+                item = {
+                    "type": "rendered_image",
+                    # Este es el nombre que aparece en dialogo "Publish"
+                    # Y una vez publicado aparece en el campo "Name"
+                    # "name": layer,
+                    # "name": os.path.splitext(name)[], ESTO DA ERROR
+                    # 'name': name.split('.')[0], ESTO DA ERROR
+                    "name": 'cam'+ camera[0].upper() + camera[1:] + '_' + layer,
+                    # since we already know the path, pass it along for
+                    # publish hook to use
+                    "other_params": {
+                        # one abstract path per sequence, the publish hook
+                        # registers each of them. 'path' is kept for
+                        # anything still expecting a single path.
+                        'path': paths[0],
+                        'paths': paths,
                     }
-                    self.parent.log_debug("fields vale: %s" % fields)
-                    # match existing paths against the render template
-                    # Comprobar que existen los frames
-                    paths_existe = engine.tank.paths_from_template(
-                        render_template, fields)
-                    self.parent.log_debug("paths sin abs vale: %s" % paths_existe)
-
-                    paths = engine.tank.abstract_paths_from_template(
-                        render_template, fields)
-                    self.parent.log_debug("paths vale: %s" % paths)
-                    # if there's a match, add an item to the render
-
-                    if paths_existe:
-                        items.append({
-                            "type": "rendered_image",
-                            # Este es el nombre que aparece en dialogo "Publish"
-                            # Y una vez publicado aparece en el campo "Name"
-                            # "name": layer,
-                            # "name": os.path.splitext(name)[], ESTO DA ERROR
-                            # 'name': name.split('.')[0], ESTO DA ERROR
-                            "name": 'cam'+ camera[0].upper() + camera[1:] + '_' + layer,
-                            # since we already know the path, pass it along for
-                            # publish hook to use
-                            "other_params": {
-                                # just adding first path here. may want to do some
-                                # additional validation if there are multiple.
-                                'path': paths[0],
-                            }
-                        })
-        self.parent.log_debug("items vale: %s" % items)
-        return items
+                }
+
+        if render_folder:
+            journal.render_cache[cache_key] = (render_folder_mtime, item)
+        return item
+
+
+def _missing_frames(render_template, fields, frames):
+    """
+    :returns: The frames of a camera/layer that aren't on disk
+    """
+    frame_path = _frame_path_function(render_template, fields)
+    return [frame for frame in frames if not os.path.exists(frame_path(frame))]
+
+
+def _frame_path_function(render_template, fields):
+    """
+    :returns: A function giving the path of a frame of the camera/layer the
+              fields are for
+    """
+    def frame_path(frame):
+        return render_template.apply_fields(dict(fields, SEQ=frame))
+    return frame_path
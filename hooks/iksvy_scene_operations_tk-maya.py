@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+import os
+import re
+import sys
+import maya.cmds as cmds
+
+from tank import Hook
+
+# shared code for the iksvy hooks lives next to them
+_HOOKS_DIR = os.path.dirname(os.path.abspath(__file__))
+if _HOOKS_DIR not in sys.path:
+    sys.path.append(_HOOKS_DIR)
+from iksvy_lib import breakdown
+from iksvy_lib import tracing
+
+
+class BreakdownSceneOperations(Hook):
+    """
+    Breakdown operations for Maya: the references, Alembic caches and file
+    textures are collected in a single pass, and only the ones pointing at a
+    versioned publish, found with templates matched once per folder, are
+    handed to the app to resolve.
+    """
+
+    def scan_scene(self):
+        """
+        The scan scene method is executed once at startup and its purpose is
+        to analyze the current scene and return a list of references that are
+        to be potentially operated on.
+
+        The return data structure is a list of dictionaries. Each scene reference
+        that is returned should be represented by a dictionary with three keys:
+
+        - "node": The name of the 'node' that is to be operated on. Most DCCs have
+          a concept of a node, path or some other way to address a particular
+          object in the scene.
+        - "type": The object type that this is. This is later passed to the
+          update method so that it knows how to handle the object.
+        - "path": Path on disk to the referenced object.
+
+        Only references to a versioned publish are returned.
+        """
+        with tracing.span("breakdown.scan"):
+            refs = []
+
+            # references, one query per reference node
+            for ref_node in cmds.ls(type="reference"):
+                try:
+                    maya_path = cmds.referenceQuery(ref_node, filename=True, withoutCopyNumber=True)
+                except RuntimeError:
+                    # sharedReferenceNode and references without a file
+                    continue
+                refs.append({"node": ref_node, "type": "reference",
+                             "path": maya_path.replace("/", os.path.sep)})
+
+            # Alembic caches brought in with import rather than reference
+            for abc_node in cmds.ls(type="AlembicNode") or []:
+                path = cmds.getAttr("%s.abc_File" % abc_node)
+                if path:
+                    refs.append({"node": abc_node, "type": "alembic",
+                                 "path": path.replace("/", os.path.sep)})
+
+            for file_node in cmds.ls(long=True, type="file"):
+                path = cmds.getAttr("%s.fileTextureName" % file_node)
+                if path:
+                    refs.append({"node": file_node, "type": "file",
+                                 "path": path.replace("/", os.path.sep)})
+
+        with tracing.span("breakdown.filter", references=len(refs)):
+            items = breakdown.breakdown_items(self.parent.sgtk, refs)
+
+        tracing.log_debug(self.parent, "Breakdown: %d of %d references are publishes", len(items), len(refs))
+        return items
+
+    def update(self, items):
+        """
+        Perform replacements given a number of scene items passed from the app.
+
+        Once a selection has been performed in the main UI and the user clicks
+        the update button, this method is called.
+
+        The items parameter is a list of dictionaries on the same form as was
+        generated by the scan_scene hook above. The path key now holds
+        the that each node should be updated *to* rather than the current path.
+        """
+        engine = self.parent.engine
+
+        # reload everything before the viewport redraws
+        cmds.refresh(suspend=True)
+        try:
+            for i in items:
+                node = i["node"]
+                node_type = i["type"]
+                new_path = i["path"].replace(os.path.sep, "/")
+
+                if node_type == "reference":
+                    engine.log_debug("Maya Reference %s: Updating to version %s" % (node, new_path))
+                    cmds.file(new_path, loadReference=node)
+
+                elif node_type == "alembic":
+                    engine.log_debug("Alembic node %s: Updating to version %s" % (node, new_path))
+                    cmds.setAttr("%s.abc_File" % node, new_path, type="string")
+
+                elif node_type == "file":
+                    # replace the file texture path, keeping its <UDIM> tag if any
+                    engine.log_debug("File Texture %s: Updating to version %s" % (node, new_path))
+                    file_name = cmds.getAttr("%s.fileTextureName" % node)
+                    if re.search("<UDIM>", file_name or ""):
+                        new_path = re.sub(r"\.\d{4}\.", ".<UDIM>.", new_path)
+                    cmds.setAttr("%s.fileTextureName" % node, new_path, type="string")
+        finally:
+            cmds.refresh(suspend=False)
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+import os
+import sys
+import nuke
+
+from tank import Hook
+
+# shared code for the iksvy hooks lives next to them
+_HOOKS_DIR = os.path.dirname(os.path.abspath(__file__))
+if _HOOKS_DIR not in sys.path:
+    sys.path.append(_HOOKS_DIR)
+from iksvy_lib import breakdown
+from iksvy_lib import tracing
+
+# nodes whose file knob points at a publish
+_FILE_NODE_CLASSES = ("Read", "ReadGeo2", "Camera2")
+
+
+class BreakdownSceneOperations(Hook):
+    """
+    Breakdown operations for Nuke: only the Read, ReadGeo and Camera nodes
+    reading a versioned publish, found with templates matched once per
+    folder, are handed to the app to resolve.
+    """
+
+    def scan_scene(self):
+        """
+        The scan scene method is executed once at startup and its purpose is
+        to analyze the current scene and return a list of references that are
+        to be potentially operated on.
+
+        The return data structure is a list of dictionaries. Each scene reference
+        that is returned should be represented by a dictionary with three keys:
+
+        - "node": The name of the 'node' that is to be operated on. Most DCCs have
+          a concept of a node, path or some other way to address a particular
+          object in the scene.
+        - "type": The object type that this is. This is later passed to the
+          update method so that it knows how to handle the object.
+        - "path": Path on disk to the referenced object.
+
+        Only references to a versioned publish are returned.
+        """
+        with tracing.span("breakdown.scan"):
+            refs = []
+            for node in nuke.allNodes(recurseGroups=True):
+                if node.Class() not in _FILE_NODE_CLASSES:
+                    continue
+                if node.Class() == "Camera2" and not node["read_from_file"].value():
+                    continue
+                # the knob value, not evaluate(): keeps the %04d of sequences
+                path = node["file"].value()
+                if not path:
+                    continue
+                refs.append({"node": node.fullName(), "type": node.Class(),
+                             "path": path.replace("/", os.path.sep)})
+
+        with tracing.span("breakdown.filter", references=len(refs)):
+            items = breakdown.breakdown_items(self.parent.sgtk, refs)
+
+        tracing.log_debug(self.parent, "Breakdown: %d of %d nodes read publishes", len(items), len(refs))
+        return items
+
+    def update(self, items):
+        """
+        Perform replacements given a number of scene items passed from the app.
+
+        Once a selection has been performed in the main UI and the user clicks
+        the update button, this method is called.
+
+        The items parameter is a list of dictionaries on the same form as was
+        generated by the scan_scene hook above. The path key now holds
+        the that each node should be updated *to* rather than the current path.
+        """
+        engine = self.parent.engine
+
+        for i in items:
+            node = nuke.toNode(i["node"])
+            if node is None:
+                continue
+            new_path = i["path"].replace(os.path.sep, "/")
+            engine.log_debug("Node %s: Updating to version %s" % (i["node"], new_path))
+            node["file"].setValue(new_path)
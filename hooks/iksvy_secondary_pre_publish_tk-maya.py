@@ -10,6 +10,7 @@
 # not expressly granted therein are reserved by Shotgun Software Inc.
 
 import os
+import sys
 import maya.cmds as cmds
 import maya.mel as mel
 
@@ -17,6 +18,12 @@ import tank
 from tank import Hook
 from tank import TankError
 
+# shared code for the iksvy hooks lives next to them
+_HOOKS_DIR = os.path.dirname(os.path.abspath(__file__))
+if _HOOKS_DIR not in sys.path:
+    sys.path.append(_HOOKS_DIR)
+from iksvy_lib import tracing
+
 class PrePublishHook(Hook):
     """
     Single hook that implements pre-publish functionality
@@ -88,18 +95,19 @@ class PrePublishHook(Hook):
             # report progress:
             progress_cb(0, "Validating", task)
 
-            # pre-publish ALEMBIC CACHE output
-            if output["name"] == "alembic_cache":
-                errors.extend(self.__validate_item_for_alembic_cache_publish(item))
-            # pre-publish RENDER output
-            elif output["name"] == "rendered_image":
-                errors.extend(self.__validate_item_for_rendered_image_publish(item))
-            # pre-publish CAMERA output
-            elif output["name"] == "camera":
-                errors.extend(self.__validate_item_for_camera(item))
-            else:
-                # don't know how to publish this output types!
-                errors.append("Don't know how to publish this item!")
+            with tracing.span("validate.%s" % output["name"], item=item["name"]):
+                # pre-publish ALEMBIC CACHE output
+                if output["name"] == "alembic_cache":
+                    errors.extend(self.__validate_item_for_alembic_cache_publish(item))
+                # pre-publish RENDER output
+                elif output["name"] == "rendered_image":
+                    errors.extend(self.__validate_item_for_rendered_image_publish(item))
+                # pre-publish CAMERA output
+                elif output["name"] == "camera":
+                    errors.extend(self.__validate_item_for_camera(item))
+                else:
+                    # don't know how to publish this output types!
+                    errors.append("Don't know how to publish this item!")
 
             # if there is anything to report then add to result
             if len(errors) > 0:
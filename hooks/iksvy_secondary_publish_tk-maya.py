@@ -11,7 +11,12 @@
 
 import os
 import re
+import sys
+import json
 import shutil
+import tempfile
+import functools
+import threading
 import maya.cmds as cmds
 import maya.mel as mel
 
@@ -19,10 +24,26 @@ import tank
 from tank import Hook
 from tank import TankError
 
+# shared code for the iksvy hooks lives next to them
+_HOOKS_DIR = os.path.dirname(os.path.abspath(__file__))
+if _HOOKS_DIR not in sys.path:
+    sys.path.append(_HOOKS_DIR)
+from iksvy_lib import copying
+from iksvy_lib import fingerprints
+from iksvy_lib import migration
+from iksvy_lib import sequences
+from iksvy_lib import thumbnails
+from iksvy_lib import tracing
+
 class PublishHook(Hook):
     """
     Single hook that implements publish functionality for secondary tasks
     """
+
+    # move published renders from the scratch root to the primary root in
+    # the background
+    migrate_renders = True
+
     def execute(
         self, tasks, work_template, comment, thumbnail_path, sg_task, primary_task,
         primary_publish_path, progress_cb, user_data, **kwargs):
@@ -100,6 +121,10 @@ class PublishHook(Hook):
         """
         results = []
 
+        # mesh groups whose caches would be written to the same file
+        clashes = _alembic_name_clashes(
+            [task["item"]["name"] for task in tasks if task["output"]["name"] == "alembic_cache"])
+
         # publish all tasks:
         for task in tasks:
             item = task["item"]
@@ -110,36 +135,42 @@ class PublishHook(Hook):
             progress_cb(0, "Publishing", task)
 
             # publish alembic_cache output
-            if output["name"] == "alembic_cache":
+            if output["name"] == "alembic_cache" and item["name"] in clashes:
+                errors.append("Alembic publish failed - %s and %s would be published with the same "
+                              "name, rename one of them" % (item["name"], clashes[item["name"]]))
+            elif output["name"] == "alembic_cache":
                 try:
-                   self.__publish_alembic_cache(
-                        item,
-                        output,
-                        work_template,
-                        primary_publish_path,
-                        sg_task,
-                        comment,
-                        thumbnail_path,
-                        progress_cb,
-                    )
+                   with tracing.span("publish.alembic_cache", item=item["name"]):
+                       self.__publish_alembic_cache(
+                            item,
+                            output,
+                            work_template,
+                            primary_publish_path,
+                            sg_task,
+                            comment,
+                            thumbnail_path,
+                            progress_cb,
+                        )
                 except Exception, e:
                    errors.append("Alembic publish failed - %s" % e)
 
             # Para publicar CAMARA
             elif output["name"] == "camera":
                          try:
-                             self.__publish_camera(item, output, work_template,
-                                                   primary_publish_path, sg_task, comment,
-                                                   thumbnail_path, progress_cb)
+                             with tracing.span("publish.camera", item=item["name"]):
+                                 self.__publish_camera(item, output, work_template,
+                                                       primary_publish_path, sg_task, comment,
+                                                       thumbnail_path, progress_cb)
                          except Exception, e:
                              errors.append("Camera publish failed - %s" % e)
 
             # Para publicar RENDER
             elif output["name"] == "rendered_image":
                 try:
-                   self.__publish_rendered_images(item, output,
-                       work_template, primary_publish_path, sg_task, comment,
-                       thumbnail_path, progress_cb)
+                   with tracing.span("publish.rendered_image", item=item["name"]):
+                       self.__publish_rendered_images(item, output,
+                           work_template, primary_publish_path, sg_task, comment,
+                           thumbnail_path, progress_cb)
                 except Exception, e:
                    errors.append("Render files publish failed - %s" % e)
 
@@ -154,8 +185,59 @@ class PublishHook(Hook):
 
             progress_cb(100)
 
+        # this is the last of our hooks to run in a publish, so write out
+        # the trace of the whole session (a no-op when tracing is off):
+        trace_path = tracing.flush("publish")
+        if trace_path:
+            self.parent.log_debug("Publish trace written to %s" % trace_path)
+
         return results
 
+    def _ensure_publish_folder(self, publish_path):
+        """
+        Make sure the folder the publish is written to exists.
+
+        :param publish_path: The path of the file about to be published
+        """
+        with tracing.span("folders", path=publish_path):
+            tracing.count("fs_call_sites")
+            self.parent.ensure_folder_exists(os.path.dirname(publish_path))
+
+    def _register_publish(self, args):
+        """
+        Register a publish in Shotgun.
+
+        :param args: The arguments for tank.util.register_publish
+        :returns:    The PublishedFile entity created
+        """
+        with tracing.span("register_publish", path=args["path"]):
+            # a single call here, toolkit may need more than one round trip
+            tracing.count("shotgun_call_sites")
+            return tank.util.register_publish(**args)
+
+    def _cached_thumbnail(self, source_path, salt=""):
+        """
+        Look for a thumbnail already made from the same source.
+
+        :returns: (store key, thumbnail path or None)
+        """
+        key = thumbnails.source_key(source_path, salt)
+        return key, thumbnails.get_service().store.get(key)
+
+    def _queue_thumbnail(self, entity, source_path, key, resize=True, remove_source=False):
+        """
+        Have the thumbnail service make the thumbnail of a publish and upload
+        it once ready, replacing the scene screenshot it was registered with.
+        A remove_source image is deleted once the service is done with it.
+        """
+        if not entity:
+            if remove_source:
+                os.remove(source_path)
+            return
+        thumbnails.get_service().submit(
+            entity, source_path, _upload_thumbnail, key, resize, self.parent.log_warning,
+            remove_source)
+
     def __publish_camera(self, item, output, work_template,
             primary_publish_path, sg_task, comment, thumbnail_path, progress_cb):
             """
@@ -195,8 +277,7 @@ class PublishHook(Hook):
             publish_path = publish_template.apply_fields(fields)
 
             # ensure the publish folder exists:
-            publish_folder = os.path.dirname(publish_path)
-            self.parent.ensure_folder_exists(publish_folder)
+            self._ensure_publish_folder(publish_path)
 
             # determine the publish name
             # el campo "Name" de Published Files
@@ -217,8 +298,18 @@ class PublishHook(Hook):
 
             # escribe un fichero .fbx en la ruta de publicacion con definiciones de camara
             progress_cb(25, "Exporting the camera")
-            cmds.file(publish_path, type='FBX export', exportSelected=True,
-                options="v=0", prompt=False, force=True)
+            with tracing.span("export", path=publish_path):
+                cmds.file(publish_path, type='FBX export', exportSelected=True,
+                    options="v=0", prompt=False, force=True)
+
+            # the thumbnail is a playblast of the middle frame, made from the
+            # scene file: use the stored one if this scene was published before.
+            # The source key only samples the ends of the file, so a save that
+            # changes the middle of the scene only shows in the mtime.
+            start_frame, end_frame = self._find_scene_animation_range()
+            thumbnail_frame = (start_frame + end_frame) // 2
+            thumbnail_key, cached_thumbnail = self._cached_thumbnail(
+                scene_path, "playblast:%s:%d:%d" % (cam_name, thumbnail_frame, os.path.getmtime(scene_path)))
 
             # register the publish:
             progress_cb(75, "Registering the Camera publish")
@@ -229,12 +320,50 @@ class PublishHook(Hook):
                 "path": publish_path,
                 "name": publish_name,
                 "version_number": publish_version,
-                "thumbnail_path": thumbnail_path,
+                "thumbnail_path": cached_thumbnail or thumbnail_path,
                 "task": sg_task,
                 "dependency_paths": [primary_publish_path],
                 "published_file_type":tank_type
             }
-            tank.util.register_publish(**args)
+            entity = self._register_publish(args)
+
+            if not cached_thumbnail:
+                progress_cb(90, "Playblasting the Camera thumbnail")
+                try:
+                    playblast_path = self._playblast_camera_frame(cam_name, thumbnail_frame)
+                    self._queue_thumbnail(entity, playblast_path, thumbnail_key, resize=False,
+                                          remove_source=True)
+                except Exception, e:
+                    self.parent.log_warning("Could not playblast %s for its thumbnail: %s" % (cam_name, e))
+
+    def _playblast_camera_frame(self, camera, frame):
+        """
+        Playblast a frame of the scene through a camera, at thumbnail size.
+
+        :param camera: The camera to look through
+        :param frame:  The frame to playblast
+        :returns:      Path of the temporary image written
+        """
+        panel = cmds.getPanel(withFocus=True)
+        if cmds.getPanel(typeOf=panel) != "modelPanel":
+            panel = cmds.getPanel(type="modelPanel")[0]
+        previous_camera = cmds.modelPanel(panel, query=True, camera=True)
+
+        handle, image_path = tempfile.mkstemp(prefix="iksvy_playblast_", suffix=".jpg")
+        os.close(handle)
+        cmds.lookThru(panel, camera)
+        try:
+            with tracing.span("playblast", camera=camera):
+                cmds.playblast(frame=[frame], format="image", compression="jpg", viewer=False,
+                               offScreen=True, showOrnaments=False, percent=100, quality=85,
+                               widthHeight=(thumbnails.THUMBNAIL_WIDTH, thumbnails.THUMBNAIL_WIDTH * 9 // 16),
+                               completeFilename=image_path, forceOverwrite=True)
+        except Exception:
+            os.remove(image_path)
+            raise
+        finally:
+            cmds.lookThru(panel, previous_camera)
+        return image_path
 
     def __publish_alembic_cache(self, item, output, work_template, primary_publish_path,
                                             sg_task, comment, thumbnail_path, progress_cb):
@@ -261,19 +390,24 @@ class PublishHook(Hook):
             publish_version = fields["version"]
             tank_type = output["tank_type"]
 
+            # one cache per mesh group, named after the group
+            group = item["name"]
+            fields["grp_name"] = _alembic_group_name(group)
+
             # create the publish path by applying the fields
             # with the publish template:
             publish_template = output["publish_template"]
             publish_path = publish_template.apply_fields(fields)
 
             # ensure the publish folder exists:
-            publish_folder = os.path.dirname(publish_path)
-            self.parent.ensure_folder_exists(publish_folder)
+            self._ensure_publish_folder(publish_path)
 
             # determine the publish name:
             publish_name = fields.get("name")
             if not publish_name:
                 publish_name = os.path.basename(publish_path)
+            else:
+                publish_name = "%s_%s" % (publish_name, fields["grp_name"])
 
             # Find additional info from the scene:
             #
@@ -292,21 +426,44 @@ class PublishHook(Hook):
             if start_frame and end_frame:
                 alembic_args.append("-fr %d %d" % (start_frame, end_frame))
 
-            # Set the output path:
-            # Note: The AbcExport command expects forward slashes!
-            alembic_args.append("-file %s" % publish_path.replace("\\", "/"))
+            # only this group:
+            alembic_args.append("-root %s" % group)
+
+            # if nothing the group's geometry depends on changed since the
+            # previous version, that version's cache is reused instead of
+            # baking the same one again:
+            progress_cb(20, "Fingerprinting %s" % group)
+            fingerprint = self._fingerprint_mesh_group(group, start_frame, alembic_args)
+            previous_path = self._find_previous_version(publish_template, fields)
+            if (fingerprint and previous_path and
+                    fingerprints.read_fingerprint(previous_path) == fingerprint):
+                progress_cb(30, "Reusing the Alembic cache of %s" % os.path.basename(previous_path))
+                with tracing.span("reuse", path=publish_path):
+                    method = copying.publish_file(previous_path, publish_path)
+                self.parent.log_debug("%s is unchanged since %s, linked it with a %s" % (
+                    group, previous_path, method))
+            else:
+                previous_path = None
 
-            # build the export command.  Note, use AbcExport -help in Maya for
-            # more detailed Alembic export help
-            abc_export_cmd = ("AbcExport -j \"%s\"" % " ".join(alembic_args))
+                # Set the output path:
+                # Note: The AbcExport command expects forward slashes!
+                alembic_args.append("-file %s" % publish_path.replace("\\", "/"))
 
-            # ...and execute it:
-            progress_cb(30, "Exporting Alembic cache")
-            try:
-                self.parent.log_debug("Executing command: %s" % abc_export_cmd)
-                mel.eval(abc_export_cmd)
-            except Exception, e:
-                raise TankError("Failed to export Alembic Cache: %s" % e)
+                # build the export command.  Note, use AbcExport -help in Maya for
+                # more detailed Alembic export help
+                abc_export_cmd = ("AbcExport -j \"%s\"" % " ".join(alembic_args))
+
+                # ...and execute it:
+                progress_cb(30, "Exporting Alembic cache")
+                try:
+                    self.parent.log_debug("Executing command: %s" % abc_export_cmd)
+                    with tracing.span("export", path=publish_path):
+                        mel.eval(abc_export_cmd)
+                except Exception, e:
+                    raise TankError("Failed to export Alembic Cache: %s" % e)
+
+            if fingerprint:
+                fingerprints.write_fingerprint(publish_path, fingerprint, previous_path)
 
             # register the publish:
             progress_cb(75, "Registering the Alembic publish")
@@ -322,7 +479,33 @@ class PublishHook(Hook):
                 "dependency_paths": [primary_publish_path],
                 "published_file_type":tank_type
             }
-            tank.util.register_publish(**args)
+            self._register_publish(args)
+
+    def _fingerprint_mesh_group(self, group, start_frame, alembic_args):
+        """
+        :returns: The fingerprint of a mesh group, or None if it can't be
+                  fingerprinted and has to be exported
+        """
+        with tracing.span("fingerprint", group=group):
+            try:
+                return fingerprints.mesh_group_fingerprint(group, start_frame, alembic_args)
+            except Exception, e:
+                self.parent.log_warning("Could not fingerprint %s, exporting it: %s" % (group, e))
+                return None
+
+    def _find_previous_version(self, publish_template, fields):
+        """
+        :returns: The path of the highest version published before this one
+                  with the same fields, or None
+        """
+        previous = None
+        previous_version = None
+        for path in self.parent.sgtk.paths_from_template(publish_template, fields, ["version"]):
+            version = publish_template.get_fields(path).get("version")
+            if version < fields["version"] and (previous_version is None or version > previous_version):
+                previous, previous_version = path, version
+        tracing.count("fs_call_sites")
+        return previous
 
     def _find_scene_animation_range(self):
             """
@@ -373,26 +556,200 @@ class PublishHook(Hook):
             # this is pretty straight forward since the publish file(s) have
             # already been created (rendered). We're really just populating the
             # arguments to send to the sg publish file registration below.
-            publish_name = item["name"]
 
-            # we already determined the path in the scan_scene code. so just
-            # pull it from that dictionary.
+            # we already determined the paths in the scan_scene code. so just
+            # pull them from that dictionary. There is one abstract path per
+            # sequence found for the item:
             other_params = item["other_params"]
-            publish_path = other_params["path"]
+            publish_paths = other_params.get("paths") or [other_params["path"]]
+            publish_template = output["publish_template"]
+
+            for publish_path in publish_paths:
+                publish_name = item["name"]
+                if len(publish_paths) > 1:
+                    publish_name = "%s_%s" % (publish_name, self._sequence_suffix(
+                        publish_template, publish_path, publish_paths))
+
+                # look at every frame once, now, so the loader and Nuke can
+                # use the stored description instead of scanning the disk:
+                progress_cb(20, "Inspecting the rendered frames")
+                with tracing.span("inspect_frames", path=publish_path):
+                    frame_paths = self._find_frame_paths(publish_template, publish_path)
+                    sequence_info = self._describe_render_sequence(publish_path, frame_paths)
+
+                # the middle frame makes the thumbnail, it is ready already if
+                # the same frame was published before:
+                middle_frame_path = cached_thumbnail = thumbnail_key = None
+                if frame_paths:
+                    frames = sorted(frame_paths)
+                    middle_frame_path = frame_paths[frames[len(frames) // 2]]
+                    thumbnail_key, cached_thumbnail = self._cached_thumbnail(middle_frame_path)
+
+                sg_fields = {}
+                if sequence_info:
+                    self.parent.log_debug("Render sequence %s: frames %s-%s, missing '%s', %d bytes" % (
+                        publish_path, sequence_info["first_frame"], sequence_info["last_frame"],
+                        sequence_info["missing_frames"], sequence_info["total_bytes"]))
+                    # sites without the field still publish, with no range stored
+                    if sequences.has_sequence_info_field(self.parent.shotgun):
+                        sg_fields[sequences.SEQUENCE_INFO_FIELD] = json.dumps(sequence_info, sort_keys=True)
+
+                # register the publish:
+                progress_cb(75, "Registering the Render publish")
+                args = {
+                    "tk": self.parent.tank,
+                    "context": self.parent.context,
+                    "comment": comment,
+                    "path": publish_path,
+                    "name": publish_name,
+                    "version_number": publish_version,
+                    "thumbnail_path": cached_thumbnail or thumbnail_path,
+                    "task": sg_task,
+                    "dependency_paths": [primary_publish_path],
+                    "published_file_type": tank_type,
+                    "sg_fields": sg_fields,
+                }
+
+                entity = self._register_publish(args)
+                if middle_frame_path and not cached_thumbnail:
+                    self._queue_thumbnail(entity, middle_frame_path, thumbnail_key)
+                if entity and frame_paths and self.migrate_renders:
+                    self._queue_migration(entity, publish_path, frame_paths, sequence_info)
+
+    def _queue_migration(self, entity, publish_path, frame_paths, sequence_info):
+        """
+        Have the migration service move the frames of a render publish from
+        the scratch root to the primary root, and point the publish at them.
+        Renders already on the primary root are left alone.
+        """
+        roots = self.parent.sgtk.roots
+        project_disk_name = self.parent.sgtk.pipeline_configuration.get_project_disk_name()
+        update = functools.partial(_point_publish_at, roots, project_disk_name, sequence_info)
+        queued = migration.get_service().submit(
+            entity, publish_path, [frame_paths[f] for f in sorted(frame_paths)], roots, update,
+            sequence_info.get("manifest_path") if sequence_info else None,
+            self.parent.log_warning)
+        if queued:
+            self.parent.log_debug("Queued the migration of %s to the primary root" % publish_path)
+
+    def _find_frame_paths(self, publish_template, publish_path):
+        """
+        :param publish_template: The template the frames were rendered with
+        :param publish_path:     The abstract (%04d) path of the sequence
+        :returns:                Dictionary of frame number -> path of the
+                                 frames on disk
+        """
+        fields = publish_template.get_fields(publish_path)
+        frame_paths = {}
+        for path in self.parent.sgtk.paths_from_template(publish_template, fields, ["SEQ"]):
+            frame = publish_template.get_fields(path).get("SEQ")
+            if frame is not None:
+                frame_paths[frame] = path
+        tracing.count("fs_call_sites", len(frame_paths) + 1)
+        return frame_paths
+
+    def _describe_render_sequence(self, publish_path, frame_paths):
+        """
+        Describe the frames of a rendered sequence and write its checksum
+        manifest next to them.
+
+        :param publish_path: The abstract (%04d) path of the sequence
+        :param frame_paths:  Dictionary of frame number -> frame path
+        :returns:            The description to store on the PublishedFile,
+                             without the per frame manifest, or None if no
+                             frames were found
+        """
+        info = sequences.describe_sequence(frame_paths)
+        if not info:
+            return None
+
+        manifest_path = sequences.manifest_path_for(publish_path)
+        sequences.write_manifest(manifest_path, info)
+
+        info = dict(info)
+        del info["manifest"]
+        info["manifest_path"] = manifest_path
+        return info
+
+    def _sequence_suffix(self, publish_template, publish_path, publish_paths):
+        """
+        Build a name suffix telling a sequence apart from the other sequences
+        of the same item, from the template fields they don't share (e.g. the
+        eye of a stereo render).
+        """
+        all_fields = [publish_template.get_fields(path) for path in publish_paths]
+        fields = publish_template.get_fields(publish_path)
+        differing = [key for key in sorted(fields)
+                     if any(other.get(key) != fields[key] for other in all_fields)]
+        return "_".join(str(fields[key]) for key in differing)
+
+
+def _alembic_group_name(group):
+    """
+    :returns: The name of a mesh group for the {grp_name} of its Alembic
+              cache, e.g. charA-geogrp for |charA:geo_grp. Namespaces are
+              kept, joined with '-', so the same group in two references
+              gets two caches. Underscores go, they separate template keys.
+    """
+    parts = group.split("|")[-1].split(":")
+    return "-".join(re.sub(r'[\W_]+', '', part) for part in parts if part)
+
+
+def _alembic_name_clashes(groups):
+    """
+    :param groups: The mesh groups published in one go
+    :returns:      Dictionary with the groups that share their name with
+                   another one, group -> the other group
+    """
+    clashes = {}
+    seen = {}
+    for group in groups:
+        name = _alembic_group_name(group)
+        if name in seen and seen[name] != group:
+            clashes[group] = seen[name]
+            clashes[seen[name]] = group
+        else:
+            seen[name] = group
+    return clashes
+
+
+# the Shotgun connections of the service workers. The API isn't thread safe
+# and the publish keeps using the toolkit one, so each worker gets its own
+_worker_connections = threading.local()
+
+
+def _worker_shotgun():
+    # never the engine's connection: if this one can't be made the upload or
+    # update fails, and the service logs it
+    connection = getattr(_worker_connections, "shotgun", None)
+    if connection is None:
+        connection = tank.util.shotgun.create_sg_connection()
+        _worker_connections.shotgun = connection
+    return connection
+
+
+def _upload_thumbnail(entity, thumbnail_path):
+    """
+    Upload a thumbnail to a PublishedFile, from the thumbnail service worker.
+    """
+    _worker_shotgun().upload_thumbnail(entity["type"], entity["id"], thumbnail_path)
 
-            # register the publish:
-            progress_cb(75, "Registering the Render publish")
-            args = {
-                "tk": self.parent.tank,
-                "context": self.parent.context,
-                "comment": comment,
-                "path": publish_path,
-                "name": publish_name,
-                "version_number": publish_version,
-                "thumbnail_path": thumbnail_path,
-                "task": sg_task,
-                "dependency_paths": [primary_publish_path],
-                "published_file_type": tank_type
-            }
 
-            tank.util.register_publish(**args)
+def _point_publish_at(roots, project_disk_name, sequence_info, entity, sequence_path, manifest_path):
+    """
+    Point a PublishedFile at its frames on the primary root, from the
+    migration service worker once they are all there.
+    """
+    sg = _worker_shotgun()
+    primary_root = os.path.normpath(roots[migration.PRIMARY_ROOT])
+    # relative to the storage, project folder included, as core writes it
+    project_path = sequence_path[len(primary_root) + 1:].replace(os.path.sep, "/")
+    data = {
+        "path": {"local_path": sequence_path},
+        "path_cache": "%s/%s" % (project_disk_name, project_path),
+        "path_cache_storage": sg.find_one("LocalStorage", [["code", "is", migration.PRIMARY_ROOT]]),
+    }
+    if sequence_info and manifest_path and sequences.has_sequence_info_field(sg):
+        sequence_info = dict(sequence_info, manifest_path=manifest_path)
+        data[sequences.SEQUENCE_INFO_FIELD] = json.dumps(sequence_info, sort_keys=True)
+    sg.update(entity["type"], entity["id"], data)
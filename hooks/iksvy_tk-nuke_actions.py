@@ -14,6 +14,15 @@ Hook that loads defines all the available actions, broken down by publish type.
 """
 import sgtk
 import os
+import sys
+import json
+
+# shared code for the iksvy hooks lives next to them
+_HOOKS_DIR = os.path.dirname(os.path.abspath(__file__))
+if _HOOKS_DIR not in sys.path:
+    sys.path.append(_HOOKS_DIR)
+from iksvy_lib import context_cache
+from iksvy_lib import sequences
 
 HookBaseClass = sgtk.get_hook_baseclass()
 
@@ -161,8 +170,11 @@ class NukeActions(HookBaseClass):
         if ext.lower() not in valid_extensions:
             raise Exception("Unsupported file extension for '%s'!" % path)
 
-        # find the sequence range if it has one:
-        seq_range = self._find_sequence_range(path)
+        # find the sequence range if it has one. Render publishes store it
+        # so the disk only has to be scanned for older publishes:
+        seq_range = self._sequence_range_from_publish(sg_publish_data)
+        if not seq_range:
+            seq_range = self._find_sequence_range(path)
 
         # create the read node
         if seq_range:
@@ -184,6 +196,31 @@ class NukeActions(HookBaseClass):
 
         nuke.nodes.Camera2(file=path)
 
+    def _sequence_range_from_publish(self, sg_publish_data):
+        """
+        Get the frame range stored on a render publish at publish time.
+
+        :param sg_publish_data: Shotgun data dictionary with all the standard publish fields.
+        :returns: None if the publish doesn't carry a range, otherwise (min, max)
+        """
+        sequence_info = sg_publish_data.get(sequences.SEQUENCE_INFO_FIELD)
+        if (sequences.SEQUENCE_INFO_FIELD not in sg_publish_data and sg_publish_data.get("id") and
+                sequences.has_sequence_info_field(self.parent.shotgun)):
+            # the loader only asks Shotgun for the standard publish fields
+            sg_publish = self.parent.shotgun.find_one(
+                sg_publish_data.get("type") or "PublishedFile",
+                [["id", "is", sg_publish_data["id"]]], [sequences.SEQUENCE_INFO_FIELD])
+            sequence_info = (sg_publish or {}).get(sequences.SEQUENCE_INFO_FIELD)
+        if not sequence_info:
+            return None
+        try:
+            sequence_info = json.loads(sequence_info)
+            return (sequence_info["first_frame"], sequence_info["last_frame"])
+        except (ValueError, KeyError, TypeError):
+            self.parent.log_warning("Invalid %s on publish %s" % (
+                sequences.SEQUENCE_INFO_FIELD, sg_publish_data.get("id")))
+            return None
+
     def _find_sequence_range(self, path):
         """
         Helper method attempting to extract sequence information.
@@ -195,10 +232,11 @@ class NukeActions(HookBaseClass):
         :param path: Path to file on disk.
         :returns: None if no range could be determined, otherwise (min, max)
         """
-        # find a template that matches the path:
+        # find a template that matches the path, loading many files of the
+        # same folder only matches the templates once:
         template = None
         try:
-            template = self.parent.sgtk.template_from_path(path)
+            template = context_cache.get_cache(self.parent.sgtk).template_from_path(path)
         except TankError:
             pass
 